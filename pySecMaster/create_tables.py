@@ -32,6 +32,10 @@ __version__ = '1.5.0'
 #   fundamentals    (company, energy, economic)
 #   futures_prices
 
+# Increase this whenever a table or index is added or changed, so that the
+#   table creation functions are run again by the next maintenance run
+schema_version = 5
+
 
 def create_database(admin_user='postgres', admin_password='postgres',
                     database='pysecmaster', user='postgres'):
@@ -278,16 +282,17 @@ def main_tables(database='pysecmaster', user='pysecmaster',
             cur.close()
 
             print('All tables in MainTables are created')
+            return True
 
     except psycopg2.Error as e:
         conn.rollback()
         print('Failed to create the main tables in the database')
         print(e)
-        return
+        return False
     except conn.OperationalError:
         print('Unable to connect to the SQL Database in main_tables. Make '
               'sure the database address/name are correct.')
-        return
+        return False
     except Exception as e:
         print(e)
         raise SystemError('Error: An unknown issue occurred in main_tables')
@@ -489,6 +494,63 @@ def data_tables(database='pysecmaster', user='pysecmaster',
                     ON tick_prices_stream(source, source_id,
                     date DESC NULLS LAST, field)""")
 
+            def work_queue(c):
+                c.execute("""CREATE TABLE IF NOT EXISTS work_queue
+                (data_vendor_id SMALLINT                    NOT NULL,
+                source          TEXT                        NOT NULL,
+                source_id       TEXT                        NOT NULL,
+                price_table     TEXT                        NOT NULL,
+                priority        DOUBLE PRECISION            NOT NULL,
+                staleness       DOUBLE PRECISION,
+                liquidity       DOUBLE PRECISION,
+                lease_owner     TEXT,
+                lease_expires   TIMESTAMP WITH TIME ZONE,
+                attempts        INTEGER                     DEFAULT 0,
+                created_date    TIMESTAMP WITH TIME ZONE,
+                updated_date    TIMESTAMP WITH TIME ZONE,
+                PRIMARY KEY(data_vendor_id, source, source_id, price_table),
+                FOREIGN KEY(data_vendor_id)
+                    REFERENCES data_vendor(data_vendor_id))""")
+                # The lease columns were added after the table (schema 2)
+                c.execute("""ALTER TABLE work_queue
+                    ADD COLUMN IF NOT EXISTS lease_owner TEXT,
+                    ADD COLUMN IF NOT EXISTS lease_expires
+                        TIMESTAMP WITH TIME ZONE,
+                    ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0""")
+                # The queue is per vendor, so a vendor wide health couldn't
+                #   change the order of its items (schema 5)
+                c.execute("""ALTER TABLE work_queue
+                    DROP COLUMN IF EXISTS vendor_health""")
+                c.execute("""CREATE INDEX IF NOT EXISTS idx_wq_priority
+                    ON work_queue(data_vendor_id, price_table,
+                    priority DESC)""")
+                c.execute("""CREATE INDEX IF NOT EXISTS idx_wq_lease_owner
+                    ON work_queue(lease_owner)""")
+
+            def refresh_history(c):
+                c.execute("""CREATE TABLE IF NOT EXISTS refresh_history
+                (data_vendor_id     SMALLINT                    NOT NULL,
+                source              TEXT                        NOT NULL,
+                source_id           TEXT                        NOT NULL,
+                price_table         TEXT                        NOT NULL,
+                downloads           INTEGER                     DEFAULT 0,
+                changes             INTEGER                     DEFAULT 0,
+                unchanged_streak    INTEGER                     DEFAULT 0,
+                last_checked        TIMESTAMP WITH TIME ZONE,
+                last_changed        TIMESTAMP WITH TIME ZONE,
+                updated_date        TIMESTAMP WITH TIME ZONE,
+                PRIMARY KEY(data_vendor_id, source, source_id, price_table),
+                FOREIGN KEY(data_vendor_id)
+                    REFERENCES data_vendor(data_vendor_id))""")
+
+            def rate_limit_tokens(c):
+                c.execute("""CREATE TABLE IF NOT EXISTS rate_limit_tokens
+                (vendor         TEXT                        PRIMARY KEY,
+                window_start    TIMESTAMP WITH TIME ZONE    NOT NULL,
+                granted         INTEGER                     NOT NULL,
+                last_grant      INTEGER                     NOT NULL,
+                updated_date    TIMESTAMP WITH TIME ZONE)""")
+
             daily_prices(cur)
             finra_data(cur)
             fundamental_data(cur)
@@ -497,21 +559,25 @@ def data_tables(database='pysecmaster', user='pysecmaster',
             option_prices(cur)
             tick_prices(cur)
             tick_prices_stream(cur)
+            work_queue(cur)
+            refresh_history(cur)
+            rate_limit_tokens(cur)
 
             conn.commit()
             cur.close()
 
             print('All tables in data_tables are created')
+            return True
 
     except psycopg2.Error as e:
         conn.rollback()
         print('Failed to create the data tables in the database')
         print(e)
-        return
+        return False
     except conn.OperationalError:
         print('Unable to connect to the SQL Database in data_tables. Make '
               'sure the database address/name are correct.')
-        return
+        return False
     except Exception as e:
         print(e)
         raise SystemError('Error: An unknown issue occurred in data_tables')
@@ -651,21 +717,106 @@ def events_tables(database='pysecmaster', user='pysecmaster',
             cur.close()
 
             print('All tables in events_tables are in the database.')
+            return True
 
     except psycopg2.Error as e:
         conn.rollback()
         print('Failed to create the main events tables in the database')
         print(e)
-        return
+        return False
     except conn.OperationalError:
         print('Unable to connect to the SQL Database in events_tables. Make '
               'sure the database address/name are correct.')
-        return
+        return False
     except Exception as e:
         print(e)
         raise SystemError('Error: An unknown issue occurred in events_tables')
 
 
+def query_schema_version(database='pysecmaster', user='pysecmaster',
+                         password='pysecmaster', host='localhost', port=5432):
+    """ Query the schema version that the database's tables were created
+    with. This is a single row lookup, allowing the table creation to be
+    skipped when the tables are already up to date.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :return: Integer of the schema version, or None if the database or the
+        schema_version table doesn't exist yet
+    """
+
+    try:
+        conn = psycopg2.connect(database=database, user=user,
+                                password=password, host=host, port=port)
+    except psycopg2.OperationalError:
+        # The database hasn't been created yet
+        return None
+
+    version = None
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""SELECT to_regclass('schema_version')""")
+            if cur.fetchone()[0]:
+                cur.execute("""SELECT version FROM schema_version""")
+                row = cur.fetchone()
+                version = row[0] if row else None
+            cur.close()
+    except psycopg2.Error as e:
+        print('Unable to query the schema version of the %s database' %
+              database)
+        print(e)
+
+    conn.close()
+    return version
+
+
+def set_schema_version(database='pysecmaster', user='pysecmaster',
+                       password='pysecmaster', host='localhost', port=5432,
+                       version=schema_version):
+    """ Save the schema version once all of the tables have been created.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param version: Integer of the schema version the tables were created with
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""CREATE TABLE IF NOT EXISTS schema_version
+            (version        INTEGER                     NOT NULL,
+            updated_date    TIMESTAMP WITH TIME ZONE)""")
+            cur.execute("""DELETE FROM schema_version""")
+            cur.execute("""INSERT INTO schema_version (version, updated_date)
+                        VALUES (%s, NOW())""", (version,))
+            cur.close()
+
+            print('The %s database tables are at schema version %s' %
+                  (database, version))
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print('Failed to save the schema version of the %s database' %
+              database)
+        print(e)
+    except conn.OperationalError:
+        print('Unable to connect to the SQL Database in set_schema_version. '
+              'Make sure the database address/name are correct.')
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: An unknown issue occurred in '
+                          'set_schema_version')
+
+
 if __name__ == '__main__':
 
     create_database()
@@ -1,12 +1,16 @@
 from datetime import datetime, timedelta
+import json
 import operator
 import pandas as pd
+import psycopg2
+import select
+import threading
 import time
 
 from utilities.database_queries import delete_sql_table_rows, df_to_sql,\
-    query_all_active_tsids, query_all_tsid_prices, query_source_weights,\
-    query_data_vendor_id
-from utilities.multithread import multithread
+    price_change_channel, query_all_active_tsids, query_all_tsid_prices,\
+    query_source_weights, query_data_vendor_id
+from utilities.multithread import create_executor
 
 __author__ = 'Josh Schertz'
 __copyright__ = 'Copyright (C) 2018 Josh Schertz'
@@ -34,13 +38,27 @@ __version__ = '1.5.0'
 '''
 
 
+def validation_days(beg_date, end_date):
+    """ Widen a changed date range to the whole days it covers.
+
+    :param beg_date: ISO string of the first changed date
+    :param end_date: ISO string of the last changed date
+    :return: Tuple of the UTC Timestamps of the first day's start and of the
+        start of the day after the last day
+    """
+
+    return (pd.to_datetime(beg_date, utc=True).normalize(),
+            pd.to_datetime(end_date, utc=True).normalize() + timedelta(days=1))
+
+
 class CrossValidate:
     """ Compares the prices from multiple sources, storing the price with the
     highest consensus weight.
     """
 
     def __init__(self, database, user, password, host, port, table, tsid_list,
-                 period=None, verbose=False):
+                 period=None, verbose=False, date_ranges=None,
+                 backend='process'):
         """
         :param database: String of the database name
         :param user: String of the username used to login to the database
@@ -53,6 +71,12 @@ class CrossValidate:
             values should be cross validated. If None is provided, then the
             entire set of values will be validated.
         :param verbose: Boolean of whether to print debugging statements or not
+        :param date_ranges: Optional dictionary of each tsid's tuple of the
+            first and last changed ISO dates; only the days within the range
+            are cross validated for the tsid
+        :param backend: String of the executor backend that runs the tsids;
+            use thread when other threads are running, since forking the
+            process pool from a threaded process can deadlock
         """
 
         self.database = database
@@ -64,6 +88,8 @@ class CrossValidate:
         self.tsid_list = tsid_list
         self.period = period
         self.verbose = verbose
+        self.date_ranges = date_ranges or {}
+        self.backend = backend
 
         # Build a DataFrame with the source id and weight
         self.source_weights_df = query_source_weights(
@@ -101,14 +127,28 @@ class CrossValidate:
         #   sources and fields available.
         """No multiprocessing"""
         # [self.validator(tsid=tsid) for tsid in self.tsid_list]
-        """Multiprocessing using 4 threads"""
-        multithread(self.validator, self.tsid_list, threads=5)
+        """Multiprocessing using 5 processes (or threads)"""
+        executor = create_executor(self.backend, workers=5,
+                                   progress=self.print_progress, instance=self)
+        executor.map(self.validator, self.tsid_list)
+        executor.failure_report(verbose=self.verbose)
 
         if self.verbose:
             print('%i tsids have had their sources cross validated taking '
                   '%0.2f seconds.' %
                   (len(self.tsid_list), time.time() - validator_start))
 
+    def print_progress(self, completed, total):
+        """ Print the validation progress every 1,000 tsids.
+
+        :param completed: Integer of the tsids that have been validated
+        :param total: Integer of the tsids being validated
+        """
+
+        if completed % 1000 == 0 or completed == total:
+            print('Cross validated %s of %s tsids' %
+                  ('{:,}'.format(completed), '{:,}'.format(total)))
+
     def validator(self, tsid):
 
         tsid_start = time.time()
@@ -129,6 +169,14 @@ class CrossValidate:
             beg_date = datetime.today() - timedelta(days=self.period)
             unique_dates = unique_dates[unique_dates > beg_date]
 
+        # If the tsid has a changed date range, only validate those days
+        date_range = self.date_ranges.get(tsid)
+        if date_range:
+            range_beg, range_end = validation_days(*date_range)
+            dates = pd.to_datetime(unique_dates, utc=True)
+            unique_dates = unique_dates[(dates >= range_beg) &
+                                        (dates < range_end)]
+
         # The consensus_price_df contains the prices from weighted consensus
         if self.table == 'daily_prices':
             consensus_price_df = pd.DataFrame(
@@ -184,8 +232,8 @@ class CrossValidate:
                         #   use its price when calculating the field consensus.
                         if source_data[0] not in self.source_id_exclude_list:
 
-                            # Only process the source value if it is not None
-                            if source_data[1] is not None:
+                            # Only process the source value if it is not NaN
+                            if pd.notnull(source_data[1]):
 
                                 # Retrieve weighted consensus for this source
                                 source_weight = self.source_weights_df.loc[
@@ -255,7 +303,15 @@ class CrossValidate:
             #   to the database before, thus it must be removed before adding
             #   the new calculated values.
 
-            if self.period:
+            if date_range:
+                # Only delete the consensus values within the changed days
+                delete_query = ("""DELETE FROM %s
+                                   WHERE source_id='%s' AND source='tsid'
+                                   AND data_vendor_id='%s'
+                                   AND date>='%s' AND date<'%s'""" %
+                                (self.table, tsid, validator_id,
+                                 range_beg.isoformat(), range_end.isoformat()))
+            elif self.period:
                 # Only delete prior consensus values for this tsid that are
                 #   newer than the beg_date (current date - replace period).
                 delete_query = ("""DELETE FROM %s
@@ -285,7 +341,8 @@ class CrossValidate:
                     df_to_sql(database=self.database, user=self.user,
                               password=self.password, host=self.host,
                               port=self.port, df=consensus_price_df,
-                              sql_table=self.table, exists='append', item=tsid)
+                              sql_table=self.table, exists='append', item=tsid,
+                              notify=False)
                     break
 
             # print('Data table replacement took %0.2f' %
@@ -296,7 +353,7 @@ class CrossValidate:
             df_to_sql(database=self.database, user=self.user,
                       password=self.password, host=self.host, port=self.port,
                       df=consensus_price_df, sql_table=self.table,
-                      exists='append', item=tsid)
+                      exists='append', item=tsid, notify=False)
 
         # For period updates, slow down the process to allow postgre to catch up
         if self.period:
@@ -307,6 +364,180 @@ class CrossValidate:
                   (tsid, time.time() - tsid_start))
 
 
+class PendingChanges(object):
+    """ The changed tsid date ranges waiting to be cross validated. The
+    changes of the same table and tsid are merged into a single range. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ranges = {}
+        self.first_change = None
+
+    def add(self, change):
+        """ Merge a price change notification into the pending ranges.
+
+        :param change: Dictionary of the notification's table, tsid, vendor_id,
+            beg_date and end_date
+        """
+
+        key = (change['table'], change['tsid'])
+        with self.lock:
+            if key in self.ranges:
+                beg_date, end_date = self.ranges[key]
+                self.ranges[key] = (min(beg_date, change['beg_date']),
+                                    max(end_date, change['end_date']))
+            else:
+                self.ranges[key] = (change['beg_date'], change['end_date'])
+            if self.first_change is None:
+                self.first_change = time.time()
+
+    def ready(self, delay, now=None):
+        """
+        :param delay: Integer of the seconds the oldest change waits, allowing
+            the later writes of the same tsids to be validated together
+        :param now: Optional float of the current epoch time
+        :return: Boolean of whether the pending ranges should be validated
+        """
+
+        with self.lock:
+            if self.first_change is None:
+                return False
+            return (now or time.time()) - self.first_change >= delay
+
+    def pop(self):
+        """ Remove all of the pending ranges.
+
+        :return: Dictionary of each table with a dictionary of its tsids'
+            (beg_date, end_date) tuples
+        """
+
+        with self.lock:
+            ranges, self.ranges = self.ranges, {}
+            self.first_change = None
+
+        tables = {}
+        for (table, tsid), date_range in ranges.items():
+            tables.setdefault(table, {})[tsid] = date_range
+        return tables
+
+
+class ValidationListener(object):
+    """ Listens for the price_changes notifications sent by df_to_sql, and
+    cross validates the changed tsid date ranges within a background thread
+    while the downloads continue. The notifications come through Postgres, so
+    the writes of every process and host are validated. """
+
+    def __init__(self, database, user, password, host, port, tables,
+                 delay=60, verbose=False):
+        """
+        :param database: String of the database name
+        :param user: String of the username used to login to the database
+        :param password: String of the password used to login to the database
+        :param host: String of the database address (localhost, url, ip, etc.)
+        :param port: Integer of the database port number (5432)
+        :param tables: List of the price tables that are cross validated
+        :param delay: Integer of the seconds the first pending change waits
+            before the pending ranges are validated
+        :param verbose: Boolean of whether to print debugging statements
+        """
+
+        self.database = database
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.tables = tables
+        self.delay = delay
+        self.verbose = verbose
+
+        self.changes = PendingChanges()
+        self.stopped = threading.Event()
+        self.listening = threading.Event()
+        self.thread = None
+        self.validated = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        # The notifications sent before the LISTEN would be missed
+        self.listening.wait(30)
+        return self
+
+    def stop(self):
+        """ Stop listening once the pending changes are validated. """
+
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        print('The validation listener cross validated %s changed tsid date '
+              'ranges' % '{:,}'.format(self.validated))
+
+    def run(self):
+        conn = psycopg2.connect(database=self.database, user=self.user,
+                                password=self.password, host=self.host,
+                                port=self.port)
+        conn.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        try:
+            cur = conn.cursor()
+            cur.execute('LISTEN %s' % price_change_channel)
+            self.listening.set()
+
+            while not self.stopped.is_set():
+                self.receive(conn, timeout=1)
+                if self.changes.ready(self.delay):
+                    self.validate(self.changes.pop())
+
+            # Collect the notifications of the last writes before stopping
+            self.receive(conn, timeout=1)
+            self.validate(self.changes.pop())
+        finally:
+            self.listening.set()
+            conn.close()
+
+    def receive(self, conn, timeout):
+        """ Add the received notifications to the pending changes.
+
+        :param conn: psycopg2 connection that is listening
+        :param timeout: Float of the seconds to wait for a notification
+        """
+
+        if select.select([conn], [], [], timeout) == ([], [], []):
+            return
+        conn.poll()
+        while conn.notifies:
+            notification = conn.notifies.pop(0)
+            change = json.loads(notification.payload)
+            if change['table'] in self.tables:
+                self.changes.add(change)
+
+    def validate(self, tables):
+        """ Cross validate the changed date ranges of each table's tsids. This
+        runs in the listener's thread while the download threads are running,
+        so the tsids are validated by threads instead of a forked process
+        pool.
+
+        :param tables: Dictionary from PendingChanges.pop
+        """
+
+        for table, date_ranges in tables.items():
+            if self.verbose:
+                print('Cross validating the changed dates of %s tsids in %s' %
+                      ('{:,}'.format(len(date_ranges)), table))
+            try:
+                CrossValidate(
+                    database=self.database, user=self.user,
+                    password=self.password, host=self.host, port=self.port,
+                    table=table, tsid_list=list(date_ranges),
+                    verbose=self.verbose, date_ranges=date_ranges,
+                    backend='thread')
+                self.validated += len(date_ranges)
+            except Exception as e:
+                # Keep listening; the next change of these tsids retries them
+                print('Failed to cross validate the changed dates in %s: %s' %
+                      (table, e))
+
+
 if __name__ == '__main__':
 
     from utilities.user_dir import user_dir
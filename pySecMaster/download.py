@@ -1,10 +1,13 @@
 from datetime import datetime, timedelta
 from functools import wraps
+import io
+from multiprocessing import Lock, Value
 import numpy as np
 import pandas as pd
 import time
-from urllib.request import urlopen
+from urllib.request import Request, urlopen
 from urllib.error import HTTPError, URLError
+import zlib
 
 from utilities.date_conversions import date_to_iso
 
@@ -35,6 +38,295 @@ __version__ = '1.5.0'
 '''
 
 
+# Bytes received over the network (wire) and after decompression (decoded).
+#   These are shared memory values, so downloads made by forked worker
+#   processes are included within the totals of the main process.
+transfer_stats = {'wire': Value('Q', 0), 'decoded': Value('Q', 0)}
+
+
+def add_transfer_bytes(key, count):
+    """ Add the byte count to the shared transfer statistics.
+
+    :param key: String of which statistic to increment (wire, decoded)
+    :param count: Integer of the number of bytes to add
+    """
+
+    with transfer_stats[key].get_lock():
+        transfer_stats[key].value += count
+
+
+def reset_transfer_stats():
+    """ Reset the transfer statistics to zero, which is done at the start of
+    each run. """
+
+    for key in transfer_stats:
+        with transfer_stats[key].get_lock():
+            transfer_stats[key].value = 0
+
+
+def print_transfer_stats():
+    """ Print the number of bytes transferred by the vendor downloads since
+    the transfer statistics were last reset. """
+
+    wire = transfer_stats['wire'].value
+    decoded = transfer_stats['decoded'].value
+    if decoded:
+        saved = 100 * (1 - wire / decoded)
+    else:
+        saved = 0
+    print('Downloaded %s MB over the network, which decompressed to %s MB '
+          '(%0.1f%% saved by compression)' %
+          ('{:,.1f}'.format(wire / 1024 ** 2),
+           '{:,.1f}'.format(decoded / 1024 ** 2), saved))
+
+
+class DecompressingReader(io.RawIOBase):
+    """ A file like object that reads the HTTP response in chunks, decoding
+    the gzip or deflate content encoding as the data is read. This allows the
+    CSV parsers to stream the response instead of waiting for the complete
+    file to be downloaded and decompressed. """
+
+    def __init__(self, response, chunk_size=64 * 1024):
+        """
+        :param response: HTTPResponse object returned by urlopen
+        :param chunk_size: Integer of the bytes to read from the network at
+            a time
+        """
+
+        self.response = response
+        self.chunk_size = chunk_size
+        self.buffer = b''
+        self.eof = False
+
+        encoding = response.headers.get('Content-Encoding', '').lower()
+        if encoding in ['gzip', 'x-gzip']:
+            # The 16 offset indicates that a gzip header and trailer exist
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self.decompressor = zlib.decompressobj()
+        else:
+            self.decompressor = None
+        self.raw_deflate_check = encoding == 'deflate'
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer and not self.eof:
+            chunk = self.response.read(self.chunk_size)
+            if not chunk:
+                self.eof = True
+                if self.decompressor:
+                    self.buffer = self.decompressor.flush()
+                break
+
+            add_transfer_bytes('wire', len(chunk))
+            if self.decompressor:
+                try:
+                    self.buffer = self.decompressor.decompress(chunk)
+                except zlib.error:
+                    if not self.raw_deflate_check:
+                        raise
+                    # Some servers send deflate data without the zlib header
+                    self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                    self.buffer = self.decompressor.decompress(chunk)
+                self.raw_deflate_check = False
+            else:
+                self.buffer = chunk
+
+        count = min(len(b), len(self.buffer))
+        b[:count] = self.buffer[:count]
+        self.buffer = self.buffer[count:]
+        add_transfer_bytes('decoded', count)
+        return count
+
+    def close(self):
+        self.response.close()
+        super().close()
+
+
+class CircuitOpenError(OSError):
+    """ Raised instead of making a request when the vendor's circuit breaker
+    is open, allowing the item to be retried after the vendor recovers. """
+    pass
+
+
+class CircuitBreaker(object):
+    """ Tracks the consecutive request failures for a vendor. Once the failure
+    threshold is reached the circuit opens, and all requests to that vendor
+    fail immediately with a CircuitOpenError instead of going through their
+    retry sleeps. After the cooldown, a single probe request is allowed
+    through (half open); its success closes the circuit, while its failure
+    opens the circuit for another cooldown.
+
+    The state is held in shared memory values, so the breaker is shared by
+    all of the worker processes forked after it is created.
+    """
+
+    closed = 0
+    opened = 1
+    half_open = 2
+    state_names = {closed: 'closed', opened: 'open', half_open: 'half open'}
+
+    def __init__(self, vendor, threshold=5, cooldown=300):
+        """
+        :param vendor: String of the vendor name; used for the state prints
+        :param threshold: Integer of the consecutive failures that open the
+            circuit
+        :param cooldown: Integer of the seconds the circuit stays open before
+            a probe request is allowed
+        """
+
+        self.vendor = vendor
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self.lock = Lock()
+        self.state = Value('i', self.closed, lock=False)
+        self.failures = Value('i', 0, lock=False)
+        self.opened_at = Value('d', 0.0, lock=False)
+
+    def set_state(self, state):
+        """ Change the circuit state, printing the transition.
+
+        :param state: Integer of the new state
+        """
+
+        print('%s circuit breaker changed from %s to %s (%i consecutive '
+              'failures)' % (self.vendor, self.state_names[self.state.value],
+                             self.state_names[state], self.failures.value))
+        self.state.value = state
+        if state == self.opened:
+            self.opened_at.value = time.time()
+
+    def is_open(self):
+        """ Determine if requests to the vendor will currently fail fast.
+
+        :return: Boolean of whether the circuit is open or being probed
+        """
+
+        with self.lock:
+            if self.state.value == self.closed:
+                return False
+            if (self.state.value == self.opened and
+                    time.time() - self.opened_at.value >= self.cooldown):
+                # The probe has not been sent yet
+                return False
+            return True
+
+    def seconds_until_probe(self):
+        """ Determine how long until the circuit allows a probe request.
+
+        :return: Float of the seconds until the cooldown is over
+        """
+
+        with self.lock:
+            if self.state.value != self.opened:
+                return 0.0
+            return max(0.0, self.cooldown -
+                       (time.time() - self.opened_at.value))
+
+    def health(self):
+        """ Score the vendor's health from the circuit state and the number of
+        consecutive failures.
+
+        :return: Float between 0 (open circuit) and 1 (no recent failures)
+        """
+
+        with self.lock:
+            if self.state.value == self.opened:
+                return 0.0
+            elif self.state.value == self.half_open:
+                return 0.5
+            return max(0.0, 1.0 - self.failures.value / self.threshold)
+
+    def before_request(self):
+        """ Check that a request is allowed, raising a CircuitOpenError if it
+        is not. The first request after the cooldown becomes the probe. """
+
+        with self.lock:
+            if self.state.value == self.closed:
+                return
+            if (self.state.value == self.opened and
+                    time.time() - self.opened_at.value >= self.cooldown):
+                self.set_state(self.half_open)
+                return
+        raise CircuitOpenError('The %s circuit breaker is open; skipping the '
+                               'request' % self.vendor)
+
+    def record_success(self):
+        """ The vendor responded, so reset the failures and close the circuit.
+        """
+
+        with self.lock:
+            if self.state.value != self.closed:
+                self.set_state(self.closed)
+            self.failures.value = 0
+
+    def record_failure(self):
+        """ Count the failed request, opening the circuit if the probe failed
+        or the failure threshold was reached.
+
+        :return: Boolean of whether the circuit is now open
+        """
+
+        with self.lock:
+            self.failures.value += 1
+            if self.state.value == self.half_open:
+                self.set_state(self.opened)
+            elif (self.state.value == self.closed and
+                    self.failures.value >= self.threshold):
+                self.set_state(self.opened)
+            return self.state.value == self.opened
+
+
+# The circuit breakers for each price vendor. These must be created before the
+#   download worker processes are forked so the state is shared between them.
+vendor_breakers = {'quandl': CircuitBreaker('Quandl'),
+                   'google': CircuitBreaker('Google Finance'),
+                   'yahoo': CircuitBreaker('Yahoo Finance')}
+
+
+def open_url(url, breaker=None):
+    """ Open the url, asking the server to compress the response. The returned
+    object can be read like a file, with the response being decompressed as
+    it is read. HTTPError and URLError exceptions are raised the same as with
+    urlopen.
+
+    :param url: String of the url to download
+    :param breaker: Optional CircuitBreaker of the vendor being downloaded.
+        If the breaker is open, or the failure opens it, a CircuitOpenError is
+        raised instead of the request's error.
+    :return: BufferedReader of the decompressed response
+    """
+
+    if breaker:
+        breaker.before_request()
+
+    request = Request(url, headers={'Accept-Encoding': 'gzip, deflate'})
+    try:
+        response = urlopen(request)
+    except HTTPError as e:
+        # Bad request and not found errors indicate non existent codes, which
+        #   means the vendor is responding normally
+        if breaker and e.code in [400, 404]:
+            breaker.record_success()
+        elif breaker and breaker.record_failure():
+            raise CircuitOpenError('The %s circuit breaker opened after %s' %
+                                   (breaker.vendor, e)) from e
+        raise
+    except OSError as e:
+        # URLError and socket timeouts
+        if breaker and breaker.record_failure():
+            raise CircuitOpenError('The %s circuit breaker opened after %s' %
+                                   (breaker.vendor, e)) from e
+        raise
+
+    if breaker:
+        breaker.record_success()
+    return io.BufferedReader(DecompressingReader(response))
+
+
 def rate_limit(rate=2000, period_sec=600, threads=1):
     """
     A decorator that limits the rate at which a function is run. If the function
@@ -77,6 +369,102 @@ def csv_load_converter(input):
         return -1
 
 
+def clean_price_values(raw_df):
+    """ Convert each price column to a number, replacing missing values and
+    outliers (values over 1M) with -1, and round the values to the precision
+    used by the price tables.
+
+    :param raw_df: DataFrame of the downloaded prices
+    :return: DataFrame of the cleaned prices
+    """
+
+    for column in raw_df.columns:
+        # Skip the non-numeric columns
+        if column in ['date', 'updated_date', 'ticker']:
+            continue
+
+        # Convert each column's values to a number, forcing all non-numbers
+        #   to be NaN values, then fill the NaN values with -1 (no data)
+        raw_df[column] = pd.to_numeric(raw_df[column], errors='coerce')
+        raw_df[column] = raw_df[column].fillna(-1.0)
+
+        if column in ['open', 'high', 'low', 'close']:
+            # If there is an outlier, replace the value for the row with -1
+            outliers = pd.DataFrame.abs(raw_df[column]) > 1000000
+            if outliers.any():
+                print(raw_df[outliers])
+                raw_df.loc[outliers, column] = -1.0
+
+            # Round all data values to their appropriate levels
+            raw_df[column] = np.round(raw_df[column], decimals=4)
+
+        elif column in ['volume']:
+            # Round all data values to their appropriate levels
+            raw_df[column] = np.round(raw_df[column], decimals=0)
+
+    return raw_df
+
+
+def estimate_daily_rows(beg_date, end_date=None):
+    """ Estimate how many daily price rows a vendor will return between the
+    two dates, assuming there is a price for every weekday.
+
+    :param beg_date: String of the start date (YYYY-MM-DD)
+    :param end_date: Optional string of the end date (YYYY-MM-DD); defaults
+        to today
+    :return: Integer of the estimated number of rows
+    """
+
+    if end_date is None:
+        end_date = datetime.today().strftime('%Y-%m-%d')
+    return int(np.busday_count(beg_date[:10], end_date[:10])) + 1
+
+
+def plan_download_batches(items, max_rows=10000, max_items=100):
+    """ Group the items into multi-symbol download batches. Items are sorted
+    by their start date so each batch covers a similar date window, and a new
+    batch is started whenever the estimated rows returned by the batch would
+    exceed the vendor's per-call row cap.
+
+    :param items: List of tuples, with the first element being the item's
+        key (i.e. tsid) and the last element being the start date string
+        (YYYY-MM-DD) the item should be downloaded from
+    :param max_rows: Integer of the maximum rows the vendor returns per call
+    :param max_items: Integer of the maximum items allowed in one call; keeps
+        the request url to a reasonable length
+    :return: List of lists, with each inner list containing the items that
+        should be downloaded together
+    """
+
+    batches = []
+    cur_batch = []
+    batch_rows = 0
+    for item in sorted(items, key=lambda x: x[-1]):
+        if not cur_batch:
+            # The first item has the earliest date, and thus determines how
+            #   many rows each item in this batch will return
+            batch_rows = estimate_daily_rows(item[-1])
+        elif ((len(cur_batch) + 1) * batch_rows > max_rows or
+                len(cur_batch) >= max_items):
+            batches.append(cur_batch)
+            cur_batch = []
+            batch_rows = estimate_daily_rows(item[-1])
+        cur_batch.append(item)
+
+    if cur_batch:
+        batches.append(cur_batch)
+
+    return batches
+
+
+# Quandl datatables that accept many tickers and a date filter in one call,
+#   keyed by the Quandl database prefix of the q_code (i.e. WIKI/AAPL)
+quandl_datatables = {'WIKI': 'WIKI/PRICES'}
+
+# Maximum number of rows a Quandl datatable returns in a single call
+quandl_datatable_row_cap = 10000
+
+
 class QuandlDownload(object):
 
     def __init__(self, quandl_token, db_url):
@@ -336,13 +724,80 @@ class QuandlDownload(object):
 
         return raw_df
 
-    def download_data(self, name, page_num=None, beg_date=None, download_try=0):
+    def download_quandl_table_data(self, datatable, tickers, beg_date,
+                                   max_rows=quandl_datatable_row_cap):
+        """Downloads the prices for multiple tickers from a Quandl datatable
+        in a single call, splitting the response back into a DataFrame per
+        ticker. The datatable APIs return a limited number of rows per call,
+        so if the cap is reached the tickers are split in half and downloaded
+        again. A single ticker that reaches the cap is returned in the
+        truncated list, allowing it to be downloaded with the per code method.
+
+        :param datatable: String of the Quandl datatable (i.e. WIKI/PRICES)
+        :param tickers: List of ticker strings to download
+        :param beg_date: String of the start date (YYYY-MM-DD) to download
+        :param max_rows: Integer of the maximum rows returned in one call
+        :return: Tuple of a dictionary with the ticker as key and a DataFrame
+            of the ticker's prices as value, along with a list of tickers that
+            were truncated by the row cap
+        """
+
+        query = ('ticker=' + ','.join(tickers) + '&date.gte=' + beg_date +
+                 '&qopts.columns=ticker,date,open,high,low,close,volume,'
+                 'ex-dividend,split_ratio')
+        file = self.download_data(datatable, table_query=query)
+
+        if not file:
+            return {}, []
+
+        try:
+            raw_df = pd.read_csv(file, index_col=False, encoding='utf-8')
+        except Exception as e:
+            print('Unknown error occurred when reading the Quandl %s datatable '
+                  'CSV in download_quandl_table_data in download.py' %
+                  datatable)
+            print(e)
+            return {}, []
+
+        if len(raw_df.index) >= max_rows:
+            if len(tickers) == 1:
+                return {}, list(tickers)
+            # The response was truncated by the row cap; split the tickers
+            mid = len(tickers) // 2
+            first_data, first_trunc = self.download_quandl_table_data(
+                datatable, tickers[:mid], beg_date, max_rows)
+            second_data, second_trunc = self.download_quandl_table_data(
+                datatable, tickers[mid:], beg_date, max_rows)
+            first_data.update(second_data)
+            return first_data, first_trunc + second_trunc
+
+        if len(raw_df.index) == 0:
+            return {}, []
+
+        raw_df.rename(columns={'ex-dividend': 'dividend',
+                               'split_ratio': 'split'}, inplace=True)
+        raw_df['date'] = raw_df.apply(date_to_iso, axis=1, args=('date',))
+        raw_df.insert(len(raw_df.columns), 'updated_date',
+                      datetime.now().isoformat())
+        raw_df = clean_price_values(raw_df)
+
+        data = {}
+        for ticker, ticker_df in raw_df.groupby('ticker'):
+            ticker_df = ticker_df.drop('ticker', axis=1)
+            data[ticker] = ticker_df.reset_index(drop=True)
+
+        return data, []
+
+    def download_data(self, name, page_num=None, beg_date=None,
+                      table_query=None, download_try=0):
         """Downloads the CSV from the Quandl API URL provided.
 
         :param name: String of the object being downloaded. It can either be
-            the database name or a Quandl Code
+            the database name, a Quandl Code or a Quandl datatable
         :param page_num: Integer used when downloading database Quandl Codes
         :param beg_date: String of the start date (YYYY-MM-DD) to download
+        :param table_query: Optional string of the datatable filters, used
+            when downloading multiple tickers from a Quandl datatable
         :param download_try: Optional integer that indicates a download
             retry; utilized after an HTTP error to try the download again
             recursively
@@ -356,6 +811,9 @@ class QuandlDownload(object):
         if page_num is not None:
             # There is no need for the Quandl Code queries to have dates
             url_var = str(page_num) + '&auth_token=' + self.quandl_token
+        elif table_query is not None:
+            # Datatable queries filter on multiple tickers and the date
+            url_var = '?' + table_query + '&api_key=' + self.quandl_token
         else:
             url_var = '?auth_token=' + self.quandl_token
             if beg_date is not None:
@@ -363,9 +821,12 @@ class QuandlDownload(object):
                 url_var = url_var + '&trim_start=' + beg_date
 
         try:
-            csv_file = urlopen(db_url + url_var)
+            csv_file = open_url(db_url + url_var,
+                                breaker=vendor_breakers['quandl'])
             return csv_file
 
+        except CircuitOpenError:
+            raise
         except HTTPError as e:
             if 'http error 400' in str(e).lower():
                 # HTTP Error 400: Bad Request
@@ -391,7 +852,9 @@ class QuandlDownload(object):
                           'rate_limit more restrictive. Program will sleep for '
                           '11 minutes and will try again...' % (e.reason,))
                     time.sleep(11 * 60)
-                    self.download_data(name, download_try=download_try)
+                    return self.download_data(
+                        name, page_num=page_num, beg_date=beg_date,
+                        table_query=table_query, download_try=download_try)
                 else:
                     raise OSError('HTTPError %s: Exceeded Quandl API limit. '
                                   'After trying 5 time, the download was still '
@@ -408,7 +871,9 @@ class QuandlDownload(object):
                           'server. Maybe the network is down. Will sleep for '
                           '5 minutes' % (e.reason,))
                     time.sleep(5 * 60)
-                    self.download_data(name, download_try=download_try)
+                    return self.download_data(
+                        name, page_num=page_num, beg_date=beg_date,
+                        table_query=table_query, download_try=download_try)
                 else:
                     raise OSError('HTTPError %s: Server is currently '
                                   'unavailable. After trying 10 times, the '
@@ -421,7 +886,9 @@ class QuandlDownload(object):
                           'Maybe the network is down. Will sleep for 5 '
                           'minutes' % (e.reason,))
                     time.sleep(5 * 60)
-                    self.download_data(name, download_try=download_try)
+                    return self.download_data(
+                        name, page_num=page_num, beg_date=beg_date,
+                        table_query=table_query, download_try=download_try)
                 else:
                     raise OSError('HTTPError %s: Server is currently '
                                   'unavailable. After trying 10 time, the '
@@ -434,7 +901,9 @@ class QuandlDownload(object):
                           'the network is down. Will sleep for 5 minutes' %
                           (e.reason,))
                     time.sleep(5 * 60)
-                    self.download_data(name, download_try=download_try)
+                    return self.download_data(
+                        name, page_num=page_num, beg_date=beg_date,
+                        table_query=table_query, download_try=download_try)
                 else:
                     raise OSError('HTTPError %s: Server is currently '
                                   'unavailable. After trying 10 time, the '
@@ -454,7 +923,9 @@ class QuandlDownload(object):
                       'for 5 minutes and will then try again...' % (e.reason,))
                 print('URL used: %s' % (db_url + url_var,))
                 time.sleep(5 * 60)
-                self.download_data(name, download_try=download_try)
+                return self.download_data(
+                    name, page_num=page_num, beg_date=beg_date,
+                    table_query=table_query, download_try=download_try)
             else:
                 raise URLError('Warning: Still experiencing URL Error %s. '
                                'After trying 10 times, the error remains. '
@@ -467,145 +938,259 @@ class QuandlDownload(object):
                           (name,))
 
 
-def download_google_data(db_url, tsid, exchanges_df, csv_out, verbose=True):
-    """ Receives a tsid as a string, splits the code into ticker and
-    exchange, then passes it to the url to download the data. Once downloaded,
-    this adds titles to the column headers.
-
-    :param db_url: Dictionary of google finance url components
-    :param tsid: A string of the tsid
-    :param exchanges_df: DataFrame with all exchanges and their symbols
-    :param csv_out: String with the file directory for the CSV file that has
-        all the codes that don't have any data
-    :param verbose: Boolean of whether to print debugging statements
-    :return: A DataFrame with the data points for the tsid.
+def build_request_plan(tsids, exchanges_df, db_url, vendor, latest_prices=None,
+                       data_process='replace', days_back=None):
+    """ Build the download request for every tsid at once. The tsids are
+    split into their ticker and exchange symbol, joined with the vendor's
+    exchange symbols, and turned into the vendor urls with vectorized string
+    operations. The date after which the downloaded prices are new is also
+    determined from the latest existing prices.
+
+    :param tsids: List of the tsid strings to download
+    :param exchanges_df: DataFrame with the exchange symbols, including the
+        tsid_symbol and the vendor's symbol column
+    :param db_url: Dictionary of the vendor url components
+    :param vendor: String of the vendor (google, yahoo)
+    :param latest_prices: Optional DataFrame from query_last_price, with the
+        latest price date per tsid
+    :param data_process: String of how the new values will interact with the
+        existing values ('append' or 'replace')
+    :param days_back: Integer of the number of days where any existing data
+        should be replaced with newer prices
+    :return: DataFrame with the tsid, ticker, exchange, url, last_date and
+        keep_after columns. The keep_after is the ISO date after which the
+        downloaded prices should be kept, or None if the tsid has no prices.
     """
 
-    ticker = tsid[:tsid.find('.')]
-    exchange_symbol = tsid[tsid.find('.')+1:tsid.find('.', tsid.find('.')+1)]
+    symbol_columns = {'google': 'goog_symbol', 'yahoo': 'yahoo_symbol'}
+    if vendor not in symbol_columns:
+        raise NotImplementedError('The %s vendor is not implemented in '
+                                  'build_request_plan' % vendor)
 
-    try:
-        # Use the tsid exchange symbol to get the Google exchange symbol
-        exchange = (exchanges_df.loc[exchanges_df['tsid_symbol'] ==
-                                     exchange_symbol, 'goog_symbol'].values)
-    except KeyError:
-        exchange = None
-
-    # Make the url string; aside from the root, the items can be in any order
-    url_string = db_url['root']      # Establish the url root
+    plan = pd.DataFrame({'tsid': pd.Series(list(tsids), dtype=object)})
+
+    # The ticker is before the first period, and the exchange symbol is
+    #   between the first and second period (i.e. AAPL.Q.0)
+    tsid_parts = plan['tsid'].str.extract(r'^([^.]*)\.([^.]*)', expand=True)
+    plan['ticker'] = tsid_parts[0]
+
+    vendor_symbols = (exchanges_df.dropna(subset=[symbol_columns[vendor]])
+                      .drop_duplicates(subset='tsid_symbol')
+                      .set_index('tsid_symbol')[symbol_columns[vendor]])
+    plan['exchange'] = tsid_parts[1].map(vendor_symbols)
+    has_exchange = plan['exchange'].notnull() & (plan['exchange'] != '')
+
+    # Make the url strings; aside from the root, the items can be in any order
+    url = pd.Series(db_url['root'], index=plan.index, dtype=object)
     for key, item in db_url.items():
         if key == 'root':
             continue    # Already used above
         elif key == 'ticker':
-            url_string += '&' + item + ticker
+            url += '&' + item + plan['ticker']
+            if vendor == 'yahoo':
+                # Yahoo requires the exchange after the ticker for non US
+                #   exchanges
+                url += ('.' + plan['exchange']).where(has_exchange, '')
         elif key == 'exchange':
-            if exchange:
-                url_string += '&' + item + exchange[0]
+            url += ('&' + item + plan['exchange']).where(has_exchange, '')
+        else:
+            url += '&' + item
+    plan['url'] = url
+
+    plan['last_date'] = None
+    plan['keep_after'] = None
+    if latest_prices is not None and len(latest_prices.index) > 0:
+        last_date = pd.to_datetime(plan['tsid'].map(latest_prices['date']),
+                                   utc=True)
+        if data_process == 'replace' and days_back:
+            # Only keep data that is after the days_back period
+            keep_after = last_date - pd.Timedelta(days=days_back)
         else:
-            url_string += '&' + item
+            # Only keep data that is after the latest existing data point
+            keep_after = last_date
+        has_prices = last_date.notnull()
+        plan['last_date'] = (last_date.dt.strftime('%Y-%m-%dT%H:%M:%S')
+                             .astype(object).where(has_prices, None))
+        plan['keep_after'] = (keep_after.dt.strftime('%Y-%m-%dT%H:%M:%S')
+                              .astype(object).where(has_prices, None))
 
-    def download_data(url, download_try=0):
-        """ Downloads the text data from the url provided.
+    return plan
 
-        :param url: String that contains the url of the data to download.
-        :param download_try: Integer of the number of attempts to download data.
-        :return: A list of bytes of the data downloaded.
-        """
 
-        download_try += 1
-        try:
-            # Download the data
-            return urlopen(url).readlines()
+def save_request_plan(plan, csv_out):
+    """ Print a summary of the request plan and save it to a CSV file, which
+    allows the plan to be inspected without downloading anything.
 
-        except HTTPError as e:
-            if 'http error 403' in str(e).lower():
-                # HTTP Error 403: Forbidden
-                raise OSError('HTTPError %s: Reached API call limit. Make the '
-                              'RateLimit more restrictive.' % (e.reason,))
-            elif 'http error 404' in str(e).lower():
-                # HTTP Error 404: Not Found
-                raise OSError('HTTPError %s: %s not found' % (e.reason, tsid))
-            elif 'http error 429' in str(e).lower():
-                # HTTP Error 429: Too Many Requests
-                if download_try <= 5:
-                    print('HTTPError %s: Exceeded API limit. Make the '
-                          'RateLimit more restrictive. Program will sleep for '
-                          '11 minutes and will try again...' % (e.reason,))
-                    time.sleep(11 * 60)
-                    download_data(url, download_try)
-                else:
-                    raise OSError('HTTPError %s: Exceeded API limit. After '
-                                  'trying 5 time, the download was still not '
-                                  'successful. You could have hit the per day '
-                                  'call limit.' % (e.reason,))
-            elif 'http error 500' in str(e).lower():
-                # HTTP Error 500: Internal Server Error
-                if download_try <= 10:
-                    print('HTTPError %s: Internal Server Error' % (e.reason,))
-            elif 'http error 502' in str(e).lower():
-                # HTTP Error 502: Bad Gateway
-                if download_try <= 10:
-                    print('HTTPError %s: Encountered a bad gateway with the '
-                          'server. Maybe the network is down. Will sleep for '
-                          '5 minutes'
-                          % (e.reason,))
-                    time.sleep(5 * 60)
-                    download_data(url, download_try)
-                else:
-                    raise OSError('HTTPError %s: Server is currently '
-                                  'unavailable. After trying 10 times, the '
-                                  'download was still not successful. Quitting '
-                                  'for now.' % (e.reason,))
-            elif 'http error 503' in str(e).lower():
-                # HTTP Error 503: Service Unavailable
-                # Received this HTTP Error after 2000 queries. Browser showed
-                #   captcha message upon loading url.
-                if download_try <= 10:
-                    print('HTTPError %s: Server is currently unavailable. '
-                          'Maybe the network is down or the server is blocking '
-                          'you. Will sleep for 5 minutes...' % (e.reason,))
-                    time.sleep(5 * 60)
-                    download_data(url, download_try)
-                else:
-                    raise OSError('HTTPError %s: Server is currently '
-                                  'unavailable. After trying 10 time, the '
-                                  'download was still not successful. '
-                                  'Quitting for now.' % (e.reason,))
-            elif 'http error 504' in str(e).lower():
-                # HTTP Error 504: GATEWAY_TIMEOUT
-                if download_try <= 10:
-                    print('HTTPError %s: Server connection timed out. Maybe '
-                          'the network is down. Will sleep for 5 minutes'
-                          % (e.reason,))
-                    time.sleep(5 * 60)
-                    download_data(url, download_try)
-                else:
-                    raise OSError('HTTPError %s: Server is currently '
-                                  'unavailable. After trying 10 time, the '
-                                  'download was still not successful. Quitting '
-                                  'for now.' % (e.reason,))
-            else:
-                print('Base URL used: %s' % (url,))
-                raise OSError('%s - Unknown error when downloading %s'
-                              % (e, tsid))
+    :param plan: DataFrame from build_request_plan
+    :param csv_out: String of the CSV file the plan is saved to
+    """
 
-        except URLError as e:
+    new_tsids = plan['keep_after'].isnull().sum()
+    no_exchange = plan['exchange'].isnull().sum()
+    print('Request plan for %s tsids: %s without prior prices, %s updates '
+          'and %s without a vendor exchange symbol. The plan was saved to %s'
+          % ('{:,}'.format(len(plan.index)), '{:,}'.format(new_tsids),
+             '{:,}'.format(len(plan.index) - new_tsids),
+             '{:,}'.format(no_exchange), csv_out))
+    print(plan.head(10).to_string(index=False))
+    plan.to_csv(csv_out, index=False)
+
+
+def fetch_google_data(url, tsid, download_try=0):
+    """ Downloads the text data from the url provided. This is only the network
+    part of download_google_data, which allows the parsing to be done
+    elsewhere.
+
+    :param url: String that contains the url of the data to download.
+    :param tsid: String of the tsid being downloaded
+    :param download_try: Integer of the number of attempts to download data.
+    :return: A list of bytes of the data downloaded.
+    """
+
+    download_try += 1
+    try:
+        # Download the data
+        return open_url(url, breaker=vendor_breakers['google']).readlines()
+
+    except CircuitOpenError:
+        raise
+    except HTTPError as e:
+        if 'http error 403' in str(e).lower():
+            # HTTP Error 403: Forbidden
+            raise OSError('HTTPError %s: Reached API call limit. Make the '
+                          'RateLimit more restrictive.' % (e.reason,))
+        elif 'http error 404' in str(e).lower():
+            # HTTP Error 404: Not Found
+            raise OSError('HTTPError %s: %s not found' % (e.reason, tsid))
+        elif 'http error 429' in str(e).lower():
+            # HTTP Error 429: Too Many Requests
+            if download_try <= 5:
+                print('HTTPError %s: Exceeded API limit. Make the '
+                      'RateLimit more restrictive. Program will sleep for '
+                      '11 minutes and will try again...' % (e.reason,))
+                time.sleep(11 * 60)
+                return fetch_google_data(url, tsid, download_try)
+            else:
+                raise OSError('HTTPError %s: Exceeded API limit. After '
+                              'trying 5 time, the download was still not '
+                              'successful. You could have hit the per day '
+                              'call limit.' % (e.reason,))
+        elif 'http error 500' in str(e).lower():
+            # HTTP Error 500: Internal Server Error
             if download_try <= 10:
-                print('Warning: Experienced URL Error %s. Program will '
-                      'sleep for 5 minutes and will then try again...' %
-                      (e.reason,))
+                print('HTTPError %s: Internal Server Error' % (e.reason,))
+        elif 'http error 502' in str(e).lower():
+            # HTTP Error 502: Bad Gateway
+            if download_try <= 10:
+                print('HTTPError %s: Encountered a bad gateway with the '
+                      'server. Maybe the network is down. Will sleep for '
+                      '5 minutes'
+                      % (e.reason,))
                 time.sleep(5 * 60)
-                download_data(url, download_try)
+                return fetch_google_data(url, tsid, download_try)
             else:
-                raise URLError('Warning: Still experiencing URL Error %s. '
-                               'After trying 10 times, the error remains. '
-                               'Quitting for now, but you can try again later.'
-                               % (e.reason,))
+                raise OSError('HTTPError %s: Server is currently '
+                              'unavailable. After trying 10 times, the '
+                              'download was still not successful. Quitting '
+                              'for now.' % (e.reason,))
+        elif 'http error 503' in str(e).lower():
+            # HTTP Error 503: Service Unavailable
+            # Received this HTTP Error after 2000 queries. Browser showed
+            #   captcha message upon loading url.
+            if download_try <= 10:
+                print('HTTPError %s: Server is currently unavailable. '
+                      'Maybe the network is down or the server is blocking '
+                      'you. Will sleep for 5 minutes...' % (e.reason,))
+                time.sleep(5 * 60)
+                return fetch_google_data(url, tsid, download_try)
+            else:
+                raise OSError('HTTPError %s: Server is currently '
+                              'unavailable. After trying 10 time, the '
+                              'download was still not successful. '
+                              'Quitting for now.' % (e.reason,))
+        elif 'http error 504' in str(e).lower():
+            # HTTP Error 504: GATEWAY_TIMEOUT
+            if download_try <= 10:
+                print('HTTPError %s: Server connection timed out. Maybe '
+                      'the network is down. Will sleep for 5 minutes'
+                      % (e.reason,))
+                time.sleep(5 * 60)
+                return fetch_google_data(url, tsid, download_try)
+            else:
+                raise OSError('HTTPError %s: Server is currently '
+                              'unavailable. After trying 10 time, the '
+                              'download was still not successful. Quitting '
+                              'for now.' % (e.reason,))
+        else:
+            print('Base URL used: %s' % (url,))
+            raise OSError('%s - Unknown error when downloading %s'
+                          % (e, tsid))
+
+    except URLError as e:
+        if download_try <= 10:
+            print('Warning: Experienced URL Error %s. Program will '
+                  'sleep for 5 minutes and will then try again...' %
+                  (e.reason,))
+            time.sleep(5 * 60)
+            return fetch_google_data(url, tsid, download_try)
+        else:
+            raise URLError('Warning: Still experiencing URL Error %s. '
+                           'After trying 10 times, the error remains. '
+                           'Quitting for now, but you can try again later.'
+                           % (e.reason,))
+
+    except Exception as e:
+        print(e)
+        print('Warning: Encountered an unknown error when downloading %s '
+              'in fetch_google_data in download.py' % (tsid,))
 
-        except Exception as e:
-            print(e)
-            print('Warning: Encountered an unknown error when downloading %s '
-                  'in download_data in download.py' % (tsid,))
+
+def download_google_data(db_url, tsid, exchanges_df, csv_out, verbose=True,
+                         url=None, raw_data=None):
+    """ Receives a tsid as a string, splits the code into ticker and
+    exchange, then passes it to the url to download the data. Once downloaded,
+    this adds titles to the column headers.
+
+    :param db_url: Dictionary of google finance url components
+    :param tsid: A string of the tsid
+    :param exchanges_df: DataFrame with all exchanges and their symbols
+    :param csv_out: String with the file directory for the CSV file that has
+        all the codes that don't have any data
+    :param verbose: Boolean of whether to print debugging statements
+    :param url: Optional string of the tsid's url from the request plan (see
+        build_request_plan); when provided, the url isn't derived again
+    :param raw_data: Optional data already downloaded with fetch_google_data;
+        when provided, the data is only parsed and cleaned
+    :return: A DataFrame with the data points for the tsid.
+    """
+
+    if url is not None:
+        url_string = url
+    else:
+        ticker = tsid[:tsid.find('.')]
+        exchange_symbol = tsid[tsid.find('.')+1:
+                               tsid.find('.', tsid.find('.')+1)]
+
+        try:
+            # Use the tsid exchange symbol to get the Google exchange symbol
+            exchange = (exchanges_df.loc[exchanges_df['tsid_symbol'] ==
+                                         exchange_symbol, 'goog_symbol'].values)
+        except KeyError:
+            exchange = None
+
+        # Make the url string; aside from the root, the items can be in any
+        #   order
+        url_string = db_url['root']      # Establish the url root
+        for key, item in db_url.items():
+            if key == 'root':
+                continue    # Already used above
+            elif key == 'ticker':
+                url_string += '&' + item + ticker
+            elif key == 'exchange':
+                if exchange:
+                    url_string += '&' + item + exchange[0]
+            else:
+                url_string += '&' + item
 
     def google_data_processing(url_obj):
         """ Takes the url object returned from Google, and formats the text data
@@ -666,7 +1251,10 @@ def download_google_data(db_url, tsid, exchanges_df, csv_out, verbose=True):
         processed_df = pd.DataFrame(data, columns=column_names)
         return processed_df
 
-    url_obj = download_data(url_string)
+    if raw_data is not None:
+        url_obj = raw_data
+    else:
+        url_obj = fetch_google_data(url_string, tsid)
 
     try:
         raw_df = google_data_processing(url_obj)
@@ -784,7 +1372,119 @@ def download_google_data(db_url, tsid, exchanges_df, csv_out, verbose=True):
     return raw_df
 
 
-def download_yahoo_data(db_url, tsid, exchanges_df, csv_out, verbose=True):
+def fetch_yahoo_data(url, tsid, download_try=0):
+    """ Downloads the CSV file from the url provided. This is only the network
+    part of download_yahoo_data, which allows the parsing to be done
+    elsewhere.
+
+    :param url: String that contains the url of the data to download.
+    :param tsid: String of the tsid being downloaded
+    :param download_try: Integer of the number of attempts to download data.
+    :return: Bytes of the CSV file downloaded, or None if it wasn't found.
+    """
+
+    download_try += 1
+    try:
+        # Download the csv file
+        return open_url(url, breaker=vendor_breakers['yahoo']).read()
+
+    except CircuitOpenError:
+        raise
+    except HTTPError as e:
+        if 'http error 403' in str(e).lower():
+            # HTTP Error 403: Forbidden
+            raise OSError('HTTPError %s: Reached API call limit. Make the '
+                          'RateLimit more restrictive.' % (e.reason,))
+        elif 'http error 404' in str(e).lower():
+            # HTTP Error 404: Not Found
+            # if verbose:
+            #     print('HTTPError %s: %s not found' % (e.reason, tsid))
+            return None
+        elif 'http error 429' in str(e).lower():
+            # HTTP Error 429: Too Many Requests
+            if download_try <= 5:
+                print('HTTPError %s: Exceeded API limit. Make the '
+                      'RateLimit more restrictive. Program will sleep for '
+                      '11 minutes and will try again...' % (e.reason,))
+                time.sleep(11 * 60)
+                return fetch_yahoo_data(url, tsid, download_try)
+            else:
+                raise OSError('HTTPError %s: Exceeded API limit. After '
+                              'trying 5 time, the download was still not '
+                              'successful. You could have hit the per day '
+                              'call limit.' % (e.reason,))
+        elif 'http error 500' in str(e).lower():
+            # HTTP Error 500: Internal Server Error
+            if download_try <= 10:
+                print('HTTPError %s: Internal Server Error' % (e.reason,))
+        elif 'http error 502' in str(e).lower():
+            # HTTP Error 502: Bad Gateway
+            if download_try <= 10:
+                print('HTTPError %s: Encountered a bad gateway with the '
+                      'server. Maybe the network is down. Will sleep for '
+                      '5 minutes'
+                      % (e.reason,))
+                time.sleep(5 * 60)
+                return fetch_yahoo_data(url, tsid, download_try)
+            else:
+                raise OSError('HTTPError %s: Server is currently '
+                              'unavailable. After trying 10 times, the '
+                              'download was still not successful. Quitting '
+                              'for now.' % (e.reason,))
+        elif 'http error 503' in str(e).lower():
+            # HTTP Error 503: Service Unavailable
+            # Received this HTTP Error after 2000 queries. Browser showed
+            #   captcha message upon loading url.
+            if download_try <= 10:
+                print('HTTPError %s: Server is currently unavailable. '
+                      'Maybe the network is down or the server is blocking '
+                      'you. Will sleep for 5 minutes...' % (e.reason,))
+                time.sleep(5 * 60)
+                return fetch_yahoo_data(url, tsid, download_try)
+            else:
+                raise OSError('HTTPError %s: Server is currently '
+                              'unavailable. After trying 10 time, the '
+                              'download was still not successful. '
+                              'Quitting for now.' % (e.reason,))
+        elif 'http error 504' in str(e).lower():
+            # HTTP Error 504: GATEWAY_TIMEOUT
+            if download_try <= 10:
+                print('HTTPError %s: Server connection timed out. Maybe '
+                      'the network is down. Will sleep for 5 minutes'
+                      % (e.reason,))
+                time.sleep(5 * 60)
+                return fetch_yahoo_data(url, tsid, download_try)
+            else:
+                raise OSError('HTTPError %s: Server is currently '
+                              'unavailable. After trying 10 time, the '
+                              'download was still not successful. Quitting '
+                              'for now.' % (e.reason,))
+        else:
+            print('Base URL used: %s' % (url,))
+            raise OSError('%s - Unknown error when downloading %s' %
+                          (e, tsid))
+
+    except URLError as e:
+        if download_try <= 10:
+            print('Warning: Experienced URL Error %s. Program will '
+                  'sleep for 5 minutes and will then try again...' %
+                  (e.reason,))
+            time.sleep(5 * 60)
+            return fetch_yahoo_data(url, tsid, download_try)
+        else:
+            raise URLError('Warning: Still experiencing URL Error %s. '
+                           'After trying 10 times, the error remains. '
+                           'Quitting for now, but you can try again later.'
+                           % (e.reason,))
+
+    except Exception as e:
+        print(e)
+        print('Warning: Encountered an unknown error when downloading %s '
+              'in fetch_yahoo_data' % (tsid,))
+
+
+def download_yahoo_data(db_url, tsid, exchanges_df, csv_out, verbose=True,
+                        url=None, raw_data=None):
     """ Receives a tsid as a string, splits the code into ticker and
     exchange, then passes it to the url to download the data. Once downloaded,
     this adds titles to the column headers.
@@ -795,141 +1495,52 @@ def download_yahoo_data(db_url, tsid, exchanges_df, csv_out, verbose=True):
     :param csv_out: String with the file directory for the CSV file that has
         all the codes that don't have any data
     :param verbose: Boolean of whether to print debugging statements
+    :param url: Optional string of the tsid's url from the request plan (see
+        build_request_plan); when provided, the url isn't derived again
+    :param raw_data: Optional data already downloaded with fetch_yahoo_data;
+        when provided, the data is only parsed and cleaned
     :return: A DataFrame with the data points for the tsid.
     """
 
-    ticker = tsid[:tsid.find('.')]
-    exchange_symbol = tsid[tsid.find('.')+1:tsid.find('.', tsid.find('.')+1)]
-
-    try:
-        # Use the tsid exchange symbol to get the Yahoo exchange symbol
-        exchange = (exchanges_df.loc[exchanges_df['tsid_symbol'] ==
-                                     exchange_symbol, 'yahoo_symbol'].values)
-    except KeyError:
-        exchange = None
-
-    # Make the url string; aside from the root, the items can be in any order
-    url_string = db_url['root']      # Establish the url root
-    for key, item in db_url.items():
-        if key == 'root':
-            continue    # Already used above
-        elif key == 'ticker':
-            if exchange:
-                # If an exchange was found, Yahoo requires both ticker and
-                #   exchange
-                url_string += '&' + item + ticker + '.' + exchange
-            else:
-                # Ticker is in a major exchange and doesn't need exchange info
-                url_string += '&' + item + ticker
-        else:
-            url_string += '&' + item
-
-    def download_data(url, download_try=0):
-        """ Downloads the CSV file from the url provided.
-
-        :param url: String that contains the url of the data to download.
-        :param download_try: Integer of the number of attempts to download data.
-        :return: A list of bytes of the data downloaded.
-        """
+    if url is not None:
+        url_string = url
+    else:
+        ticker = tsid[:tsid.find('.')]
+        exchange_symbol = tsid[tsid.find('.')+1:
+                               tsid.find('.', tsid.find('.')+1)]
 
-        download_try += 1
         try:
-            # Download the csv file
-            return urlopen(url)
-
-        except HTTPError as e:
-            if 'http error 403' in str(e).lower():
-                # HTTP Error 403: Forbidden
-                raise OSError('HTTPError %s: Reached API call limit. Make the '
-                              'RateLimit more restrictive.' % (e.reason,))
-            elif 'http error 404' in str(e).lower():
-                # HTTP Error 404: Not Found
-                # if verbose:
-                #     print('HTTPError %s: %s not found' % (e.reason, tsid))
-                return None
-            elif 'http error 429' in str(e).lower():
-                # HTTP Error 429: Too Many Requests
-                if download_try <= 5:
-                    print('HTTPError %s: Exceeded API limit. Make the '
-                          'RateLimit more restrictive. Program will sleep for '
-                          '11 minutes and will try again...' % (e.reason,))
-                    time.sleep(11 * 60)
-                    download_data(url, download_try)
+            # Use the tsid exchange symbol to get the Yahoo exchange symbol
+            exchange = (exchanges_df.loc[exchanges_df['tsid_symbol'] ==
+                                         exchange_symbol,
+                                         'yahoo_symbol'].values)
+        except KeyError:
+            exchange = None
+
+        # Make the url string; aside from the root, the items can be in any
+        #   order
+        url_string = db_url['root']      # Establish the url root
+        for key, item in db_url.items():
+            if key == 'root':
+                continue    # Already used above
+            elif key == 'ticker':
+                if exchange:
+                    # If an exchange was found, Yahoo requires both ticker and
+                    #   exchange
+                    url_string += '&' + item + ticker + '.' + exchange
                 else:
-                    raise OSError('HTTPError %s: Exceeded API limit. After '
-                                  'trying 5 time, the download was still not '
-                                  'successful. You could have hit the per day '
-                                  'call limit.' % (e.reason,))
-            elif 'http error 500' in str(e).lower():
-                # HTTP Error 500: Internal Server Error
-                if download_try <= 10:
-                    print('HTTPError %s: Internal Server Error' % (e.reason,))
-            elif 'http error 502' in str(e).lower():
-                # HTTP Error 502: Bad Gateway
-                if download_try <= 10:
-                    print('HTTPError %s: Encountered a bad gateway with the '
-                          'server. Maybe the network is down. Will sleep for '
-                          '5 minutes'
-                          % (e.reason,))
-                    time.sleep(5 * 60)
-                    download_data(url, download_try)
-                else:
-                    raise OSError('HTTPError %s: Server is currently '
-                                  'unavailable. After trying 10 times, the '
-                                  'download was still not successful. Quitting '
-                                  'for now.' % (e.reason,))
-            elif 'http error 503' in str(e).lower():
-                # HTTP Error 503: Service Unavailable
-                # Received this HTTP Error after 2000 queries. Browser showed
-                #   captcha message upon loading url.
-                if download_try <= 10:
-                    print('HTTPError %s: Server is currently unavailable. '
-                          'Maybe the network is down or the server is blocking '
-                          'you. Will sleep for 5 minutes...' % (e.reason,))
-                    time.sleep(5 * 60)
-                    download_data(url, download_try)
-                else:
-                    raise OSError('HTTPError %s: Server is currently '
-                                  'unavailable. After trying 10 time, the '
-                                  'download was still not successful. '
-                                  'Quitting for now.' % (e.reason,))
-            elif 'http error 504' in str(e).lower():
-                # HTTP Error 504: GATEWAY_TIMEOUT
-                if download_try <= 10:
-                    print('HTTPError %s: Server connection timed out. Maybe '
-                          'the network is down. Will sleep for 5 minutes'
-                          % (e.reason,))
-                    time.sleep(5 * 60)
-                    download_data(url, download_try)
-                else:
-                    raise OSError('HTTPError %s: Server is currently '
-                                  'unavailable. After trying 10 time, the '
-                                  'download was still not successful. Quitting '
-                                  'for now.' % (e.reason,))
-            else:
-                print('Base URL used: %s' % (url,))
-                raise OSError('%s - Unknown error when downloading %s' %
-                              (e, tsid))
-
-        except URLError as e:
-            if download_try <= 10:
-                print('Warning: Experienced URL Error %s. Program will '
-                      'sleep for 5 minutes and will then try again...' %
-                      (e.reason,))
-                time.sleep(5 * 60)
-                download_data(url, download_try)
+                    # Ticker is in a major exchange and doesn't need exchange
+                    #   info
+                    url_string += '&' + item + ticker
             else:
-                raise URLError('Warning: Still experiencing URL Error %s. '
-                               'After trying 10 times, the error remains. '
-                               'Quitting for now, but you can try again later.'
-                               % (e.reason,))
+                url_string += '&' + item
 
-        except Exception as e:
-            print(e)
-            print('Warning: Encountered an unknown error when downloading %s '
-                  'in download_yahoo_data.download_data' % (tsid,))
-
-    url_obj = download_data(url_string)
+    if raw_data is not None:
+        url_obj = io.BytesIO(raw_data)
+    else:
+        url_obj = fetch_yahoo_data(url_string, tsid)
+        if url_obj is not None:
+            url_obj = io.BytesIO(url_obj)
 
     column_names = ['date', 'open', 'high', 'low', 'close', 'volume',
                     'adj_close']
@@ -1091,7 +1702,7 @@ def download_csidata_factsheet(db_url, data_type, exchange_id=None,
         download_try += 1
         try:
             # Download the data
-            return urlopen(url)
+            return open_url(url)
 
         except HTTPError as e:
             if 'http error 403' in str(e).lower():
@@ -1262,7 +1873,7 @@ def download_nasdaq_industry_sector(db_url, exchange_list):
         download_try += 1
         try:
             # Download the data
-            return urlopen(url)
+            return open_url(url)
 
         except HTTPError as e:
             if 'http error 403' in str(e).lower():
@@ -1,5 +1,6 @@
 import csv
 from datetime import datetime, timedelta, timezone
+from functools import partial
 import pandas as pd
 import psycopg2
 #import re
@@ -8,12 +9,24 @@ import time
 
 from download import QuandlDownload, download_google_data, \
     download_yahoo_data, download_csidata_factsheet,\
-    download_nasdaq_industry_sector
+    download_nasdaq_industry_sector, plan_download_batches,\
+    quandl_datatable_row_cap, quandl_datatables, vendor_breakers,\
+    CircuitOpenError, build_request_plan, save_request_plan,\
+    fetch_google_data, fetch_yahoo_data
 from utilities.database_queries import df_to_sql, delete_sql_table_rows, \
     query_data_vendor_id, query_codes, query_csi_stock_start_date,\
     query_last_price, query_q_codes, query_tsid_based_on_exchanges,\
     update_classification_values
-from utilities.multithread import multithread
+from utilities.daemon import cached
+from utilities.download_planner import DownloadPlanner
+from utilities.multithread import EndItem, create_executor, pipeline
+from utilities.rate_limiter import RateLimiter
+from utilities.run_plan import estimate_plan_rows
+from utilities.time_budget import run_budget
+from utilities.refresh_policy import RefreshHistory, due_codes, \
+    has_new_prices, last_price_date, query_refresh_history
+from utilities.work_queue import CompletedWork, LeaseHeartbeat, claim_work,\
+    default_worker_id, prioritize_work, release_work
 
 __author__ = 'Josh Schertz'
 __copyright__ = 'Copyright (C) 2018 Josh Schertz'
@@ -41,6 +54,162 @@ __version__ = '1.5.0'
 '''
 
 
+def multithread_with_breaker(function, items, threads, breaker, max_probes=3,
+                             runner=None):
+    """ Run the function for all items using a process executor, retrying
+    the items that were skipped because the vendor's circuit breaker was open.
+    The function must return the item (or the remaining part of it) when it
+    was skipped, and None otherwise. Once the breaker opens, the executor stops
+    submitting items, and the unsubmitted items are skipped as well. After the
+    breaker's cooldown, the first skipped item is run by itself as the probe;
+    if the vendor responds, the remaining items are run again. The run's time
+    budget stops the items the same way, except they aren't retried.
+
+    :param function: The extractor method to process in parallel
+    :param items: List of items that are passed into the function
+    :param threads: Integer of the number of threads to use
+    :param breaker: CircuitBreaker of the vendor being downloaded
+    :param max_probes: Integer of the failed probes allowed before the skipped
+        items are left for the next run
+    :param runner: Optional function that takes a list of items and returns
+        their results (i.e. a pipeline); by default, the function is run for
+        the items with a process executor. The probe always uses the function.
+    """
+
+    failed_probes = 0
+    while items:
+        if runner:
+            results = runner(items)
+        else:
+            # The extractor instance is loaded into each worker once
+            executor = create_executor(
+                'process', workers=threads,
+                instance=getattr(function, '__self__', None))
+            # The items that are never submitted keep their own value
+            results = list(items)
+            for result in executor.as_completed(function, items):
+                results[result.index] = result.value
+                if breaker.is_open() or run_budget.exhausted():
+                    executor.cancel()
+            executor.failure_report()
+        items = [item for item in results if item is not None]
+
+        while items:
+            if run_budget.exhausted(wait=breaker.seconds_until_probe()):
+                run_budget.skip(len(items))
+                print('%s %s items were not downloaded before the time budget '
+                      'ran out' % ('{:,}'.format(len(items)), breaker.vendor))
+                return
+            if failed_probes >= max_probes:
+                print('%s items were not downloaded because the %s circuit '
+                      'breaker remained open. They will be downloaded during '
+                      'the next run.' %
+                      ('{:,}'.format(len(items)), breaker.vendor))
+                return
+
+            wait = breaker.seconds_until_probe()
+            print('%s items were skipped while the %s circuit breaker was '
+                  'open. Retrying them in %0.0f seconds.' %
+                  ('{:,}'.format(len(items)), breaker.vendor, wait))
+            time.sleep(wait)
+
+            probe_result = function(items[0])
+            if probe_result is None:
+                # The vendor responded, so run the remaining items
+                items = items[1:]
+                break
+            items[0] = probe_result
+            failed_probes += 1
+
+
+def run_claimed_work(extractor, vendor):
+    """ Download the work items that this worker claims from the shared work
+    queue, until the queue has no claimable items left. The items are claimed
+    in batches, with their leases renewed by a heartbeat while the batch is
+    downloaded. Each finished item is removed from the queue by the extractor's
+    normal write path, while items that were skipped (i.e. the circuit breaker
+    opened) are released for the other workers.
+
+    :param extractor: GoogleFinanceDataExtraction or YahooFinanceDataExtraction
+        in the worker role
+    :param vendor: String of the vendor (google or yahoo)
+    :return: Integer of the items claimed
+    """
+
+    db_args = {'database': extractor.database, 'user': extractor.user,
+               'password': extractor.password, 'host': extractor.host,
+               'port': extractor.port}
+    heartbeat = LeaseHeartbeat(worker_id=extractor.worker_id,
+                               lease_seconds=extractor.lease_seconds,
+                               **db_args).start()
+    claimed = 0
+    try:
+        while (not vendor_breakers[vendor].is_open() and
+               not run_budget.exhausted()):
+            tsids = claim_work(vendor_id=extractor.vendor_id,
+                               table=extractor.table,
+                               worker_id=extractor.worker_id,
+                               limit=extractor.claim_size,
+                               lease_seconds=extractor.lease_seconds,
+                               **db_args)
+            if not tsids:
+                break
+            claimed += len(tsids)
+            print('%s claimed %s %s items' %
+                  (extractor.worker_id, '{:,}'.format(len(tsids)), vendor))
+
+            plan = build_request_plan(
+                tsids=tsids, exchanges_df=extractor.exchanges_df,
+                db_url=extractor.db_url, vendor=vendor,
+                latest_prices=extractor.latest_prices,
+                data_process=extractor.data_process,
+                days_back=extractor.days_back)
+            records = [tuple(record) for record in
+                       plan[['tsid', 'url', 'keep_after']].values]
+            multithread_with_breaker(extractor.extractor, records,
+                                     extractor.threads, vendor_breakers[vendor],
+                                     runner=extractor.run_pipeline)
+
+            # Remove the finished items before their leases are released
+            extractor.completed_work.flush()
+            release_work(worker_id=extractor.worker_id, **db_args)
+    finally:
+        heartbeat.stop()
+        extractor.completed_work.flush()
+        release_work(worker_id=extractor.worker_id, **db_args)
+
+    return claimed
+
+
+def parse_vendor_prices(download_function, db_url, csv_out, verbose, record,
+                        raw_data):
+    """ The parse stage of the Google and Yahoo extractor pipelines, which runs
+    in the parse process pool. Parses and cleans the downloaded data, only
+    keeping the prices after the record's keep_after date.
+
+    :param download_function: download_google_data or download_yahoo_data
+    :param db_url: Dictionary of the vendor url components
+    :param csv_out: String of the CSV file with the codes that have no data
+    :param verbose: Boolean of whether to print debugging statements
+    :param record: Tuple of the tsid, the url and the keep_after date
+    :param raw_data: The data downloaded by the fetch stage
+    :return: DataFrame of the new prices
+    """
+
+    tsid, url, keep_after = record
+
+    clean_data = download_function(db_url=db_url, tsid=tsid, exchanges_df=None,
+                                   csv_out=csv_out, verbose=verbose, url=url,
+                                   raw_data=raw_data)
+
+    if keep_after is not None and len(clean_data.index) > 0:
+        # Only keep data that is after the plan's cut-off date, which
+        #   considers the days_back period when replacing data
+        clean_data = clean_data[clean_data.date > keep_after]
+
+    return clean_data
+
+
 class QuandlCodeExtract(object):
 
     def __init__(self, database, user, password, host, port, quandl_token,
@@ -59,7 +228,7 @@ class QuandlCodeExtract(object):
         # Rate limiter parameters based on Quandl API limitations
         rate = 2000
         period_sec = 600
-        self.min_interval = float((period_sec/rate)*threads)
+        self.rate_limiter = RateLimiter('quandl', rate, period_sec, threads)
 
         self.main()
 
@@ -184,28 +353,56 @@ class QuandlCodeExtract(object):
         conn.close()
         return df
 
-    def extractor(self, db_name, page_num=1):
+    def extractor(self, db_name, page_num=1, max_probes=3):
         """ For every database passed through, each page number will be
         incremented through, saving the downloaded data to the SQL table. If no
         data is returned from the download function, then all tables have been
-        downloaded for that particular database.
+        downloaded for that particular database. While the Quandl circuit
+        breaker is open, the page is retried as the probe after each cooldown;
+        once max_probes fail or the time budget runs out, the remaining pages
+        are left for the next run, which resumes from the last saved page.
 
         :param db_name: A string of the name that Quandl uses for the database
         :param page_num: An optional integer to indicate the page number to
         start on. If no page_num is provided, it is assumed that the entire
         data set needs to be downloaded. Otherwise, it is assumed that the
         data set download was interrupted and will continue downloading codes.
+        :param max_probes: Integer of the failed probes allowed before the
+        remaining pages are left for the next run
         """
 
         dl_csv_start_time = time.time()
+        breaker = vendor_breakers['quandl']
+        failed_probes = 0
         next_page = True
         while next_page:
 
-            # Rate limit this function with non-reactive timer
-            time.sleep(self.min_interval)
+            # Rate limit this function across the threads (and hosts)
+            self.rate_limiter.wait()
 
             quandl_download = QuandlDownload(self.quandl_token, self.db_url)
-            db_pg_df = quandl_download.download_quandl_codes(db_name, page_num)
+            try:
+                db_pg_df = quandl_download.download_quandl_codes(db_name,
+                                                                 page_num)
+            except CircuitOpenError as e:
+                print(e)
+                if run_budget.exhausted(wait=breaker.seconds_until_probe()):
+                    run_budget.skip(1)
+                    print('The %s codes from page %i were not downloaded '
+                          'before the time budget ran out' %
+                          (db_name, page_num))
+                    break
+                if failed_probes >= max_probes:
+                    print('The %s codes from page %i were not downloaded '
+                          'because the Quandl circuit breaker remained open. '
+                          'They will be downloaded during the next run.' %
+                          (db_name, page_num))
+                    break
+                # Wait for the cooldown, then retry the same page as the probe
+                time.sleep(breaker.seconds_until_probe())
+                failed_probes += 1
+                continue
+            failed_probes = 0
 
             if len(db_pg_df.index) == 0:  # finished downloading all pages
                 next_page = False
@@ -385,7 +582,9 @@ class QuandlDataExtraction(object):
     def __init__(self, database, user, password, host, port, quandl_token,
                  db_url, download_selection, redownload_time, data_process,
                  days_back, table, threads=2, load_tables='load_tables',
-                 verbose=False):
+                 table_url=None, batch_size=100, verbose=False,
+                 dry_run=False, checkpoint=None, cache=None, exchanges=None,
+                 exclude_exchanges=None):
         """
         :param database: String of the directory location for the SQL database.
         :param user: String of the username used to login to the database
@@ -409,7 +608,22 @@ class QuandlDataExtraction(object):
         :param threads: Integer of the number of threads the current process
             is using; used for rate limiter
         :param load_tables: String of the directory location for the load tables
+        :param table_url: Optional list of Quandl datatable API url components.
+            When provided, codes with prior prices are downloaded in
+            multi-symbol batches if their database has a datatable.
+        :param batch_size: Integer of the maximum codes per batched download
         :param verbose: Boolean of whether debugging prints should occur.
+        :param dry_run: Boolean of whether to only plan the codes, leaving
+            their summary in plan_summary, without downloading any prices
+        :param checkpoint: Optional RunCheckpoint of the current run. The
+            planned codes and the finished tsids are saved to it, and a
+            resumed run continues with the saved codes.
+        :param cache: Optional WarmCache of the daemon, which provides the
+            vendor id, the exchanges and the last prices without querying them
+        :param exchanges: Optional list of the tsid exchange symbols whose
+            codes are downloaded, used by the daemon's session group jobs
+        :param exclude_exchanges: Optional list of the tsid exchange symbols
+            whose codes aren't downloaded
         """
 
         self.database = database
@@ -419,6 +633,8 @@ class QuandlDataExtraction(object):
         self.port = port
         self.quandl_token = quandl_token
         self.db_url = db_url
+        self.table_url = table_url
+        self.batch_size = batch_size
         self.download_selection = download_selection
         self.redownload_time = redownload_time
         self.data_process = data_process
@@ -426,6 +642,19 @@ class QuandlDataExtraction(object):
         self.threads = threads
         self.table = table
         self.verbose = verbose
+        self.dry_run = dry_run
+        self.cache = cache
+        self.exchanges = exchanges
+        self.exclude_exchanges = exclude_exchanges
+
+        # The items, calls and rows of the planned codes; set by main
+        self.plan_summary = None
+
+        # The checkpoint of this extractor within the run
+        self.stage = None
+        if checkpoint:
+            self.stage = checkpoint.stage('quandl_%s_%s' % (
+                self.download_selection, self.table))
 
         # Rate limiter parameters based on Quandl API limitations
         #   Anonymous: 20 calls per 10 min; 1 active call
@@ -433,7 +662,7 @@ class QuandlDataExtraction(object):
         #   Premium subscriber:  5000 calls per 10 min; no concurrent limit
         rate = 2000
         period_sec = 600
-        self.min_interval = float((period_sec/rate)*threads)
+        self.rate_limiter = RateLimiter('quandl', rate, period_sec, threads)
 
         self.csv_wo_data = load_tables + '/quandl_' + self.table+'_wo_data.csv'
 
@@ -441,40 +670,140 @@ class QuandlDataExtraction(object):
         #   Quandl data vendor IDs because that prevents data being downloaded
         #   for the same tsid but from different Quandl sources (e.g. wiki; eod)
         if self.download_selection[:4] == 'wiki':
-            self.vendor_id = query_data_vendor_id(
-                database=self.database, user=self.user, password=self.password,
-                host=self.host, port=self.port, name='Quandl_WIKI')
+            self.vendor_id = cached(
+                cache, ('vendor_id', 'Quandl_WIKI'),
+                lambda: query_data_vendor_id(
+                    database=self.database, user=self.user,
+                    password=self.password, host=self.host, port=self.port,
+                    name='Quandl_WIKI'))
             self.q_selection = 'Quandl WIKI'
         elif self.download_selection[:3] == 'eod':
-            self.vendor_id = query_data_vendor_id(
-                database=self.database, user=self.user, password=self.password,
-                host=self.host, port=self.port, name='Quandl_EOD')
+            self.vendor_id = cached(
+                cache, ('vendor_id', 'Quandl_EOD'),
+                lambda: query_data_vendor_id(
+                    database=self.database, user=self.user,
+                    password=self.password, host=self.host, port=self.port,
+                    name='Quandl_EOD'))
             self.q_selection = 'Quandl EOD'
         elif self.download_selection[:4] == 'goog':
-            self.vendor_id = query_data_vendor_id(
-                database=self.database, user=self.user, password=self.password,
-                host=self.host, port=self.port, name='Quandl_GOOG')
+            self.vendor_id = cached(
+                cache, ('vendor_id', 'Quandl_GOOG'),
+                lambda: query_data_vendor_id(
+                    database=self.database, user=self.user,
+                    password=self.password, host=self.host, port=self.port,
+                    name='Quandl_GOOG'))
             self.q_selection = 'Quandl GOOG'
         else:
             raise NotImplementedError('The %s Quandl source is not implemented '
                                       'in the init within QuandlDataExtraction'
                                       % self.download_selection)
 
-        print('Retrieving dates of the last price per ticker for all %s values'
-              % self.q_selection)
-        # Creates a DataFrame with the last price for each Quandl code
-        self.latest_prices = query_last_price(
+        # The Quandl datatable that can provide many codes' prices in one call
+        self.datatable = None
+        if self.table_url:
+            q_database = self.q_selection[self.q_selection.find(' ') + 1:]
+            self.datatable = quandl_datatables.get(q_database)
+
+        if self.stage and self.stage.has_plan():
+            # The checkpoint has the last prices of the planned codes
+            self.latest_prices = self.stage.load_plan()['latest_prices']
+        else:
+            print('Retrieving dates of the last price per ticker for all %s '
+                  'values' % self.q_selection)
+            # Creates a DataFrame with the last price for each Quandl code
+            self.latest_prices = cached(
+                cache, ('last_price', self.table, self.vendor_id),
+                lambda: query_last_price(
+                    database=self.database, user=self.user,
+                    password=self.password, host=self.host, port=self.port,
+                    table=self.table, vendor_id=self.vendor_id))
+
+        # The codes are written within the worker processes, so each result is
+        #   saved as it is recorded
+        self.refresh_history = RefreshHistory(
             database=self.database, user=self.user, password=self.password,
-            host=self.host, port=self.port, table=self.table,
-            vendor_id=self.vendor_id)
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table, flush_size=1)
 
         self.main()
 
+        if cache:
+            # The prices were written by the worker processes, so the cached
+            #   last prices are queried again by the next run
+            cache.invalidate('last_price', self.table, self.vendor_id)
+
     def main(self):
         """This is used to execute subsequent methods in the correct order"""
 
         start_time = time.time()
 
+        if self.stage and self.stage.has_plan():
+            # Continue the checkpoint's codes, skipping the finished tsids
+            plan = self.stage.load_plan()
+            batch_items = self.stage.remaining(plan['batch_items'])
+            q_code_list = self.stage.remaining(plan['q_code_list'])
+        else:
+            batch_items, q_code_list = self.plan_codes()
+            if self.stage:
+                planned_tsids = [item[0] for item in batch_items + q_code_list]
+                self.stage.save_plan({
+                    'batch_items': batch_items, 'q_code_list': q_code_list,
+                    'latest_prices': self.latest_prices[
+                        self.latest_prices.index.isin(planned_tsids)]})
+
+        batches = []
+        if batch_items:
+            batches = plan_download_batches(
+                batch_items, max_rows=quandl_datatable_row_cap,
+                max_items=self.batch_size)
+
+        planned_tsids = pd.Series([item[0] for item in
+                                   batch_items + q_code_list], dtype=object)
+        self.plan_summary = {
+            'items': len(batch_items) + len(q_code_list),
+            'calls': len(batches) + len(q_code_list),
+            'rows': estimate_plan_rows(
+                planned_tsids.map(self.latest_prices['date']))}
+        if self.dry_run:
+            return
+
+        if batch_items:
+            print('%s %s codes will be downloaded within %s multi-symbol '
+                  'requests from the %s datatable.'
+                  % ('{:,}'.format(len(batch_items)), self.q_selection,
+                     '{:,}'.format(len(batches)), self.datatable))
+
+            multithread_with_breaker(self.batch_extractor, batches,
+                                     self.threads, vendor_breakers['quandl'])
+
+        """ This runs the program with no multiprocessing or threading.
+        To run, make sure to comment out all pool processes.
+        Takes about 55 seconds for 10 tickers; 5.5 seconds per ticker. """
+        # [self.extractor(q_code) for q_code in q_code_list]
+
+        """ This runs the program with multiprocessing or threading.
+        Comment and uncomment the type of multiprocessing in the
+        multi-thread function above to change the type. Change the number
+        of threads below to alter the speed of the downloads. If the
+        query runs out of items, try lowering the number of threads."""
+        multithread_with_breaker(self.extractor, q_code_list, self.threads,
+                                 vendor_breakers['quandl'])
+
+        # A run stopped by its time budget can be resumed from its checkpoint
+        if self.stage and not run_budget.stopped_early():
+            self.stage.mark_complete()
+
+        print('The %s price extraction took %0.2f seconds to complete' %
+              (self.q_selection, time.time() - start_time))
+
+    def plan_codes(self):
+        """Determine which Quandl codes need to be downloaded.
+
+        :return: Tuple of the list of (tsid, Quandl code, beg_date) items that
+            will be downloaded in datatable batches, and the list of (tsid,
+            Quandl code) items that will be downloaded by themselves
+        """
+
         print('Analyzing the %s codes that will be downloaded' %
               self.q_selection)
         # Create a list of securities to download
@@ -510,12 +839,24 @@ class QuandlDataExtraction(object):
                 writer = csv.writer(f, delimiter=',')
                 writer.writerow(('q_code', 'date_tried'))
 
-        # The cut-off time for when code data can be re-downloaded
-        beg_date_obj = (datetime.now(timezone.utc) -
-                        timedelta(seconds=self.redownload_time))
-        # For the final download list, only include new and non-recent codes
-        q_codes_final = q_codes_df[(q_codes_df['updated_date'] < beg_date_obj) |
-                                   (q_codes_df['updated_date'].isnull())]
+        # Skip the codes that can't have new bars since their last price
+        planner = DownloadPlanner(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, cache=self.cache)
+        q_codes_df = planner.select(
+            q_codes_df, self.latest_prices, self.table,
+            exchanges=self.exchanges,
+            exclude_exchanges=self.exclude_exchanges)
+
+        # For the final download list, only include new codes and the codes
+        #   whose refresh interval has passed; the interval backs off for the
+        #   codes whose recent downloads had no new prices
+        refresh_df = query_refresh_history(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table)
+        q_codes_final = due_codes(codes_df=q_codes_df, refresh_df=refresh_df,
+                                  redownload_time=self.redownload_time)
 
         # Change the DF to a list of tuples containing tsid and q_code
         q_code_set = q_codes_final[['tsid', 'q_code']]
@@ -525,32 +866,35 @@ class QuandlDataExtraction(object):
         dl_codes = len(q_codes_final.index)
         total_codes = len(q_codes_df.index)
         print('%s %s codes out of %s requested codes will be downloaded.\n'
-              '%s codes were last updated within the %s second limit.'
+              '%s codes were last updated within the %s second limit or '
+              'their backed off refresh interval.'
               % ('{:,}'.format(dl_codes), '{:,}'.format(total_codes),
                  self.q_selection,
                  '{:,}'.format(total_codes - dl_codes),
                  '{:,}'.format(self.redownload_time)))
 
-        """ This runs the program with no multiprocessing or threading.
-        To run, make sure to comment out all pool processes.
-        Takes about 55 seconds for 10 tickers; 5.5 seconds per ticker. """
-        # [self.extractor(q_code) for q_code in q_code_list]
-
-        """ This runs the program with multiprocessing or threading.
-        Comment and uncomment the type of multiprocessing in the
-        multi-thread function above to change the type. Change the number
-        of threads below to alter the speed of the downloads. If the
-        query runs out of items, try lowering the number of threads."""
-        multithread(self.extractor, q_code_list, threads=self.threads)
+        batch_items = []
+        if self.datatable:
+            # Codes with prior prices only need their recent prices, which the
+            #   datatable API provides for many codes within a single call
+            single_codes = []
+            for tsid, q_code in q_code_list:
+                if tsid in self.latest_prices.index:
+                    batch_items.append((tsid, q_code,
+                                        self.download_beg_date(tsid)))
+                else:
+                    single_codes.append((tsid, q_code))
+            q_code_list = single_codes
 
-        print('The %s price extraction took %0.2f seconds to complete' %
-              (self.q_selection, time.time() - start_time))
+        return batch_items, q_code_list
 
     def extractor(self, codes):
         """Takes the Quandl code, downloads the historical data, and then saves
         the data into the database.
 
         :param codes: Tuple of strings containing the tsid and Quandl code
+        :return: The codes tuple if the download was skipped because the Quandl
+            circuit breaker is open, otherwise None
         """
 
         main_time_start = time.time()
@@ -558,8 +902,16 @@ class QuandlDataExtraction(object):
         tsid = codes[0]
         q_code = codes[1]
 
-        # Rate limit this function with non-reactive timer
-        time.sleep(self.min_interval)
+        # Fail fast while Quandl is unavailable; the code will be retried.
+        #   Once the time budget runs out, the code is left for the next run.
+        if vendor_breakers['quandl'].is_open() or run_budget.exhausted():
+            return codes
+
+        if self.stage:
+            self.stage.start(tsid)
+
+        # Rate limit this function across the threads (and hosts)
+        self.rate_limiter.wait()
 
         quandl_download = QuandlDownload(self.quandl_token, self.db_url)
 
@@ -573,8 +925,12 @@ class QuandlDataExtraction(object):
                 host=self.host, port=self.port, tsid=tsid)
 
             # Download the quandl data, cleaning it and put into a DataFrame
-            clean_data = quandl_download.download_quandl_data(
-                q_code=q_code, csv_out=self.csv_wo_data, beg_date=start_date)
+            try:
+                clean_data = quandl_download.download_quandl_data(
+                    q_code=q_code, csv_out=self.csv_wo_data,
+                    beg_date=start_date)
+            except CircuitOpenError:
+                return codes
 
             # There is not new data, so do nothing to the database
             if len(clean_data.index) == 0 and self.verbose:
@@ -595,6 +951,10 @@ class QuandlDataExtraction(object):
                     print('Updated %s | %0.1f seconds' %
                           (q_code, time.time() - main_time_start))
 
+            self.refresh_history.record(tsid, len(clean_data.index) > 0)
+            if self.stage:
+                self.stage.done(tsid)
+
         # The pricing database has prior values; append/replace new data points
         else:
             try:
@@ -617,69 +977,186 @@ class QuandlDataExtraction(object):
                     # DataFrame of only the new data
                     clean_data = raw_data[raw_data.date > last_date]
 
+            except CircuitOpenError:
+                return codes
             except Exception as e:
                 print('Failed to determine what data is new for %s in '
                       'QuandlDataExtraction.extractor' % q_code)
                 print(e)
                 return
 
-            # There is not new data, so do nothing to the database
-            if len(clean_data.index) == 0 and self.verbose:
-                print('No update for %s | %0.1f seconds' %
-                      (q_code, time.time() - main_time_start))
-            # There is new data to add to the database
-            else:
-                clean_data.insert(0, 'data_vendor_id', self.vendor_id)
-                clean_data.insert(1, 'source', 'tsid')
-                clean_data.insert(2, 'source_id', tsid)
+            self.replace_prices(tsid, q_code, clean_data, main_time_start)
 
-                # If replacing existing data, delete the overlapping data points
-                if self.data_process == 'replace' and self.days_back:
-                    # Data should be newest to oldest; gets the oldest date, as
-                    #   any date between that and the latest date need to be
-                    #   deleted before the new data can be added.
-                    first_date_iso = clean_data['date'].min()
+    def batch_extractor(self, batch):
+        """Downloads the recent prices for multiple Quandl codes from the
+        Quandl datatable API in a single call, and then saves each code's new
+        data into the database.
 
-                    # NOTE: Query susceptible to sql injection attacks
-                    query = ("""DELETE FROM %s
-                             WHERE source_id='%s' AND source='tsid'
-                             AND date>='%s'
-                             AND data_vendor_id='%s'""" %
-                             (self.table, tsid, first_date_iso, self.vendor_id))
+        :param batch: List of tuples containing the tsid, Quandl code and the
+            first date (YYYY-MM-DD) whose prices should be kept
+        :return: List of the batch items that were skipped because the Quandl
+            circuit breaker is open or the batch download failed, otherwise
+            None
+        """
 
-                    del_success = 'failure'
-                    retry_count = 5
-                    while retry_count > 0:
-                        del_success = delete_sql_table_rows(
-                            database=self.database, user=self.user,
-                            password=self.password, host=self.host,
-                            port=self.port, query=query, table=self.table,
-                            item=tsid)
+        main_time_start = time.time()
 
-                        if del_success == 'failure':
-                            retry_count -= 1
-                        elif del_success == 'success':
-                            break
+        # Fail fast while Quandl is unavailable; the batch will be retried.
+        #   Once the time budget runs out, the batch is left for the next run.
+        if vendor_breakers['quandl'].is_open() or run_budget.exhausted():
+            return batch
 
-                    # Not able to delete existing data, so skip ticker for now
-                    if del_success == 'failure':
-                        return
+        if self.stage:
+            for tsid, q_code, beg_date in batch:
+                self.stage.start(tsid)
 
-                # Append the new data to the end, regardless of replacement
-                df_to_sql(database=self.database, user=self.user,
-                          password=self.password, host=self.host,
-                          port=self.port, df=clean_data,
-                          sql_table=self.table, exists='append', item=tsid)
+        # Rate limit this function across the threads (and hosts)
+        self.rate_limiter.wait()
+
+        quandl_download = QuandlDownload(self.quandl_token, self.table_url)
+
+        tickers = [q_code[q_code.find('/') + 1:] for tsid, q_code, beg_date
+                   in batch]
+        batch_beg_date = min([beg_date for tsid, q_code, beg_date in batch])
+        try:
+            data, truncated = quandl_download.download_quandl_table_data(
+                datatable=self.datatable, tickers=tickers,
+                beg_date=batch_beg_date)
+        except CircuitOpenError:
+            return batch
+        except Exception as e:
+            print('Failed to download the batch of %i codes starting with %s '
+                  'in QuandlDataExtraction.batch_extractor' %
+                  (len(batch), batch[0][1]))
+            print(e)
+            # Retry the batch like a skipped one, so its codes are either
+            #   downloaded or reported as left for the next run
+            return batch
+
+        skipped = []
+        for tsid, q_code, beg_date in batch:
+            ticker = q_code[q_code.find('/') + 1:]
+
+            if ticker in truncated:
+                # Too many rows for the datatable; download the code by itself
+                if self.extractor((tsid, q_code)) is not None:
+                    skipped.append((tsid, q_code, beg_date))
+                continue
+
+            raw_data = data.get(ticker)
+            if raw_data is None:
                 if self.verbose:
-                    print('Updated %s | %0.1f seconds' %
+                    print('No update for %s | %0.1f seconds' %
                           (q_code, time.time() - main_time_start))
+                self.refresh_history.record(tsid, False)
+                if self.stage:
+                    self.stage.done(tsid)
+                continue
+
+            # The batch starts with the earliest date of all of its codes, so
+            #   only keep the data after this code's own start date
+            clean_data = raw_data[raw_data['date'] >= beg_date].copy()
+
+            self.replace_prices(tsid, q_code, clean_data, main_time_start)
+
+        if skipped:
+            return skipped
+
+    def download_beg_date(self, tsid):
+        """Determine the first date whose prices should be downloaded for a
+        tsid that has prior prices in the database.
+
+        :param tsid: String of the tsid
+        :return: String of the date (YYYY-MM-DD)
+        """
+
+        last_date = self.latest_prices.loc[tsid, 'date']
+        if self.data_process == 'replace' and self.days_back:
+            beg_date_obj = last_date - timedelta(days=self.days_back)
+        else:
+            # Only the prices after the latest existing data point are new
+            beg_date_obj = last_date + timedelta(days=1)
+        return beg_date_obj.strftime('%Y-%m-%d')
+
+    def replace_prices(self, tsid, q_code, clean_data, main_time_start):
+        """Saves the new prices for a tsid that has prior prices into the
+        database. If replacing existing data, the overlapping prices are
+        deleted before the new prices are added.
+
+        :param tsid: String of the tsid
+        :param q_code: String of the Quandl code
+        :param clean_data: DataFrame of the new prices
+        :param main_time_start: Float of when the tsid processing started
+        """
+
+        changed = has_new_prices(
+            clean_data, last_price_date(self.latest_prices, tsid))
+
+        # There is not new data, so do nothing to the database
+        if len(clean_data.index) == 0:
+            if self.verbose:
+                print('No update for %s | %0.1f seconds' %
+                      (q_code, time.time() - main_time_start))
+        # There is new data to add to the database
+        else:
+            clean_data.insert(0, 'data_vendor_id', self.vendor_id)
+            clean_data.insert(1, 'source', 'tsid')
+            clean_data.insert(2, 'source_id', tsid)
+
+            # If replacing existing data, delete the overlapping data points
+            if self.data_process == 'replace' and self.days_back:
+                # Data should be newest to oldest; gets the oldest date, as
+                #   any date between that and the latest date need to be
+                #   deleted before the new data can be added.
+                first_date_iso = clean_data['date'].min()
+
+                # NOTE: Query susceptible to sql injection attacks
+                query = ("""DELETE FROM %s
+                         WHERE source_id='%s' AND source='tsid'
+                         AND date>='%s'
+                         AND data_vendor_id='%s'""" %
+                         (self.table, tsid, first_date_iso, self.vendor_id))
+
+                del_success = 'failure'
+                retry_count = 5
+                while retry_count > 0:
+                    del_success = delete_sql_table_rows(
+                        database=self.database, user=self.user,
+                        password=self.password, host=self.host,
+                        port=self.port, query=query, table=self.table,
+                        item=tsid)
+
+                    if del_success == 'failure':
+                        retry_count -= 1
+                    elif del_success == 'success':
+                        break
+
+                # Not able to delete existing data, so skip ticker for now
+                if del_success == 'failure':
+                    return
+
+            # Append the new data to the end, regardless of replacement
+            df_to_sql(database=self.database, user=self.user,
+                      password=self.password, host=self.host,
+                      port=self.port, df=clean_data,
+                      sql_table=self.table, exists='append', item=tsid)
+            if self.verbose:
+                print('Updated %s | %0.1f seconds' %
+                      (q_code, time.time() - main_time_start))
+
+        self.refresh_history.record(tsid, changed)
+        if self.stage:
+            self.stage.done(tsid)
 
 
 class GoogleFinanceDataExtraction(object):
 
     def __init__(self, database, user, password, host, port, db_url,
                  download_selection, redownload_time, data_process, days_back,
-                 threads, table, load_tables='load_tables', verbose=True):
+                 threads, table, load_tables='load_tables', verbose=True,
+                 dry_run=False, parsers=None, writers=2, checkpoint=None,
+                 cache=None, role=None, worker_id=None, claim_size=50,
+                 lease_seconds=300, exchanges=None, exclude_exchanges=None):
         """
         :param database: String of the directory location for the SQL database.
         :param user: String of the username used to login to the database
@@ -697,12 +1174,37 @@ class GoogleFinanceDataExtraction(object):
             'append' or 'replace'.
         :param days_back: Integer of the number of days where any existing
             data should be replaced with newer prices
-        :param threads: Integer of the number of threads the current process
-            is using; used for rate limiter
+        :param threads: Integer of the number of fetch threads the current
+            process is using; used for rate limiter
         :param table: String indicating which table the DataFrame should be
             put into.
         :param load_tables: String of the directory location for the load tables
         :param verbose: Boolean of whether debugging prints should occur.
+        :param dry_run: Boolean of whether to only save the request plan to a
+            CSV file in the load_tables directory, and its summary to
+            plan_summary, without downloading data
+        :param parsers: Integer of the processes that parse the downloaded
+            data; defaults to the CPU cores
+        :param writers: Integer of the threads that save the prices to the
+            database
+        :param checkpoint: Optional RunCheckpoint of the current run. The
+            planned records and the finished tsids are saved to it, and a
+            resumed run continues with the saved records.
+        :param cache: Optional WarmCache of the daemon, which provides the
+            vendor id, the exchanges and the last prices without querying them
+        :param role: Optional string of the distributed role; the
+            coordinator only queues the work items, while the worker downloads
+            the items it claims from the queue. By default, the extractor
+            queues and downloads the items itself.
+        :param worker_id: Optional string identifying the worker; defaults to
+            the host name and process id
+        :param claim_size: Integer of the work items a worker claims at once
+        :param lease_seconds: Integer of the seconds a claimed item stays
+            leased to the worker without a heartbeat
+        :param exchanges: Optional list of the tsid exchange symbols whose
+            codes are downloaded, used by the daemon's session group jobs
+        :param exclude_exchanges: Optional list of the tsid exchange symbols
+            whose codes aren't downloaded
         """
 
         self.database = database
@@ -718,30 +1220,80 @@ class GoogleFinanceDataExtraction(object):
         self.threads = threads
         self.table = table
         self.verbose = verbose
+        self.dry_run = dry_run
+        self.parsers = parsers
+        self.writers = writers
+        self.cache = cache
+        self.role = role
+        self.worker_id = worker_id or default_worker_id()
+        self.claim_size = claim_size
+        self.lease_seconds = lease_seconds
+        self.exchanges = exchanges
+        self.exclude_exchanges = exclude_exchanges
+
+        # The items, calls and rows of the planned records; set by main
+        self.plan_summary = None
+
+        # The checkpoint of this extractor within the run
+        self.stage = None
+        if checkpoint:
+            self.stage = checkpoint.stage('goog_%s_%s' % (
+                self.download_selection, self.table))
 
         # Rate limiter parameters based on guessed Google Finance limitations
         # Received captcha if too fast (about 2000 queries within x seconds)
         rate = 60       # Received captcha at 70/60s
         period_sec = 60
-        self.min_interval = float((period_sec/rate)*threads)
+        self.rate_limiter = RateLimiter('google', rate, period_sec, threads)
 
-        self.vendor_id = query_data_vendor_id(
-            database=self.database, user=self.user, password=self.password,
-            host=self.host, port=self.port, name='Google_Finance')
+        self.vendor_id = cached(
+            cache, ('vendor_id', 'Google_Finance'),
+            lambda: query_data_vendor_id(
+                database=self.database, user=self.user,
+                password=self.password, host=self.host, port=self.port,
+                name='Google_Finance'))
 
         self.csv_wo_data = load_tables + '/goog_' + self.table + '_wo_data.csv'
+        self.csv_plan = load_tables + '/goog_' + self.table + '_plan.csv'
 
-        print('Retrieving dates for the last Google prices per ticker...')
-        # Creates a DataFrame with the last price for each security
-        self.latest_prices = query_last_price(
-            database=self.database, user=self.user, password=self.password,
-            host=self.host, port=self.port, table=self.table,
-            vendor_id=self.vendor_id)
+        if self.stage and self.stage.has_plan():
+            # The checkpoint has the last prices of the planned records, which
+            #   tell the refresh history whether the resumed downloads changed
+            self.latest_prices = self.stage.load_plan()['latest_prices']
+        else:
+            print('Retrieving dates for the last Google prices per ticker...')
+            # Creates a DataFrame with the last price for each security
+            self.latest_prices = cached(
+                cache, ('last_price', self.table, self.vendor_id),
+                lambda: query_last_price(
+                    database=self.database, user=self.user,
+                    password=self.password, host=self.host, port=self.port,
+                    table=self.table, vendor_id=self.vendor_id))
 
         # Build a DataFrame with all the exchange symbols
-        self.exchanges_df = self.query_exchanges()
+        self.exchanges_df = cached(cache, ('exchanges', 'goog'),
+                                   self.query_exchanges)
+
+        self.refresh_history = RefreshHistory(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table)
+
+        # The finished tsids are removed from the work queue in batches
+        self.completed_work = CompletedWork(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table)
+
+        # Selects the codes to plan, and finds each exchange's last closed
+        #   session for removing the partial daily bars before their writes
+        self.planner = DownloadPlanner(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, cache=cache)
 
         self.main()
+        self.refresh_history.flush()
+        self.completed_work.flush()
 
     def main(self):
         """
@@ -751,6 +1303,62 @@ class GoogleFinanceDataExtraction(object):
 
         start_time = time.time()
 
+        if self.role == 'worker':
+            claimed = run_claimed_work(self, 'google')
+            print('%s finished %s claimed items in %0.2f seconds' %
+                  (self.worker_id, '{:,}'.format(claimed),
+                   time.time() - start_time))
+            return
+
+        if self.stage and self.stage.has_plan():
+            # Continue the checkpoint's records, skipping the finished tsids
+            records = self.stage.remaining(self.stage.load_plan()['records'])
+            self.plan_summary = {'items': len(records),
+                                 'calls': len(records), 'rows': None}
+        else:
+            records = self.plan_records()
+            if records is None:
+                return      # Dry run
+            if self.role == 'coordinator':
+                print('%s items were queued for the workers' %
+                      '{:,}'.format(len(records)))
+                return
+            if self.stage:
+                planned_tsids = [record[0] for record in records]
+                self.stage.save_plan({
+                    'records': records,
+                    'latest_prices': self.latest_prices[
+                        self.latest_prices.index.isin(planned_tsids)]})
+
+        """This runs the program with no multiprocessing or threading.
+        To run, make sure to comment out all pool processes below.
+        Takes about 55 seconds for 10 tickers; 5.5 seconds per ticker."""
+        # [self.extractor(record) for record in records]
+
+        """This runs the program as a pipeline, with the fetch threads
+        downloading the data, a process pool parsing it and the write threads
+        saving it to the database. Change the number of threads to alter the
+        speed of the downloads. If the query runs out of items, try lowering
+        the number of threads."""
+        multithread_with_breaker(self.extractor, records, self.threads,
+                                 vendor_breakers['google'],
+                                 runner=self.run_pipeline)
+
+        # A run stopped by its time budget can be resumed from its checkpoint
+        if self.stage and not run_budget.stopped_early():
+            self.stage.mark_complete()
+
+        print('The price extraction took %0.2f seconds to complete' %
+              (time.time() - start_time))
+
+    def plan_records(self):
+        """ Determine which tsids need to be downloaded, and build their
+        request plan records.
+
+        :return: List of the (tsid, url, keep_after) records, or None if only
+            the request plan was saved (dry run)
+        """
+
         print('Analyzing the tsid codes that will be downloaded...')
         # Create a list of securities to download
         code_df = query_codes(database=self.database, user=self.user,
@@ -787,40 +1395,62 @@ class GoogleFinanceDataExtraction(object):
                 writer = csv.writer(f, delimiter=',')
                 writer.writerow(('tsid', 'date_tried'))
 
-        # The cut-off time for when code data can be re-downloaded
-        beg_date_obj = (datetime.now(timezone.utc) -
-                        timedelta(seconds=self.redownload_time))
-        # Final download list should include both new/null and non-recent codes
-        codes_final = codes_df[(codes_df['updated_date'] < beg_date_obj) |
-                               (codes_df['updated_date'].isnull())]
+        # Skip the codes that can't have new bars since their last price
+        codes_df = self.planner.select(
+            codes_df, self.latest_prices, self.table,
+            exchanges=self.exchanges,
+            exclude_exchanges=self.exclude_exchanges)
+
+        # Final download list should include both new/null codes and the codes
+        #   whose refresh interval has passed; the interval backs off for the
+        #   codes whose recent downloads had no new prices
+        refresh_df = query_refresh_history(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table)
+        codes_final = due_codes(codes_df=codes_df, refresh_df=refresh_df,
+                                redownload_time=self.redownload_time)
+
+        # Score the codes by staleness and liquidity in the work queue, then
+        #   pull them back with the most valuable updates first
+        code_list = prioritize_work(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table, tsids=codes_final['tsid'].values.flatten(),
+            latest_prices=self.latest_prices,
+            redownload_time=self.redownload_time, dry_run=self.dry_run)
+
+        # Derive every url and the date after which the downloaded prices are
+        #   new in one vectorized pass, instead of within each extractor call
+        plan = build_request_plan(
+            tsids=code_list, exchanges_df=self.exchanges_df,
+            db_url=self.db_url, vendor='google',
+            latest_prices=self.latest_prices, data_process=self.data_process,
+            days_back=self.days_back)
+
+        self.plan_summary = {'items': len(plan.index),
+                             'calls': len(plan.index),
+                             'rows': estimate_plan_rows(plan['last_date'])}
+
+        if self.dry_run:
+            save_request_plan(plan=plan, csv_out=self.csv_plan)
+            return
 
-        # Change the DF to a list
-        code_list = codes_final['tsid'].values.flatten()
+        # Each record is a tuple of (tsid, url, keep_after)
+        records = [tuple(record) for record in
+                   plan[['tsid', 'url', 'keep_after']].values]
 
         # Inform the user how many codes will be updated
         dl_codes = len(codes_final.index)
         total_codes = len(codes_df.index)
         print('%s tsid codes out of %s requested codes will have Google '
               'finance %s data downloaded.\n%s codes were last updated within '
-              'the %s second limit.'
+              'the %s second limit or their backed off refresh interval.'
               % ('{:,}'.format(dl_codes), '{:,}'.format(total_codes),
                  self.table, '{:,}'.format(total_codes - dl_codes),
                  '{:,}'.format(self.redownload_time)))
 
-        """This runs the program with no multiprocessing or threading.
-        To run, make sure to comment out all pool processes below.
-        Takes about 55 seconds for 10 tickers; 5.5 seconds per ticker."""
-        # [self.extractor(tsid) for tsid in code_list]
-
-        """This runs the program with multiprocessing or threading.
-        Comment and uncomment the type of multiprocessing in the
-        multi-thread function above to change the type. Change the number
-        of threads below to alter the speed of the downloads. If the
-        query runs out of items, try lowering the number of threads."""
-        multithread(self.extractor, code_list, threads=self.threads)
-
-        print('The price extraction took %0.2f seconds to complete' %
-              (time.time() - start_time))
+        return records
 
     def query_exchanges(self):
         """ Retrieve the exchange symbols for goog and tsid, which will be used
@@ -862,30 +1492,89 @@ class GoogleFinanceDataExtraction(object):
         conn.close()
         return df
 
-    def extractor(self, tsid):
-        """ Takes the tsid symbol, downloads the historical data, and then
-        saves the data into the SQLite database.
+    def run_pipeline(self, records):
+        """ Run the records through the fetch, parse and write pipeline.
 
-        :param tsid: String of the tsid
-        :return: Nothing. It saves the price data in the SQLite Database.
+        :param records: List of the request plan records
+        :return: List of the record results from the write stage
         """
 
-        main_time_start = time.time()
+        parse = partial(parse_vendor_prices, download_google_data, self.db_url,
+                        self.csv_wo_data, self.verbose)
+        return pipeline(records, fetch=self.fetch, parse=parse,
+                        write=self.write, fetchers=self.threads,
+                        parsers=self.parsers, writers=self.writers)
+
+    def extractor(self, record):
+        """ Takes the tsid's request plan record, downloads the historical
+        data, and then saves the data into the database. Runs each pipeline
+        stage for the single record.
+
+        :param record: Tuple of the tsid, the url and the ISO date after which
+            the downloaded prices are kept (None if there are no prior prices)
+        :return: The record if the download was skipped because the Google
+            Finance circuit breaker is open, otherwise None. The price data
+            is saved in the database.
+        """
 
-        # Rate limit this function with non-reactive timer
-        time.sleep(self.min_interval)
+        raw_data = self.fetch(record)
+        if raw_data is None:
+            return
+        elif isinstance(raw_data, EndItem):
+            return raw_data.value
 
-        # The ticker has no prior price; add all the downloaded data
-        if tsid not in self.latest_prices.index:
-            clean_data = download_google_data(db_url=self.db_url, tsid=tsid,
-                                              exchanges_df=self.exchanges_df,
-                                              csv_out=self.csv_wo_data)
+        clean_data = parse_vendor_prices(download_google_data, self.db_url,
+                                         self.csv_wo_data, self.verbose,
+                                         record, raw_data)
+        return self.write(record, clean_data)
 
+    def fetch(self, record):
+        """ The fetch stage, which downloads the record's url.
+
+        :param record: Tuple of the tsid, the url and the keep_after date
+        :return: The downloaded data, or an EndItem with the record if the
+            download was skipped because the Google Finance circuit breaker is
+            open
+        """
+
+        tsid, url, keep_after = record
+
+        # Fail fast while Google Finance is unavailable; retry the tsid later.
+        #   Once the time budget runs out, the tsid is left for the next run.
+        if vendor_breakers['google'].is_open() or run_budget.exhausted():
+            return EndItem(record)
+
+        if self.stage:
+            self.stage.start(tsid)
+
+        # Rate limit this function across the threads (and hosts)
+        self.rate_limiter.wait()
+
+        try:
+            return fetch_google_data(url, tsid)
+        except CircuitOpenError:
+            return EndItem(record)
+
+    def write(self, record, clean_data):
+        """ The write stage, which saves the new prices to the database.
+
+        :param record: Tuple of the tsid, the url and the keep_after date
+        :param clean_data: DataFrame of the new prices from the parse stage
+        """
+
+        tsid, url, keep_after = record
+        if self.table == 'daily_prices':
+            # The bar of a session that hasn't closed is still changing
+            clean_data = self.planner.complete_bars(tsid, clean_data)
+        changed = has_new_prices(
+            clean_data, last_price_date(self.latest_prices, tsid))
+
+        # The ticker has no prior price; add all the downloaded data
+        if keep_after is None:
             # There is no new data, so do nothing to the database
             if len(clean_data.index) == 0:
                 if self.verbose:
-                    print('No data for %s | %0.1f seconds' %
-                          (tsid, time.time() - main_time_start))
+                    print('No data for %s' % tsid)
             # There is new data to add to the database
             else:
                 clean_data.insert(0, 'data_vendor_id', self.vendor_id)
@@ -898,36 +1587,14 @@ class GoogleFinanceDataExtraction(object):
                           exists='append', item=tsid)
 
                 if self.verbose:
-                    print('Updated %s | %0.1f seconds' %
-                          (tsid, time.time() - main_time_start))
+                    print('Updated %s' % tsid)
 
         # The pricing database has prior values; append/replace new data points
         else:
-            try:
-                last_date = self.latest_prices.loc[tsid, 'date']
-                raw_data = download_google_data(db_url=self.db_url, tsid=tsid,
-                                                exchanges_df=self.exchanges_df,
-                                                csv_out=self.csv_wo_data)
-
-                # Only keep data that is after the days_back period
-                if self.data_process == 'replace' and self.days_back:
-                    beg_date = (last_date - timedelta(days=self.days_back))
-                    clean_data = raw_data[raw_data.date > beg_date.isoformat()]
-
-                # Only keep data that is after the latest existing data point
-                else:
-                    clean_data = raw_data[raw_data.date > last_date]
-            except Exception as e:
-                print('Failed to determine what data is new for %s in extractor'
-                      % tsid)
-                print(e)
-                return
-
             # There is not new data, so do nothing to the database
             if len(clean_data.index) == 0:
                 if self.verbose:
-                    print('No update for %s | %0.1f seconds' %
-                          (tsid, time.time() - main_time_start))
+                    print('No update for %s' % tsid)
             # There is new data to add to the database
             else:
                 clean_data.insert(0, 'data_vendor_id', self.vendor_id)
@@ -977,15 +1644,29 @@ class GoogleFinanceDataExtraction(object):
                           exists='append', item=tsid)
 
                 if self.verbose:
-                    print('Updated %s | %0.1f seconds' %
-                          (tsid, time.time() - main_time_start))
+                    print('Updated %s' % tsid)
+
+        if self.cache and len(clean_data.index) > 0:
+            # Keep the daemon's last prices current without querying them
+            self.cache.update_last_price(self.table, self.vendor_id, tsid,
+                                         clean_data['date'].max())
+
+        self.refresh_history.record(tsid, changed)
+
+        # The tsid is done, so remove it from the work queue
+        self.completed_work.record(tsid)
+        if self.stage:
+            self.stage.done(tsid)
 
 
 class YahooFinanceDataExtraction(object):
 
     def __init__(self, database, user, password, host, port, db_url,
                  download_selection, redownload_time, data_process, days_back,
-                 threads, table, load_tables='load_tables', verbose=True):
+                 threads, table, load_tables='load_tables', verbose=True,
+                 dry_run=False, parsers=None, writers=2, checkpoint=None,
+                 cache=None, role=None, worker_id=None, claim_size=50,
+                 lease_seconds=300, exchanges=None, exclude_exchanges=None):
         """
         :param database: String of the directory location for the SQL database.
         :param user: String of the username used to login to the database
@@ -1003,12 +1684,37 @@ class YahooFinanceDataExtraction(object):
             'append' or 'replace'.
         :param days_back: Integer of the number of days where any existing
             data should be replaced with newer prices
-        :param threads: Integer of the number of threads the current process
-            is using; used for rate limiter
+        :param threads: Integer of the number of fetch threads the current
+            process is using; used for rate limiter
         :param table: String indicating which table the DataFrame should be
             put into.
         :param load_tables: String of the directory location for the load tables
         :param verbose: Boolean of whether debugging prints should occur.
+        :param dry_run: Boolean of whether to only save the request plan to a
+            CSV file in the load_tables directory, and its summary to
+            plan_summary, without downloading data
+        :param parsers: Integer of the processes that parse the downloaded
+            data; defaults to the CPU cores
+        :param writers: Integer of the threads that save the prices to the
+            database
+        :param checkpoint: Optional RunCheckpoint of the current run. The
+            planned records and the finished tsids are saved to it, and a
+            resumed run continues with the saved records.
+        :param cache: Optional WarmCache of the daemon, which provides the
+            vendor id, the exchanges and the last prices without querying them
+        :param role: Optional string of the distributed role; the
+            coordinator only queues the work items, while the worker downloads
+            the items it claims from the queue. By default, the extractor
+            queues and downloads the items itself.
+        :param worker_id: Optional string identifying the worker; defaults to
+            the host name and process id
+        :param claim_size: Integer of the work items a worker claims at once
+        :param lease_seconds: Integer of the seconds a claimed item stays
+            leased to the worker without a heartbeat
+        :param exchanges: Optional list of the tsid exchange symbols whose
+            codes are downloaded, used by the daemon's session group jobs
+        :param exclude_exchanges: Optional list of the tsid exchange symbols
+            whose codes aren't downloaded
         """
 
         self.database = database
@@ -1024,30 +1730,80 @@ class YahooFinanceDataExtraction(object):
         self.threads = threads
         self.table = table
         self.verbose = verbose
+        self.dry_run = dry_run
+        self.parsers = parsers
+        self.writers = writers
+        self.cache = cache
+        self.role = role
+        self.worker_id = worker_id or default_worker_id()
+        self.claim_size = claim_size
+        self.lease_seconds = lease_seconds
+        self.exchanges = exchanges
+        self.exclude_exchanges = exclude_exchanges
+
+        # The items, calls and rows of the planned records; set by main
+        self.plan_summary = None
+
+        # The checkpoint of this extractor within the run
+        self.stage = None
+        if checkpoint:
+            self.stage = checkpoint.stage('yahoo_%s_%s' % (
+                self.download_selection, self.table))
 
         # Rate limiter parameters based on guessed Google Finance limitations
         # Received captcha after about 2000 queries
         rate = 70
         period_sec = 60
-        self.min_interval = float((period_sec / rate) * threads)
+        self.rate_limiter = RateLimiter('yahoo', rate, period_sec, threads)
 
-        self.vendor_id = query_data_vendor_id(
-            database=self.database, user=self.user, password=self.password,
-            host=self.host, port=self.port, name='Yahoo_Finance')
+        self.vendor_id = cached(
+            cache, ('vendor_id', 'Yahoo_Finance'),
+            lambda: query_data_vendor_id(
+                database=self.database, user=self.user,
+                password=self.password, host=self.host, port=self.port,
+                name='Yahoo_Finance'))
 
         self.csv_wo_data = load_tables + '/yahoo_' + self.table + '_wo_data.csv'
+        self.csv_plan = load_tables + '/yahoo_' + self.table + '_plan.csv'
 
-        print('Retrieving dates for the last Yahoo prices per ticker...')
-        # Creates a DataFrame with the last price for each security
-        self.latest_prices = query_last_price(
-            database=self.database, user=self.user, password=self.password,
-            host=self.host, port=self.port, table=self.table,
-            vendor_id=self.vendor_id)
+        if self.stage and self.stage.has_plan():
+            # The checkpoint has the last prices of the planned records, which
+            #   tell the refresh history whether the resumed downloads changed
+            self.latest_prices = self.stage.load_plan()['latest_prices']
+        else:
+            print('Retrieving dates for the last Yahoo prices per ticker...')
+            # Creates a DataFrame with the last price for each security
+            self.latest_prices = cached(
+                cache, ('last_price', self.table, self.vendor_id),
+                lambda: query_last_price(
+                    database=self.database, user=self.user,
+                    password=self.password, host=self.host, port=self.port,
+                    table=self.table, vendor_id=self.vendor_id))
 
         # Build a DataFrame with all the exchange symbols
-        self.exchanges_df = self.query_exchanges()
+        self.exchanges_df = cached(cache, ('exchanges', 'yahoo'),
+                                   self.query_exchanges)
+
+        self.refresh_history = RefreshHistory(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table)
+
+        # The finished tsids are removed from the work queue in batches
+        self.completed_work = CompletedWork(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table)
+
+        # Selects the codes to plan, and finds each exchange's last closed
+        #   session for removing the partial daily bars before their writes
+        self.planner = DownloadPlanner(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, cache=cache)
 
         self.main()
+        self.refresh_history.flush()
+        self.completed_work.flush()
 
     def main(self):
         """
@@ -1057,6 +1813,62 @@ class YahooFinanceDataExtraction(object):
 
         start_time = time.time()
 
+        if self.role == 'worker':
+            claimed = run_claimed_work(self, 'yahoo')
+            print('%s finished %s claimed items in %0.2f seconds' %
+                  (self.worker_id, '{:,}'.format(claimed),
+                   time.time() - start_time))
+            return
+
+        if self.stage and self.stage.has_plan():
+            # Continue the checkpoint's records, skipping the finished tsids
+            records = self.stage.remaining(self.stage.load_plan()['records'])
+            self.plan_summary = {'items': len(records),
+                                 'calls': len(records), 'rows': None}
+        else:
+            records = self.plan_records()
+            if records is None:
+                return      # Dry run
+            if self.role == 'coordinator':
+                print('%s items were queued for the workers' %
+                      '{:,}'.format(len(records)))
+                return
+            if self.stage:
+                planned_tsids = [record[0] for record in records]
+                self.stage.save_plan({
+                    'records': records,
+                    'latest_prices': self.latest_prices[
+                        self.latest_prices.index.isin(planned_tsids)]})
+
+        """This runs the program with no multiprocessing or threading.
+        To run, make sure to comment out all pool processes below.
+        Takes about 55 seconds for 10 tickers; 5.5 seconds per ticker."""
+        # [self.extractor(record) for record in records]
+
+        """This runs the program as a pipeline, with the fetch threads
+        downloading the data, a process pool parsing it and the write threads
+        saving it to the database. Change the number of threads to alter the
+        speed of the downloads. If the query runs out of items, try lowering
+        the number of threads."""
+        multithread_with_breaker(self.extractor, records, self.threads,
+                                 vendor_breakers['yahoo'],
+                                 runner=self.run_pipeline)
+
+        # A run stopped by its time budget can be resumed from its checkpoint
+        if self.stage and not run_budget.stopped_early():
+            self.stage.mark_complete()
+
+        print('The price extraction took %0.2f seconds to complete' %
+              (time.time() - start_time))
+
+    def plan_records(self):
+        """ Determine which tsids need to be downloaded, and build their
+        request plan records.
+
+        :return: List of the (tsid, url, keep_after) records, or None if only
+            the request plan was saved (dry run)
+        """
+
         print('Analyzing the tsid codes that will be downloaded...')
         # Create a list of tsids to download
         code_df = query_codes(database=self.database, user=self.user,
@@ -1093,40 +1905,62 @@ class YahooFinanceDataExtraction(object):
                 writer = csv.writer(f, delimiter=',')
                 writer.writerow(('tsid', 'date_tried'))
 
-        # The cut-off time for when code data can be re-downloaded
-        beg_date_obj = (datetime.now(timezone.utc) -
-                        timedelta(seconds=self.redownload_time))
-        # Final download list should include both new/null and non-recent codes
-        codes_final = codes_df[(codes_df['updated_date'] < beg_date_obj) |
-                               (codes_df['updated_date'].isnull())]
+        # Skip the codes that can't have new bars since their last price
+        codes_df = self.planner.select(
+            codes_df, self.latest_prices, self.table,
+            exchanges=self.exchanges,
+            exclude_exchanges=self.exclude_exchanges)
 
-        # Change the DF to a list
-        code_list = codes_final['tsid'].values.flatten()
+        # Final download list should include both new/null codes and the codes
+        #   whose refresh interval has passed; the interval backs off for the
+        #   codes whose recent downloads had no new prices
+        refresh_df = query_refresh_history(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table)
+        codes_final = due_codes(codes_df=codes_df, refresh_df=refresh_df,
+                                redownload_time=self.redownload_time)
+
+        # Score the codes by staleness and liquidity in the work queue, then
+        #   pull them back with the most valuable updates first
+        code_list = prioritize_work(
+            database=self.database, user=self.user, password=self.password,
+            host=self.host, port=self.port, vendor_id=self.vendor_id,
+            table=self.table, tsids=codes_final['tsid'].values.flatten(),
+            latest_prices=self.latest_prices,
+            redownload_time=self.redownload_time, dry_run=self.dry_run)
+
+        # Derive every url and the date after which the downloaded prices are
+        #   new in one vectorized pass, instead of within each extractor call
+        plan = build_request_plan(
+            tsids=code_list, exchanges_df=self.exchanges_df,
+            db_url=self.db_url, vendor='yahoo',
+            latest_prices=self.latest_prices, data_process=self.data_process,
+            days_back=self.days_back)
+
+        self.plan_summary = {'items': len(plan.index),
+                             'calls': len(plan.index),
+                             'rows': estimate_plan_rows(plan['last_date'])}
+
+        if self.dry_run:
+            save_request_plan(plan=plan, csv_out=self.csv_plan)
+            return
+
+        # Each record is a tuple of (tsid, url, keep_after)
+        records = [tuple(record) for record in
+                   plan[['tsid', 'url', 'keep_after']].values]
 
         # Inform the user how many codes will be updated
         dl_codes = len(codes_final.index)
         total_codes = len(codes_df.index)
         print('%s tsid codes out of %s requested codes will have Yahoo '
               'finance %s data downloaded.\n%s codes were last updated within '
-              'the %s second limit.'
+              'the %s second limit or their backed off refresh interval.'
               % ('{:,}'.format(dl_codes), '{:,}'.format(total_codes),
                  self.table, '{:,}'.format(total_codes - dl_codes),
                  '{:,}'.format(self.redownload_time)))
 
-        """This runs the program with no multiprocessing or threading.
-        To run, make sure to comment out all pool processes below.
-        Takes about 55 seconds for 10 tickers; 5.5 seconds per ticker."""
-        # [self.extractor(tsid) for tsid in code_list]
-
-        """This runs the program with multiprocessing or threading.
-        Comment and uncomment the type of multiprocessing in the
-        multi-thread function above to change the type. Change the number
-        of threads below to alter the speed of the downloads. If the
-        query runs out of items, try lowering the number of threads."""
-        multithread(self.extractor, code_list, threads=self.threads)
-
-        print('The price extraction took %0.2f seconds to complete' %
-              (time.time() - start_time))
+        return records
 
     def query_exchanges(self):
         """ Retrieve the exchange symbols for yahoo and tsid, which will be used
@@ -1168,30 +2002,89 @@ class YahooFinanceDataExtraction(object):
         conn.close()
         return df
 
-    def extractor(self, tsid):
-        """ Takes the tsid symbol, downloads the historical data, and then
-        saves the data into the SQLite database.
+    def run_pipeline(self, records):
+        """ Run the records through the fetch, parse and write pipeline.
 
-        :param tsid: String of the tsid
-        :return: Nothing. It saves the price data in the SQLite Database.
+        :param records: List of the request plan records
+        :return: List of the record results from the write stage
         """
 
-        main_time_start = time.time()
+        parse = partial(parse_vendor_prices, download_yahoo_data, self.db_url,
+                        self.csv_wo_data, self.verbose)
+        return pipeline(records, fetch=self.fetch, parse=parse,
+                        write=self.write, fetchers=self.threads,
+                        parsers=self.parsers, writers=self.writers)
+
+    def extractor(self, record):
+        """ Takes the tsid's request plan record, downloads the historical
+        data, and then saves the data into the database. Runs each pipeline
+        stage for the single record.
+
+        :param record: Tuple of the tsid, the url and the ISO date after which
+            the downloaded prices are kept (None if there are no prior prices)
+        :return: The record if the download was skipped because the Yahoo
+            Finance circuit breaker is open, otherwise None. The price data
+            is saved in the database.
+        """
 
-        # Rate limit this function with non-reactive timer
-        time.sleep(self.min_interval)
+        raw_data = self.fetch(record)
+        if raw_data is None:
+            return
+        elif isinstance(raw_data, EndItem):
+            return raw_data.value
 
-        # The ticker has no prior price; add all the downloaded data
-        if tsid not in self.latest_prices.index:
-            clean_data = download_yahoo_data(db_url=self.db_url, tsid=tsid,
-                                             exchanges_df=self.exchanges_df,
-                                             csv_out=self.csv_wo_data)
+        clean_data = parse_vendor_prices(download_yahoo_data, self.db_url,
+                                         self.csv_wo_data, self.verbose,
+                                         record, raw_data)
+        return self.write(record, clean_data)
+
+    def fetch(self, record):
+        """ The fetch stage, which downloads the record's url.
+
+        :param record: Tuple of the tsid, the url and the keep_after date
+        :return: The downloaded data, or an EndItem with the record if the
+            download was skipped because the Yahoo Finance circuit breaker is
+            open
+        """
+
+        tsid, url, keep_after = record
+
+        # Fail fast while Yahoo Finance is unavailable; retry the tsid later.
+        #   Once the time budget runs out, the tsid is left for the next run.
+        if vendor_breakers['yahoo'].is_open() or run_budget.exhausted():
+            return EndItem(record)
+
+        if self.stage:
+            self.stage.start(tsid)
+
+        # Rate limit this function across the threads (and hosts)
+        self.rate_limiter.wait()
+
+        try:
+            return fetch_yahoo_data(url, tsid)
+        except CircuitOpenError:
+            return EndItem(record)
+
+    def write(self, record, clean_data):
+        """ The write stage, which saves the new prices to the database.
+
+        :param record: Tuple of the tsid, the url and the keep_after date
+        :param clean_data: DataFrame of the new prices from the parse stage
+        """
+
+        tsid, url, keep_after = record
+        if self.table == 'daily_prices':
+            # The bar of a session that hasn't closed is still changing
+            clean_data = self.planner.complete_bars(tsid, clean_data)
+        changed = has_new_prices(
+            clean_data, last_price_date(self.latest_prices, tsid))
 
+        # The ticker has no prior price; add all the downloaded data
+        if keep_after is None:
             # There is no new data, so do nothing to the database
             if len(clean_data.index) == 0:
                 if self.verbose:
-                    print('No data for %s | %0.1f seconds' %
-                          (tsid, time.time() - main_time_start))
+                    print('No data for %s' % tsid)
             # There is new data to add to the database
             else:
                 clean_data.insert(0, 'data_vendor_id', self.vendor_id)
@@ -1204,36 +2097,14 @@ class YahooFinanceDataExtraction(object):
                           exists='append', item=tsid)
 
                 if self.verbose:
-                    print('Updated %s | %0.1f seconds' %
-                          (tsid, time.time() - main_time_start))
+                    print('Updated %s' % tsid)
 
         # The pricing database has prior values; append/replace new data points
         else:
-            try:
-                last_date = self.latest_prices.loc[tsid, 'date']
-                raw_data = download_yahoo_data(db_url=self.db_url, tsid=tsid,
-                                               exchanges_df=self.exchanges_df,
-                                               csv_out=self.csv_wo_data)
-
-                # Only keep data that is after the days_back period
-                if self.data_process == 'replace' and self.days_back:
-                    beg_date = (last_date - timedelta(days=self.days_back))
-                    clean_data = raw_data[raw_data.date > beg_date.isoformat()]
-
-                # Only keep data that is after the latest existing data point
-                else:
-                    clean_data = raw_data[raw_data.date > last_date]
-            except Exception as e:
-                print('Failed to determine what data is new for %s in extractor'
-                      % tsid)
-                print(e)
-                return
-
             # There is not new data, so do nothing to the database
             if len(clean_data.index) == 0:
                 if self.verbose:
-                    print('No update for %s | %0.1f seconds' %
-                          (tsid, time.time() - main_time_start))
+                    print('No update for %s' % tsid)
             # There is new data to add to the database
             else:
                 clean_data.insert(0, 'data_vendor_id', self.vendor_id)
@@ -1283,8 +2154,19 @@ class YahooFinanceDataExtraction(object):
                           exists='append', item=tsid)
 
                 if self.verbose:
-                    print('Updated %s | %0.1f seconds' %
-                          (tsid, time.time() - main_time_start))
+                    print('Updated %s' % tsid)
+
+        if self.cache and len(clean_data.index) > 0:
+            # Keep the daemon's last prices current without querying them
+            self.cache.update_last_price(self.table, self.vendor_id, tsid,
+                                         clean_data['date'].max())
+
+        self.refresh_history.record(tsid, changed)
+
+        # The tsid is done, so remove it from the work queue
+        self.completed_work.record(tsid)
+        if self.stage:
+            self.stage.done(tsid)
 
 
 class CSIDataExtractor(object):
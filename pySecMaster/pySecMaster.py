@@ -1,20 +1,36 @@
 #!/usr/bin/env python3
 
 import argparse
+from collections import OrderedDict
 from datetime import datetime
+from functools import partial
+from multiprocessing import Process
+import os
 import time
 
 from create_tables import create_database, main_tables, data_tables,\
-    events_tables
+    events_tables, query_schema_version, schema_version, set_schema_version
+from download import print_transfer_stats, reset_transfer_stats,\
+    transfer_stats
 from extractor import QuandlCodeExtract, QuandlDataExtraction,\
     GoogleFinanceDataExtraction, YahooFinanceDataExtraction, CSIDataExtractor,\
     NASDAQSectorIndustryExtractor
 from load_aux_tables import LoadTables
 from build_symbology import create_symbology
-from cross_validator import CrossValidate
-from utilities.database_queries import query_all_active_tsids
+from cross_validator import CrossValidate, ValidationListener
+from utilities.checkpoint import RunCheckpoint
+from utilities.daemon import ControlServer, Scheduler, WarmCache, cached
+from utilities.database_queries import query_all_active_tsids,\
+    query_exchange_sessions, query_table_fingerprint, set_db_write_limit,\
+    set_price_notifications, write_stats
 from utilities.user_dir import user_dir
 from utilities.database_check import postgres_test
+from utilities.rate_limiter import use_cluster_rate_limits
+from utilities.run_plan import ThroughputLog, estimate_plan, print_plan
+from utilities.task_graph import TaskGraph, file_fingerprint
+from utilities.time_budget import run_budget
+from utilities.trading_calendar import session_groups
+from utilities.vendor_server import stand_in_url
 
 __author__ = 'Josh Schertz'
 __copyright__ = 'Copyright (C) 2018 Josh Schertz'
@@ -86,6 +102,11 @@ today = datetime.today()
 
 # Don't change these variables unless you know what you are doing!
 quandl_data_url = ['https://www.quandl.com/api/v1/datasets/', '.csv']
+# Datatables allow daily updates for many codes to be downloaded in one call
+quandl_table_url = ['https://www.quandl.com/api/v3/datatables/', '.csv']
+
+# The throughput of the prior runs, used by the --plan duration estimates
+throughput_file = os.path.join(userdir['load_tables'], 'throughput.json')
 
 google_fin_url = {'root': 'http://www.google.com/finance/getprices?',
                   'ticker': 'q=',
@@ -106,10 +127,42 @@ yahoo_fin_url = {'root': 'http://real-chart.finance.yahoo.com/table.csv?',
 ###############################################################################
 
 
+def create_tables(database_options):
+    """ Create the database and the SQL tables if they don't already exist.
+    The schema version is only saved when all of the tables were created.
+
+    :param database_options: Dictionary of the postgres database options
+    """
+
+    create_database(admin_user=database_options['admin_user'],
+                    admin_password=database_options['admin_password'],
+                    database=database_options['database'],
+                    user=database_options['user'])
+    created = [
+        table_function(database=database_options['database'],
+                       user=database_options['user'],
+                       password=database_options['password'],
+                       host=database_options['host'],
+                       port=database_options['port'])
+        for table_function in (main_tables, data_tables, events_tables)]
+
+    if all(created):
+        set_schema_version(database=database_options['database'],
+                           user=database_options['user'],
+                           password=database_options['password'],
+                           host=database_options['host'],
+                           port=database_options['port'])
+
+
 def maintenance(database_options, quandl_key, quandl_ticker_source,
                 database_list, threads, quandl_update_range,
                 csidata_update_range, symbology_sources):
-    """
+    """ Run the table maintenance steps as a dependency graph. The CSI Data
+    factsheet and the Quandl codes are downloaded at the same time, since they
+    only depend on the tables. The table creation, the auxiliary tables and
+    the symbology are skipped when their inputs haven't changed since their
+    last run, which only takes a few quick queries and file hashes.
+
     :param database_options: Dictionary of the postgres database options
     :param quandl_key: Optional string of the Quandl API key
     :param quandl_ticker_source: String of which source the Quandl data should
@@ -129,77 +182,84 @@ def maintenance(database_options, quandl_key, quandl_ticker_source,
           'some time to finish if large databases are used. If this fails, '
           'rerun it after a few minutes.')
 
-    # Create the SQL tables if they don't already exist
-    create_database(admin_user=database_options['admin_user'],
-                    admin_password=database_options['admin_password'],
-                    database=database_options['database'],
-                    user=database_options['user'])
-    main_tables(database=database_options['database'],
-                user=database_options['user'],
-                password=database_options['password'],
-                host=database_options['host'],
-                port=database_options['port'])
-    data_tables(database=database_options['database'],
-                user=database_options['user'],
-                password=database_options['password'],
-                host=database_options['host'],
-                port=database_options['port'])
-    events_tables(database=database_options['database'],
-                  user=database_options['user'],
-                  password=database_options['password'],
-                  host=database_options['host'],
-                  port=database_options['port'])
-
-    LoadTables(database=database_options['database'],
-               user=database_options['user'],
-               password=database_options['password'],
-               host=database_options['host'],
-               port=database_options['port'],
-               tables_to_load=tables_to_load,
-               load_tables=userdir['load_tables'])
+    db_args = {'database': database_options['database'],
+               'user': database_options['user'],
+               'password': database_options['password'],
+               'host': database_options['host'],
+               'port': database_options['port']}
+
+    def table_fingerprint(tables, extra=''):
+        return '%s|%s' % (query_table_fingerprint(tables=tables, **db_args),
+                          extra)
+
+    def schema_fingerprint():
+        # Without the current schema version, some tables weren't created, so
+        #   there is no fingerprint and the step runs again next time
+        if query_schema_version(**db_args) != schema_version:
+            return None
+        return 'schema_version %s' % schema_version
+
+    graph = TaskGraph(name=database_options['database'],
+                      state_file=os.path.join(userdir['load_tables'],
+                                              'maintenance_fingerprints.json'))
+
+    # Skipped while the database's tables are at the current schema version
+    graph.add('create_tables', create_tables,
+              kwargs={'database_options': database_options},
+              fingerprint=schema_fingerprint)
+
+    load_files = [os.path.join(userdir['load_tables'], table + '.csv')
+                  for table in tables_to_load]
+    graph.add('load_tables', LoadTables,
+              kwargs=dict(db_args, tables_to_load=tables_to_load,
+                          load_tables=userdir['load_tables']),
+              depends=['create_tables'],
+              fingerprint=lambda: table_fingerprint(
+                  tables_to_load, extra=file_fingerprint(load_files)))
 
     # Always extract CSI values, as they are used for the symbology table
-    CSIDataExtractor(database=database_options['database'],
-                     user=database_options['user'],
-                     password=database_options['password'],
-                     host=database_options['host'],
-                     port=database_options['port'],
-                     db_url=csidata_url,
-                     data_type=csidata_type,
-                     redownload_time=csidata_update_range)
+    graph.add('csidata', CSIDataExtractor,
+              kwargs=dict(db_args, db_url=csidata_url, data_type=csidata_type,
+                          redownload_time=csidata_update_range),
+              depends=['create_tables'])
 
+    symbology_depends = ['load_tables', 'csidata']
     if quandl_ticker_source == 'quandl':
-        QuandlCodeExtract(database=database_options['database'],
-                          user=database_options['user'],
-                          password=database_options['password'],
-                          host=database_options['host'],
-                          port=database_options['port'],
-                          quandl_token=quandl_key,
-                          database_list=database_list,
-                          database_url=database_url,
-                          update_range=quandl_update_range,
-                          threads=threads)
-
-    create_symbology(database=database_options['database'],
-                     user=database_options['user'],
-                     password=database_options['password'],
-                     host=database_options['host'],
-                     port=database_options['port'],
-                     source_list=symbology_sources)
-
-    NASDAQSectorIndustryExtractor(
-        database=database_options['database'],
-        user=database_options['user'],
-        password=database_options['password'],
-        host=database_options['host'],
-        port=database_options['port'],
-        db_url=nasdaq_sector_industry_url,
-        exchange_list=nasdaq_sector_industry_extractor_exchanges,
-        redownload_time=nasdaq_sector_industry_redownload_time)
+        # The Quandl codes reference the data_vendor table
+        graph.add('quandl_codes', QuandlCodeExtract,
+                  kwargs=dict(db_args, quandl_token=quandl_key,
+                              database_list=database_list,
+                              database_url=database_url,
+                              update_range=quandl_update_range,
+                              threads=threads),
+                  depends=['load_tables'])
+        symbology_depends.append('quandl_codes')
+
+    graph.add('symbology', create_symbology,
+              kwargs=dict(db_args, source_list=symbology_sources),
+              depends=symbology_depends,
+              fingerprint=lambda: table_fingerprint(
+                  ['exchanges', 'csidata_stock_factsheet', 'quandl_codes',
+                   'symbology'], extra=','.join(symbology_sources)))
+
+    graph.add('nasdaq_sector_industry', NASDAQSectorIndustryExtractor,
+              kwargs=dict(
+                  db_args, db_url=nasdaq_sector_industry_url,
+                  exchange_list=nasdaq_sector_industry_extractor_exchanges,
+                  redownload_time=nasdaq_sector_industry_redownload_time),
+              depends=['symbology'])
+
+    statuses = graph.run()
+    if 'failed' in statuses.values():
+        raise SystemError('The maintenance steps failed: %s' %
+                          ', '.join(name for name, status in statuses.items()
+                                    if status == 'failed'))
 
 
 def data_download(database_options, quandl_key, download_list, threads=4,
-                  verbose=False):
+                  verbose=False, dry_run=False, concurrent=False,
+                  db_writers=None, progress_interval=60, checkpoint=None,
+                  role=None):
     """ Loops through all provided data sources in download_list, and runs
     the associated data extractor using the provided source variables.
 
@@ -210,123 +270,369 @@ def data_download(database_options, quandl_key, download_list, threads=4,
     :param threads: Integer indicating how many threads should be used to
         concurrently download data
     :param verbose: Boolean of whether debugging prints should occur.
+    :param dry_run: Boolean of whether the extractors should only plan their
+        downloads instead of downloading data
+    :param concurrent: Boolean of whether each vendor's sources should be
+        downloaded at the same time as the other vendors' sources. Each vendor
+        runs in its own process, with its own rate limits and worker pools.
+    :param db_writers: Optional integer of the concurrent database writes
+        allowed across all of the vendors
+    :param progress_interval: Integer of the seconds between the combined
+        progress reports when the vendors are downloaded concurrently
+    :param checkpoint: Optional RunCheckpoint that the extractors save their
+        planned and finished items to, allowing the run to be resumed
+    :param role: Optional string of the distributed role (coordinator or
+        worker) of the Google and Yahoo extractors
     """
 
-    for source in download_list:
-        if source['interval'] == 'daily':
-            table = 'daily_prices'
-            if source['source'] == 'google':
-                google_fin_url['interval'] = 'i=' + str(60*60*24)
-            elif source['source'] == 'yahoo':
-                yahoo_fin_url['interval'] = 'g=d'
-        elif source['interval'] == 'minute':
-            table = 'minute_prices'
-            if source['source'] == 'google':
-                google_fin_url['interval'] = 'i=' + str(60)
-            elif source['source'] == 'yahoo':
-                raise SystemError('Yahoo Finance does not provide minute data.')
-        else:
-            raise SystemError('No interval was provided for %s in '
-                              'data_download in pySecMaster.py' %
-                              source['interval'])
+    # Must be set before any extractor process is created
+    set_db_write_limit(db_writers)
 
-        if source['source'] == 'quandl':
-            if quandl_key:
-                # Download data for selected Quandl codes
-                print('\nDownloading all Quandl fields for: %s'
-                      '\nNew data will %s the prior %s day\'s data' %
-                      (source['selection'], source['data_process'],
-                       source['replace_days_back']))
-                # NOTE: Quandl only allows a single concurrent download with
-                #   their free account
-                QuandlDataExtraction(
-                    database=database_options['database'],
-                    user=database_options['user'],
-                    password=database_options['password'],
-                    host=database_options['host'],
-                    port=database_options['port'],
-                    quandl_token=quandl_key,
-                    db_url=quandl_data_url,
-                    download_selection=source['selection'],
-                    redownload_time=source['redownload_time'],
-                    data_process=source['data_process'],
-                    days_back=source['replace_days_back'],
-                    threads=2,
-                    table=table,
-                    load_tables=userdir['load_tables'],
-                    verbose=verbose)
-            else:
-                print('\nNot able to download Quandl data for %s because '
-                      'there was no Quandl API key provided.' %
-                      (source['selection'],))
-
-        elif source['source'] == 'google':
-            # Download data for selected Google Finance codes
-            print('\nDownloading all Google Finance fields for: %s'
-                  '\nNew data will %s the prior %s day\'s data' %
-                  (source['selection'], source['data_process'],
-                   source['replace_days_back']))
+    rows_start = write_stats['rows'].value
+    write_seconds_start = write_stats['seconds'].value
+
+    if concurrent:
+        concurrent_vendor_download(
+            database_options=database_options, quandl_key=quandl_key,
+            download_list=download_list, threads=threads, verbose=verbose,
+            dry_run=dry_run, progress_interval=progress_interval,
+            checkpoint=checkpoint, role=role)
+    else:
+        for source in download_list:
+            download_source(database_options=database_options,
+                            quandl_key=quandl_key, source=source,
+                            threads=threads, verbose=verbose, dry_run=dry_run,
+                            checkpoint=checkpoint, role=role)
+
+    if not dry_run:
+        # The write rate used by the --plan duration estimates
+        ThroughputLog(throughput_file).record_writes(
+            rows=write_stats['rows'].value - rows_start,
+            seconds=write_stats['seconds'].value - write_seconds_start)
+
+    print('All available data values have been downloaded for: %s' %
+          download_list)
 
-            google_fin_url['period'] = 'p=' + str(source['period']) + 'd'
-            GoogleFinanceDataExtraction(
-                database=database_options['database'],
-                user=database_options['user'],
-                password=database_options['password'],
-                host=database_options['host'],
-                port=database_options['port'],
-                db_url=google_fin_url,
-                download_selection=source['selection'],
-                redownload_time=source['redownload_time'],
-                data_process=source['data_process'],
-                days_back=source['replace_days_back'],
-                threads=threads,
-                table=table,
-                load_tables=userdir['load_tables'],
-                verbose=verbose)
 
+def download_source(database_options, quandl_key, source, threads=4,
+                    verbose=False, dry_run=False, checkpoint=None, cache=None,
+                    role=None):
+    """ Runs the data extractor for a single source from the download list.
+
+    :param database_options: Dictionary of the postgres database options
+    :param quandl_key: Optional string of the Quandl API key
+    :param source: Dictionary with all of the relevant variables for the
+        source; the daemon's session group jobs add the exchanges (or the
+        exclude_exchanges) whose codes are downloaded
+    :param threads: Integer indicating how many threads should be used to
+        concurrently download data
+    :param verbose: Boolean of whether debugging prints should occur.
+    :param dry_run: Boolean of whether the extractors should only plan their
+        downloads instead of downloading data
+    :param checkpoint: Optional RunCheckpoint that the extractors save their
+        planned and finished items to, allowing the run to be resumed
+    :param cache: Optional WarmCache of the daemon, shared by the price
+        extractors
+    :param role: Optional string of the distributed role (coordinator or
+        worker) of the Google and Yahoo extractors
+    :return: The source's extractor, which has the plan_summary of the
+        planned items, or None if the source wasn't run
+    """
+
+    if source['interval'] == 'daily':
+        table = 'daily_prices'
+        if source['source'] == 'google':
+            google_fin_url['interval'] = 'i=' + str(60*60*24)
+        elif source['source'] == 'yahoo':
+            yahoo_fin_url['interval'] = 'g=d'
+    elif source['interval'] == 'minute':
+        table = 'minute_prices'
+        if source['source'] == 'google':
+            google_fin_url['interval'] = 'i=' + str(60)
         elif source['source'] == 'yahoo':
-            # Download data for selected Google Finance codes
-            print('\nDownloading all Yahoo Finance fields for: %s'
+            raise SystemError('Yahoo Finance does not provide minute data.')
+    else:
+        raise SystemError('No interval was provided for %s in '
+                          'download_source in pySecMaster.py' %
+                          source['interval'])
+
+    start_time = time.time()
+    extractor = None
+
+    if source['source'] == 'quandl' and role == 'worker':
+        print('\nSkipping the Quandl %s source, as the Quandl extractor '
+              'is run by the coordinator' % source['selection'])
+
+    elif source['source'] == 'quandl':
+        if quandl_key:
+            # Download data for selected Quandl codes
+            print('\nDownloading all Quandl fields for: %s'
                   '\nNew data will %s the prior %s day\'s data' %
                   (source['selection'], source['data_process'],
                    source['replace_days_back']))
-
-            YahooFinanceDataExtraction(
+            # NOTE: Quandl only allows a single concurrent download with
+            #   their free account
+            extractor = QuandlDataExtraction(
                 database=database_options['database'],
                 user=database_options['user'],
                 password=database_options['password'],
                 host=database_options['host'],
                 port=database_options['port'],
-                db_url=yahoo_fin_url,
+                quandl_token=quandl_key,
+                db_url=quandl_data_url,
                 download_selection=source['selection'],
                 redownload_time=source['redownload_time'],
                 data_process=source['data_process'],
                 days_back=source['replace_days_back'],
-                threads=threads,
+                threads=2,
                 table=table,
                 load_tables=userdir['load_tables'],
-                verbose=verbose)
-
+                table_url=quandl_table_url,
+                verbose=verbose,
+                dry_run=dry_run,
+                checkpoint=checkpoint,
+                cache=cache,
+                exchanges=source.get('exchanges'),
+                exclude_exchanges=source.get('exclude_exchanges'))
         else:
-            print('The %s source is currently not implemented. Skipping it.' %
-                  source['source'])
+            print('\nNot able to download Quandl data for %s because '
+                  'there was no Quandl API key provided.' %
+                  (source['selection'],))
 
-    print('All available data values have been downloaded for: %s' %
-          download_list)
+    elif source['source'] == 'google':
+        # Download data for selected Google Finance codes
+        print('\nDownloading all Google Finance fields for: %s'
+              '\nNew data will %s the prior %s day\'s data' %
+              (source['selection'], source['data_process'],
+               source['replace_days_back']))
 
+        google_fin_url['period'] = 'p=' + str(source['period']) + 'd'
+        extractor = GoogleFinanceDataExtraction(
+            database=database_options['database'],
+            user=database_options['user'],
+            password=database_options['password'],
+            host=database_options['host'],
+            port=database_options['port'],
+            db_url=google_fin_url,
+            download_selection=source['selection'],
+            redownload_time=source['redownload_time'],
+            data_process=source['data_process'],
+            days_back=source['replace_days_back'],
+            threads=threads,
+            table=table,
+            load_tables=userdir['load_tables'],
+            verbose=verbose,
+            dry_run=dry_run,
+            checkpoint=checkpoint,
+            cache=cache,
+            role=role,
+            exchanges=source.get('exchanges'),
+            exclude_exchanges=source.get('exclude_exchanges'))
 
-def post_download_maintenance(database_options, download_list, period=None,
-                              verbose=False):
-    """ Perform tasks that require all data to be downloaded first, such as the
-    source cross validator function.
+    elif source['source'] == 'yahoo':
+        # Download data for selected Google Finance codes
+        print('\nDownloading all Yahoo Finance fields for: %s'
+              '\nNew data will %s the prior %s day\'s data' %
+              (source['selection'], source['data_process'],
+               source['replace_days_back']))
+
+        extractor = YahooFinanceDataExtraction(
+            database=database_options['database'],
+            user=database_options['user'],
+            password=database_options['password'],
+            host=database_options['host'],
+            port=database_options['port'],
+            db_url=yahoo_fin_url,
+            download_selection=source['selection'],
+            redownload_time=source['redownload_time'],
+            data_process=source['data_process'],
+            days_back=source['replace_days_back'],
+            threads=threads,
+            table=table,
+            load_tables=userdir['load_tables'],
+            verbose=verbose,
+            dry_run=dry_run,
+            checkpoint=checkpoint,
+            cache=cache,
+            role=role,
+            exchanges=source.get('exchanges'),
+            exclude_exchanges=source.get('exclude_exchanges'))
+
+    else:
+        print('The %s source is currently not implemented. Skipping it.' %
+              source['source'])
+
+    if (extractor is not None and extractor.plan_summary and not dry_run and
+            role is None):
+        # The throughput used by the --plan duration estimates
+        ThroughputLog(throughput_file).record_source(
+            vendor=source['source'], selection=source['selection'],
+            table=table, items=extractor.plan_summary['items'],
+            seconds=time.time() - start_time)
+
+    return extractor
+
+
+def plan_download(database_options, quandl_key, download_list, threads=4,
+                  verbose=False, concurrent=False, db_writers=None):
+    """ Plan every source's downloads without downloading any prices, then
+    print the planned items of each source and how long the run should take.
+    The estimates use the throughput recorded by the prior runs, the vendors'
+    rate limits and the recorded database write rate.
 
     :param database_options: Dictionary of the postgres database options
+    :param quandl_key: Optional string of the Quandl API key
     :param download_list: List of dictionaries, with each dictionary containing
         all of the relevant variables for the specific source
-    :param period: Optional integer indicating the prior number of days whose
-            values should be cross validated. If None is provided, then the
-            entire set of values will be validated.
+    :param threads: Integer indicating how many threads would be used to
+        concurrently download data
+    :param verbose: Boolean of whether debugging prints should occur.
+    :param concurrent: Boolean of whether the vendors would be downloaded at
+        the same time
+    :param db_writers: Optional integer of the concurrent database writes
+    """
+
+    plans = []
+    for source in download_list:
+        extractor = download_source(database_options=database_options,
+                                    quandl_key=quandl_key, source=source,
+                                    threads=threads, verbose=verbose,
+                                    dry_run=True)
+        if extractor is None or extractor.plan_summary is None:
+            continue
+        plans.append({'vendor': source['source'],
+                      'selection': source['selection'],
+                      'table': extractor.table,
+                      'items': extractor.plan_summary['items'],
+                      'calls': extractor.plan_summary['calls'],
+                      'rows': extractor.plan_summary['rows'] or 0,
+                      'rate': extractor.rate_limiter.rate,
+                      'period_sec': extractor.rate_limiter.period_sec})
+
+    estimates, write_seconds, total_seconds = estimate_plan(
+        plans=plans, log=ThroughputLog(throughput_file),
+        db_writers=db_writers, concurrent=concurrent)
+    print_plan(estimates=estimates, write_seconds=write_seconds,
+               total_seconds=total_seconds, db_writers=db_writers,
+               concurrent=concurrent)
+
+
+def download_vendor_sources(database_options, quandl_key, sources, threads=4,
+                            verbose=False, dry_run=False, checkpoint=None,
+                            role=None):
+    """ Runs the data extractor for each of a vendor's sources, one after the
+    other. This is the target of each vendor's process.
+
+    :param database_options: Dictionary of the postgres database options
+    :param quandl_key: Optional string of the Quandl API key
+    :param sources: List of the vendor's source dictionaries
+    :param threads: Integer indicating how many threads should be used to
+        concurrently download data
     :param verbose: Boolean of whether debugging prints should occur.
+    :param dry_run: Boolean of whether the extractors should only plan their
+        downloads instead of downloading data
+    :param checkpoint: Optional RunCheckpoint that the extractors save their
+        planned and finished items to, allowing the run to be resumed
+    :param role: Optional string of the distributed role (coordinator or
+        worker) of the Google and Yahoo extractors
+    """
+
+    for source in sources:
+        download_source(database_options=database_options,
+                        quandl_key=quandl_key, source=source, threads=threads,
+                        verbose=verbose, dry_run=dry_run,
+                        checkpoint=checkpoint, role=role)
+
+
+def concurrent_vendor_download(database_options, quandl_key, download_list,
+                               threads=4, verbose=False, dry_run=False,
+                               progress_interval=60, checkpoint=None,
+                               role=None):
+    """ Download each vendor's sources in a separate process, so the vendors
+    are downloaded at the same time instead of one after the other. Each
+    vendor's sources are still downloaded in the order of the download list.
+    A combined progress report is printed while the vendors are running.
+
+    :param database_options: Dictionary of the postgres database options
+    :param quandl_key: Optional string of the Quandl API key
+    :param download_list: List of dictionaries, with each dictionary containing
+        all of the relevant variables for the specific source
+    :param threads: Integer indicating how many threads each vendor should use
+        to concurrently download data
+    :param verbose: Boolean of whether debugging prints should occur.
+    :param dry_run: Boolean of whether the extractors should only plan their
+        downloads instead of downloading data
+    :param progress_interval: Integer of the seconds between progress reports
+    :param checkpoint: Optional RunCheckpoint that the extractors save their
+        planned and finished items to, allowing the run to be resumed
+    :param role: Optional string of the distributed role (coordinator or
+        worker) of the Google and Yahoo extractors
+    """
+
+    # Group the sources by vendor, keeping the download list order
+    vendor_sources = OrderedDict()
+    for source in download_list:
+        vendor_sources.setdefault(source['source'], []).append(source)
+
+    start_time = time.time()
+    vendors = OrderedDict()
+    for vendor, sources in vendor_sources.items():
+        process = Process(target=download_vendor_sources, name=vendor,
+                          kwargs={'database_options': database_options,
+                                  'quandl_key': quandl_key,
+                                  'sources': sources, 'threads': threads,
+                                  'verbose': verbose, 'dry_run': dry_run,
+                                  'checkpoint': checkpoint,
+                                  'role': role})
+        process.start()
+        vendors[vendor] = {'process': process, 'end_time': None}
+    print('Downloading %s concurrently' % ', '.join(vendors.keys()))
+
+    last_report = time.time()
+    while any(item['end_time'] is None for item in vendors.values()):
+        time.sleep(1)
+        for item in vendors.values():
+            if item['end_time'] is None and not item['process'].is_alive():
+                item['process'].join()
+                item['end_time'] = time.time()
+        if time.time() - last_report >= progress_interval:
+            print_download_progress(vendors, start_time)
+            last_report = time.time()
+
+    print_download_progress(vendors, start_time)
+
+
+def print_download_progress(vendors, start_time):
+    """ Print the combined progress of the concurrently downloaded vendors.
+
+    :param vendors: Dictionary of each vendor's process and end time
+    :param start_time: Float of the time when the vendors were started
+    """
+
+    statuses = []
+    for vendor, item in vendors.items():
+        if item['end_time'] is None:
+            status = 'running'
+        elif item['process'].exitcode == 0:
+            status = ('finished in %0.1f minutes' %
+                      ((item['end_time'] - start_time) / 60))
+        else:
+            status = 'failed with exit code %s' % item['process'].exitcode
+        statuses.append('%s %s' % (vendor, status))
+
+    print('Download progress after %0.1f minutes: %s | %s rows written, '
+          '%0.1f MB downloaded' %
+          ((time.time() - start_time) / 60, '; '.join(statuses),
+           '{:,}'.format(write_stats['rows'].value),
+           transfer_stats['wire'].value / 1024 ** 2))
+
+
+def validated_tables(download_list):
+    """ Determine the price tables whose sources are cross validated.
+
+    :param download_list: List of dictionaries, with each dictionary containing
+        all of the relevant variables for the specific source
+    :return: List of the price tables
     """
 
     intervals = {}
@@ -346,10 +652,25 @@ def post_download_maintenance(database_options, download_list, period=None,
                               'data_download in pySecMaster.py' %
                               source['interval'])
 
-    for key, value in intervals.items():
-        # The key is the table name to process
-        table = key
+    # The keys are the table names to process
+    return list(intervals)
+
+
+def post_download_maintenance(database_options, download_list, period=None,
+                              verbose=False):
+    """ Perform tasks that require all data to be downloaded first, such as the
+    source cross validator function.
+
+    :param database_options: Dictionary of the postgres database options
+    :param download_list: List of dictionaries, with each dictionary containing
+        all of the relevant variables for the specific source
+    :param period: Optional integer indicating the prior number of days whose
+            values should be cross validated. If None is provided, then the
+            entire set of values will be validated.
+    :param verbose: Boolean of whether debugging prints should occur.
+    """
 
+    for table in validated_tables(download_list):
         if verbose:
             print('Starting cross validator for %s' % table)
 
@@ -372,6 +693,129 @@ def post_download_maintenance(database_options, download_list, period=None,
             table=table, tsid_list=tsid_list, period=period, verbose=verbose)
 
 
+def run_daemon(database_options, quandl_key, download_list, maintenance_args,
+               threads=4, verbose=False, validator_period=None,
+               db_writers=None, control_port=8765, session_schedule=True,
+               validate_on_ingest=False):
+    """ Keep running, downloading each source's exchange groups after their
+    session close. The exchanges that close at the same time with the same
+    holidays form a group, which has its own job for every source. Codes of
+    the exchanges without a known close are downloaded every time their
+    source's redownload time passes. The vendor ids, the exchanges and the
+    last prices stay warm in memory between the runs, so a refresh starts
+    without re-querying them. The table maintenance and the cross validator
+    are run once a day, unless the changed prices are cross validated as they
+    are written.
+
+    The local control endpoint shows the schedule and triggers the jobs:
+        curl http://127.0.0.1:8765/status
+        curl -X POST http://127.0.0.1:8765/run/google_us_main_minute
+        curl -X POST \\
+            http://127.0.0.1:8765/run/google_us_main_daily_america_new_york_1600
+        curl -X POST http://127.0.0.1:8765/stop
+
+    :param database_options: Dictionary of the postgres database options
+    :param quandl_key: Optional string of the Quandl API key
+    :param download_list: List of dictionaries, with each dictionary containing
+        all of the relevant variables for the specific source
+    :param maintenance_args: Dictionary of the maintenance arguments
+    :param threads: Integer indicating how many threads should be used to
+        concurrently download data
+    :param verbose: Boolean of whether debugging prints should occur.
+    :param validator_period: Optional integer of the prior days whose values
+        are cross validated
+    :param db_writers: Optional integer of the concurrent database writes
+    :param control_port: Integer of the control endpoint's local port
+    :param session_schedule: Boolean of whether the exchange groups are
+        downloaded after their session close; otherwise, every source is
+        downloaded after its redownload time
+    :param validate_on_ingest: Boolean of whether the ValidationListener cross
+        validates the changed prices while they are downloaded, replacing the
+        daily cross validator run
+    """
+
+    set_db_write_limit(db_writers)
+
+    cache = WarmCache()
+    scheduler = Scheduler()
+
+    groups = {}
+    if session_schedule:
+        groups = session_groups(cached(
+            cache, ('exchange_sessions',),
+            lambda: query_exchange_sessions(
+                database=database_options['database'],
+                user=database_options['user'],
+                password=database_options['password'],
+                host=database_options['host'],
+                port=database_options['port'])))
+    grouped_exchanges = [tsid_symbol for calendar, exchanges in groups.values()
+                         for tsid_symbol in exchanges]
+
+    for source in download_list:
+        name = '%s_%s_%s' % (source['source'], source['selection'],
+                             source['interval'])
+        for group, (calendar, exchanges) in groups.items():
+            group_source = dict(source, exchanges=exchanges)
+            scheduler.add('%s_%s' % (name, group),
+                          partial(download_source,
+                                  database_options=database_options,
+                                  quandl_key=quandl_key, source=group_source,
+                                  threads=threads, verbose=verbose,
+                                  cache=cache),
+                          interval=source['redownload_time'],
+                          next_time=calendar.next_refresh)
+        # The codes of the exchanges without a session close
+        remaining_source = dict(source, exclude_exchanges=grouped_exchanges)
+        scheduler.add(name,
+                      partial(download_source,
+                              database_options=database_options,
+                              quandl_key=quandl_key, source=remaining_source,
+                              threads=threads, verbose=verbose, cache=cache),
+                      interval=source['redownload_time'])
+
+    def daily_maintenance():
+        maintenance(database_options=database_options, quandl_key=quandl_key,
+                    threads=threads, **maintenance_args)
+        # The symbology and exchanges may have changed
+        cache.invalidate('exchanges')
+        cache.invalidate('vendor_id')
+
+    # The maintenance already ran when the daemon started
+    scheduler.add('maintenance', daily_maintenance, interval=60 * 60 * 24,
+                  run_now=False)
+
+    listener = None
+    if validate_on_ingest:
+        listener = ValidationListener(
+            database=database_options['database'],
+            user=database_options['user'],
+            password=database_options['password'],
+            host=database_options['host'],
+            port=database_options['port'],
+            tables=validated_tables(download_list), verbose=verbose).start()
+    else:
+        scheduler.add('post_download_maintenance',
+                      partial(post_download_maintenance,
+                              database_options=database_options,
+                              download_list=download_list,
+                              period=validator_period, verbose=verbose),
+                      interval=60 * 60 * 24, run_now=False)
+
+    control = ControlServer(scheduler, cache, port=control_port).start()
+    print('The pySecMaster daemon is running %s jobs; its control endpoint '
+          'is %s/status' % (len(scheduler.jobs), control.url))
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        print('Stopping the pySecMaster daemon')
+    finally:
+        control.stop()
+        if listener:
+            listener.stop()
+
+
 if __name__ == '__main__':
 
     # Establish the argument parser
@@ -386,23 +830,78 @@ if __name__ == '__main__':
     )
 
     # Optional arguments
+    role_group = parser.add_mutually_exclusive_group()
+    role_group.add_argument('--coordinator',
+        action='store_true',
+        help='Run the maintenance and queue the Google and Yahoo work items '
+             'in the database work queue, leaving the downloads to the '
+             'workers. Quandl sources are still downloaded by the '
+             'coordinator.')
+    role_group.add_argument('--worker',
+        action='store_true',
+        help='Download the Google and Yahoo work items claimed from the '
+             'database work queue until it is empty. Any number of workers '
+             'can run on any host against the same database. The '
+             'maintenance is left to the coordinator.')
     parser.add_argument('--csidata-update-range', type=int,
         default=7,
         help='Number of days before the data will be refreshed.')
+    parser.add_argument('--cluster-rate-limit',
+        action='store_true',
+        help='Share each vendor\'s call limit between every host downloading '
+             'into the database, with the calls granted through the '
+             'rate_limit_tokens table. This is always on for the coordinator '
+             'and workers.')
+    parser.add_argument('--control-port', type=int,
+        default=8765,
+        help='Local port of the daemon\'s control endpoint.')
+    parser.add_argument('--daemon',
+        action='store_true',
+        help='Keep running after the maintenance, downloading each source '
+             'again after its redownload time with the reference data and '
+             'last prices kept in memory. The status and manual runs are '
+             'available from the local control endpoint.')
+    parser.add_argument('--interval-schedule',
+        action='store_true',
+        help='Run the daemon\'s downloads every time their redownload time '
+             'passes, instead of downloading each exchange group after its '
+             'session close.')
     parser.add_argument('--daily-downloads', type=str, nargs='*',
         default=['quandl', 'yahoo', 'google'],
         help='Sources whose daily prices will be downloaded. By default, '
              'quandl, yahoo and google daily prices will be downloaded.')
+    parser.add_argument('--concurrent-vendors',
+        action='store_true',
+        help='Download the vendors at the same time, with each vendor running '
+             'in its own process. By default, the vendors are downloaded one '
+             'after the other.')
     parser.add_argument('--database-list', type=str, nargs='+',
         default=['WIKI'],
         help='The Quandl databases that will have their codes downloaded if '
              'the quanddl-ticker-source argument is set to quandl. '
              'Provide selections one after the other without quotes. Options '
              'include: WIKI, GOOG, YAHOO, SEC, EIA, JODI, CURRFX, FINRA.')
+    parser.add_argument('--db-writers', type=int,
+        default=4,
+        help='Maximum number of concurrent price writes to the database, '
+             'shared by all of the vendors.')
+    parser.add_argument('--dry-run',
+        action='store_true',
+        help='Only plan the downloads, saving the Google and Yahoo request '
+             'plans to CSV files in the load_tables directory, without '
+             'downloading any prices. The post download maintenance is '
+             'skipped.')
     parser.add_argument('--minute-downloads', type=str, nargs='*',
         help='Sources whose minute prices will be downloaded. Only google '
              'is implemented right now. By default, no minute prices are '
              'downloaded.')
+    parser.add_argument('--plan',
+        action='store_true',
+        help='Plan the downloads of every source without downloading any '
+             'prices or running the maintenance, then print the planned '
+             'items of each source and an estimate of how long the run will '
+             'take, based on the prior runs\' throughput, the vendors\' rate '
+             'limits and the database write rate.')
     parser.add_argument('--quandl-update-range', type=int,
         default=30,
         help='Number of days before the ticker tables will be refreshed. If '
@@ -415,6 +914,11 @@ if __name__ == '__main__':
              'list from Quandl (quandl), or make implied codes from the CSI '
              'data stock factsheet (csidata) which is more accurate but tries '
              'more non-existent tickers.')
+    parser.add_argument('--resume', type=str,
+        help='Run id of an interrupted download run to resume. Each '
+             'extractor continues with its saved plan, skipping the items '
+             'that were already finished. The run ids are the directory '
+             'names within the load_tables/checkpoints directory.')
     parser.add_argument('--symbology-sources', type=str, nargs='+',
         default = ['csi_data', 'tsid', 'quandl_wiki', 'quandl_eod',
                    'quandl_goog', 'seeking_alpha', 'yahoo'],
@@ -428,10 +932,28 @@ if __name__ == '__main__':
     parser.add_argument('-t', '--threads', type=int,
         help='Number of threads to allocate to the system. The total system '
              'cores are used by default.')
+    parser.add_argument('--time-budget', type=float,
+        help='Minutes the run may take, counted from its start. Once most of '
+             'the budget is spent, no new downloads are started, while the '
+             'in-flight downloads and their writes finish. The skipped items '
+             'can be resumed with --resume, and the cross validation pass is '
+             'skipped when the budget ran out. The daemon ignores it.')
     parser.add_argument('--validator-period', type=int,
         help='Prior number of days whose values should be cross validated, '
              'with 30 being a good option. If no value is provided, the '
              'entire period will be validated.')
+    parser.add_argument('--validate-on-ingest',
+        action='store_true',
+        help='Cross validate the changed tsid dates while their prices are '
+             'downloaded, with the writes notifying a validation listener '
+             'through Postgres LISTEN/NOTIFY. This replaces the cross '
+             'validation pass that runs after the downloads. Workers only '
+             'send the notifications.')
+    parser.add_argument('--vendor-server', type=str,
+        help='Root url of a local vendor stand-in server (i.e. '
+             'http://127.0.0.1:8000) that all vendor downloads will use '
+             'instead of the live vendors. Start the server with '
+             'utilities/vendor_server.py.')
     parser.add_argument('-v', '--verbose',
         action='store_true',
         help='Print out the status of the system.')
@@ -530,12 +1052,35 @@ if __name__ == '__main__':
                     source['interval'] == 'minute':
                 download_list.append(source)
 
+    if args.vendor_server:
+        # Point every vendor url at the stand-in server
+        database_url[0] = stand_in_url(database_url[0], args.vendor_server)
+        csidata_url = stand_in_url(csidata_url, args.vendor_server)
+        nasdaq_sector_industry_url = stand_in_url(nasdaq_sector_industry_url,
+                                                  args.vendor_server)
+        quandl_data_url[0] = stand_in_url(quandl_data_url[0],
+                                          args.vendor_server)
+        quandl_table_url[0] = stand_in_url(quandl_table_url[0],
+                                           args.vendor_server)
+        google_fin_url['root'] = stand_in_url(google_fin_url['root'],
+                                              args.vendor_server)
+        yahoo_fin_url['root'] = stand_in_url(yahoo_fin_url['root'],
+                                             args.vendor_server)
+        print('Vendor downloads will use the stand-in server at %s' %
+              args.vendor_server)
+
     if args.threads:
         threads = args.threads
     else:
         import multiprocessing
         threads = multiprocessing.cpu_count()
 
+    # Count the bytes downloaded by all vendor requests made during this run
+    reset_transfer_stats()
+
+    if args.time_budget and not args.daemon and not args.plan:
+        run_budget.start(args.time_budget * 60)
+
     # Try connecting to the postgres database
     while True:
         db_available = postgres_test(database_options=test_database_options)
@@ -548,29 +1093,98 @@ if __name__ == '__main__':
                   test_database_options['database'])
             time.sleep(1)
     
-    maintenance(database_options=test_database_options,
-                quandl_key=test_quandl_key,
-                quandl_ticker_source=args.quandl_ticker_source,
-                database_list=args.database_list,
-                threads=threads,
-                quandl_update_range=args.quandl_update_range,
-                csidata_update_range=args.csidata_update_range,
-                symbology_sources=args.symbology_sources)
-
-    if download_list:
+    maintenance_args = {
+        'quandl_ticker_source': args.quandl_ticker_source,
+        'database_list': args.database_list,
+        'quandl_update_range': args.quandl_update_range,
+        'csidata_update_range': args.csidata_update_range,
+        'symbology_sources': args.symbology_sources}
+
+    role = None
+    if args.coordinator:
+        role = 'coordinator'
+    elif args.worker:
+        role = 'worker'
+
+    if args.cluster_rate_limit or role:
+        use_cluster_rate_limits(test_database_options)
+
+    if args.validate_on_ingest:
+        set_price_notifications()
+
+    if role != 'worker' and not args.plan:
+        maintenance(database_options=test_database_options,
+                    quandl_key=test_quandl_key,
+                    threads=threads,
+                    **maintenance_args)
+
+    if args.plan:
+        plan_download(database_options=test_database_options,
+                      quandl_key=test_quandl_key,
+                      download_list=download_list,
+                      threads=threads,
+                      verbose=args.verbose,
+                      concurrent=args.concurrent_vendors,
+                      db_writers=args.db_writers)
+    elif args.daemon:
+        run_daemon(database_options=test_database_options,
+                   quandl_key=test_quandl_key,
+                   download_list=download_list,
+                   maintenance_args=maintenance_args,
+                   threads=threads,
+                   verbose=args.verbose,
+                   validator_period=args.validator_period,
+                   db_writers=args.db_writers,
+                   control_port=args.control_port,
+                   session_schedule=not args.interval_schedule,
+                   validate_on_ingest=args.validate_on_ingest)
+    elif download_list:
+        checkpoint = None
+        if not args.dry_run and not role:
+            checkpoint = RunCheckpoint(userdir['load_tables'] + '/checkpoints',
+                                       run_id=args.resume)
+            print('%s the %s download run; resume it with --resume %s' %
+                  ('Resuming' if checkpoint.resumed else 'Starting',
+                   checkpoint.run_id, checkpoint.run_id))
+        listener = None
+        if args.validate_on_ingest and not args.dry_run and not role:
+            listener = ValidationListener(
+                database=test_database_options['database'],
+                user=test_database_options['user'],
+                password=test_database_options['password'],
+                host=test_database_options['host'],
+                port=test_database_options['port'],
+                tables=validated_tables(download_list),
+                verbose=args.verbose).start()
         data_download(database_options=test_database_options,
                       quandl_key=test_quandl_key,
                       download_list=download_list,
                       threads=threads,
-                      verbose=args.verbose)
-        # 15 hours for complete build; adds ~6 GB
-        post_download_maintenance(database_options=test_database_options,
-                                  download_list=download_list,
-                                  period=args.validator_period,
-                                  verbose=args.verbose)
+                      verbose=args.verbose,
+                      dry_run=args.dry_run,
+                      concurrent=args.concurrent_vendors,
+                      db_writers=args.db_writers,
+                      checkpoint=checkpoint,
+                      role=role)
+        if listener:
+            listener.stop()
+        elif run_budget.exhausted():
+            print('Skipping the cross validator, as the time budget ran out')
+        elif not args.dry_run and not role:
+            # 15 hours for complete build; adds ~6 GB
+            post_download_maintenance(database_options=test_database_options,
+                                      download_list=download_list,
+                                      period=args.validator_period,
+                                      verbose=args.verbose)
+        if run_budget.summary():
+            print(run_budget.summary())
+            if checkpoint and run_budget.stopped_early():
+                print('Resume the skipped items with --resume %s' %
+                      checkpoint.run_id)
     else:
         print('No download sources were specified for either the daily data '
               'or the minute data, therefore no prices will be downloaded nor '
               'will the post download maintenance functions be run.')
 
+    print_transfer_stats()
     print(datetime.now())
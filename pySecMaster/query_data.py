@@ -5,6 +5,8 @@ import psycopg2
 import re
 import time
 
+from utilities.database_queries import copy_query, stream_query
+
 __author__ = 'Josh Schertz'
 __copyright__ = 'Copyright (C) 2018 Josh Schertz'
 __description__ = 'An automated system to store and maintain financial data.'
@@ -30,6 +32,12 @@ __version__ = '1.5.0'
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+# The price columns of each price table
+price_fields = {
+    'daily_prices': ['open', 'high', 'low', 'close', 'volume', 'dividend',
+                     'split'],
+    'minute_prices': ['open', 'high', 'low', 'close', 'volume']}
+
 
 def calculate_adjusted_prices(df, column):
     """ Vectorized approach for calculating the adjusted prices for the
@@ -72,6 +80,321 @@ def calculate_adjusted_prices(df, column):
     return df
 
 
+def adjust_panel_prices(df, column='close'):
+    """ Vectorized version of calculate_adjusted_prices for a panel of many
+    tsids, adding the 'adj_<column name>' column. Each tsid's newest price is
+    kept, with the older prices scaled by the later splits and dividends.
+
+    :param df: DataFrame with the tsid, date, dividend and split columns along
+        with the price column
+    :param column: String of which price column should have adjusted prices
+        created for it
+    :return: DataFrame with the addition of the adjusted price column, sorted
+        by the tsid and date
+    """
+
+    df = df.sort_values(['tsid', 'date'], ascending=[True, False])
+    tsids = df['tsid']
+    price = df[column]
+    later_price = price.groupby(tsids).shift(1)
+    later_split = df['split'].groupby(tsids).shift(1)
+    later_dividend = df['dividend'].groupby(tsids).shift(1)
+
+    # Ratio of each adjusted price to the next day's adjusted price
+    ratio = ((price / later_split - later_dividend) / later_price).fillna(1)
+    newest_price = price.groupby(tsids).transform('first')
+    df['adj_' + column] = (newest_price *
+                           ratio.groupby(tsids).cumprod()).round(4)
+
+    return df.sort_values(['tsid', 'date'])
+
+
+def panel_filters(source, tsids=None, basket=None, exchanges=None,
+                  sectors=None):
+    """ Build the WHERE conditions that select the panel's tsids.
+
+    :param source: String of the price source
+    :param tsids: Optional list of the tsids
+    :param basket: Optional string of the basket name, whose tsids are used
+    :param exchanges: Optional list of the tsid exchange symbols
+    :param sectors: Optional list of the ticker sectors
+    :return: Tuple of the list of condition strings and their parameters
+    """
+
+    conditions = []
+    params = []
+    if tsids is not None:
+        conditions.append('source_id = ANY(%s)')
+        params.append(list(tsids))
+    if basket is not None:
+        conditions.append("""source_id IN (
+                            SELECT bv.source_id
+                            FROM basket_values AS bv
+                            INNER JOIN baskets AS b
+                                ON b.basket_id = bv.basket_id
+                            WHERE b.name = %s AND bv.source = %s)""")
+        params.extend([basket, source])
+    if exchanges is not None:
+        conditions.append("""source_id IN (
+                            SELECT t.tsid
+                            FROM tickers AS t
+                            INNER JOIN exchanges AS e
+                                ON e.exchange_id = t.exchange_id
+                            WHERE e.tsid_symbol = ANY(%s))""")
+        params.append(list(exchanges))
+    if sectors is not None:
+        conditions.append("""source_id IN (
+                            SELECT tsid
+                            FROM tickers
+                            WHERE sector = ANY(%s))""")
+        params.append(list(sectors))
+    return conditions, params
+
+
+def panel_where(source, data_vendor_id, beg_date, end_date, tsids=None,
+                basket=None, exchanges=None, sectors=None):
+    """ Build the WHERE clause of a panel query.
+
+    :param source: String of the price source
+    :param data_vendor_id: Integer of which data vendor id to return prices for
+    :param beg_date: String of the ISO date to start with
+    :param end_date: String of the ISO date to end with
+    :param tsids: Optional list of the tsids
+    :param basket: Optional string of the basket name, whose tsids are used
+    :param exchanges: Optional list of the tsid exchange symbols
+    :param sectors: Optional list of the ticker sectors
+    :return: Tuple of the WHERE clause string and its parameters
+    """
+
+    conditions, filter_params = panel_filters(
+        source=source, tsids=tsids, basket=basket, exchanges=exchanges,
+        sectors=sectors)
+    where = ' AND '.join(['source=%s', 'data_vendor_id=%s', 'date>=%s',
+                          'date<=%s'] + conditions)
+    return where, [source, data_vendor_id, beg_date, end_date] + filter_params
+
+
+def table_price_fields(table):
+    """
+    :param table: String of the price table
+    :return: List of the table's price columns
+    """
+
+    if table not in price_fields:
+        raise NotImplementedError('Table %s is not implemented for the price '
+                                  'panels' % table)
+    return list(price_fields[table])
+
+
+def panel_query(table, fields, source, data_vendor_id, beg_date, end_date,
+                **filters):
+    """ Build the query of a panel's prices, ordered by the tsid and date.
+
+    :param table: String of the price table
+    :param fields: List of the price columns to select
+    :param source: String of the price source
+    :param data_vendor_id: Integer of which data vendor id to return prices for
+    :param beg_date: String of the ISO date to start with
+    :param end_date: String of the ISO date to end with
+    :param filters: The tsids, basket, exchanges and sectors for panel_where
+    :return: Tuple of the query string and its parameters
+    """
+
+    where, params = panel_where(
+        source=source, data_vendor_id=data_vendor_id, beg_date=beg_date,
+        end_date=end_date, **filters)
+    query = ('SELECT date, source_id AS tsid, %s FROM %s WHERE %s '
+             'ORDER BY source_id, date' % (', '.join(fields), table, where))
+    return query, params
+
+
+def stream_price_panel(database, user, password, host, port, table,
+                       data_vendor_id, beg_date, end_date, tsids=None,
+                       basket=None, exchanges=None, sectors=None, fields=None,
+                       fetch_size=100000, records=False, source='tsid'):
+    """ Stream the prices of any number of tsids from a server-side cursor,
+    yielding chunks of up to fetch_size rows. Only a single chunk is held in
+    memory at a time, so years of minute prices can be aggregated or exported
+    in constant memory (i.e. the streaming version of pull_minute_prices is
+    stream_price_panel with table='minute_prices' and tsids=[tsid]). The rows
+    are ordered by the tsid and date, so a tsid's prices are contiguous.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param table: String of the price table (daily_prices or minute_prices)
+    :param data_vendor_id: Integer of which data vendor id to return prices for
+    :param beg_date: String of the ISO date to start with
+    :param end_date: String of the ISO date to end with
+    :param tsids: Optional list of the tsids
+    :param basket: Optional string of the basket name whose tsids are used
+    :param exchanges: Optional list of the tsid exchange symbols (i.e. Q)
+    :param sectors: Optional list of the ticker sectors
+    :param fields: Optional list of the price columns to return; defaults to
+        all of the table's price columns
+    :param fetch_size: Integer of the rows in each chunk
+    :param records: Boolean of whether to yield numpy record arrays instead of
+        DataFrames
+    :param source: String of the ticker's source
+    :return: Generator of the DataFrames (or record arrays) with the date,
+        tsid and price field columns
+    """
+
+    query, params = panel_query(
+        table=table, fields=list(fields or table_price_fields(table)),
+        source=source, data_vendor_id=data_vendor_id, beg_date=beg_date,
+        end_date=end_date, tsids=tsids, basket=basket, exchanges=exchanges,
+        sectors=sectors)
+
+    return stream_query(database=database, user=user, password=password,
+                        host=host, port=port, query=query, params=params,
+                        fetch_size=fetch_size, records=records)
+
+
+def pull_price_panel(database, user, password, host, port, table,
+                     data_vendor_id, beg_date, end_date, tsids=None,
+                     basket=None, exchanges=None, sectors=None, fields=None,
+                     adjust=False, wide=False, max_rows=5000000,
+                     source='tsid', copy=True, fetch_size=100000):
+    """ Query the prices of many tsids with a single query, instead of one
+    query and connection per tsid. The tsids are selected by any combination
+    of the tsid list, basket, exchanges and sectors; without any of them, every
+    tsid is included. The matching rows are counted before any prices are
+    fetched, and the query is refused if the panel would exceed max_rows.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param table: String of the price table (daily_prices or minute_prices)
+    :param data_vendor_id: Integer of which data vendor id to return prices for
+    :param beg_date: String of the ISO date to start with
+    :param end_date: String of the ISO date to end with
+    :param tsids: Optional list of the tsids
+    :param basket: Optional string of the basket name whose tsids are used
+    :param exchanges: Optional list of the tsid exchange symbols (i.e. Q)
+    :param sectors: Optional list of the ticker sectors
+    :param fields: Optional list of the price columns to return; defaults to
+        all of the table's price columns
+    :param adjust: Boolean of whether to add the adj_close column; only the
+        daily prices have the dividends and splits to adjust with
+    :param wide: Boolean of whether to return a date by tsid frame of each
+        field instead of the long frame
+    :param max_rows: Integer of the most price rows the panel may have, which
+        bounds its memory use; None removes the bound
+    :param source: String of the ticker's source
+    :param copy: Boolean of whether to read the prices with COPY, which
+        decodes them straight into float columns, instead of streaming them
+        from a server-side cursor
+    :param fetch_size: Integer of the rows streamed from the server-side
+        cursor at a time, which keeps the raw rows from piling up in memory
+    :return: DataFrame of the long prices indexed by the date and tsid, or the
+        wide prices indexed by the date with a column per tsid (per field and
+        tsid when there are multiple fields)
+    """
+
+    if adjust and table != 'daily_prices':
+        raise NotImplementedError('Only the daily prices have the dividends '
+                                  'and splits to adjust with')
+
+    fields = list(fields or table_price_fields(table))
+    query_fields = list(fields)
+    if adjust:
+        query_fields += [field for field in ['close', 'dividend', 'split']
+                         if field not in query_fields]
+
+    filters = {'tsids': tsids, 'basket': basket, 'exchanges': exchanges,
+               'sectors': sectors}
+
+    if max_rows:
+        where, params = panel_where(
+            source=source, data_vendor_id=data_vendor_id, beg_date=beg_date,
+            end_date=end_date, **filters)
+
+        conn = psycopg2.connect(database=database, user=user,
+                                password=password, host=host, port=port)
+
+        try:
+            with conn:
+                cur = conn.cursor()
+                cur.execute('SELECT count(*) FROM %s WHERE %s' %
+                            (table, where), params)
+                rows = cur.fetchone()[0]
+        except psycopg2.Error as e:
+            print(e)
+            raise SystemError('Failed to count the panel prices from the %s '
+                              'table within pull_price_panel' % table)
+        except conn.OperationalError:
+            raise SystemError('Unable to connect to the %s database in '
+                              'pull_price_panel. Make sure the database '
+                              'address/name are correct.' % database)
+        except Exception as e:
+            print(e)
+            raise SystemError('Error: Unknown issue occurred in '
+                              'pull_price_panel')
+
+        conn.close()
+
+        if rows > max_rows:
+            raise SystemError('The panel has %s rows, above the max_rows of '
+                              '%s. Narrow the tsids or date range, stream it '
+                              'with stream_price_panel, or raise max_rows.' %
+                              ('{:,}'.format(rows), '{:,}'.format(max_rows)))
+
+    print('Extracting the %s panel prices' % table)
+    dtypes = {field: 'float64' for field in query_fields}
+    if copy:
+        query, params = panel_query(
+            table=table, fields=query_fields, source=source,
+            data_vendor_id=data_vendor_id, beg_date=beg_date,
+            end_date=end_date, **filters)
+        df = copy_query(database=database, user=user, password=password,
+                        host=host, port=port, query=query, params=params,
+                        dtypes=dtypes, dates=['date'])
+    else:
+        chunks = list(stream_price_panel(
+            database=database, user=user, password=password, host=host,
+            port=port, table=table, data_vendor_id=data_vendor_id,
+            beg_date=beg_date, end_date=end_date, fields=query_fields,
+            fetch_size=fetch_size, source=source, **filters))
+
+        if chunks:
+            df = pd.concat(chunks, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=['date', 'tsid'] + query_fields)
+        df = df.astype(dtypes)
+
+    if adjust:
+        df = adjust_panel_prices(df, column='close')
+        fields.append('adj_close')
+
+    return price_panel_layout(df, fields, wide)
+
+
+def price_panel_layout(df, fields, wide=False):
+    """ Arrange the panel's prices in the long or wide layout.
+
+    :param df: DataFrame with the date and tsid columns along with the fields
+    :param fields: List of the price columns to keep
+    :param wide: Boolean of whether to return a date by tsid frame of each
+        field instead of the long frame
+    :return: DataFrame of the long prices indexed by the date and tsid, or the
+        wide prices indexed by the date with a column per tsid (per field and
+        tsid when there are multiple fields)
+    """
+
+    if wide:
+        return df.pivot(index='date', columns='tsid',
+                        values=fields[0] if len(fields) == 1 else fields)
+
+    df = df.set_index(['date', 'tsid'])[fields]
+    df.sort_index(inplace=True)
+    return df
+
+
 def pull_daily_prices(database, user, password, host, port, query_type,
                       data_vendor_id, beg_date, end_date, adjust=True,
                       source='tsid', *args):
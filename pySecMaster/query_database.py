@@ -2,6 +2,8 @@ import pandas as pd
 import psycopg2
 import time
 
+from utilities.database_queries import copy_to_file, stream_query
+
 __author__ = 'Josh Schertz'
 __copyright__ = 'Copyright (C) 2018 Josh Schertz'
 __description__ = 'An automated system to store and maintain financial data.'
@@ -76,6 +78,48 @@ def query_entire_table(database, user, password, host, port, table):
         print(e)
         raise SystemError('Error: Unknown issue occurred in query_entire_table')
 
+
+def stream_entire_table(database, user, password, host, port, table,
+                        fetch_size=50000, records=False):
+    """ Stream every row of the specified table from a server-side cursor,
+    yielding chunks of up to fetch_size rows.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param table: String of the table whose values should be returned
+    :param fetch_size: Integer of the rows in each chunk
+    :param records: Boolean of whether to yield numpy record arrays instead of
+        DataFrames
+    :return: Generator of the DataFrames (or record arrays) of the rows
+    """
+
+    return stream_query(database=database, user=user, password=password,
+                        host=host, port=port, query='SELECT * FROM %s' % table,
+                        fetch_size=fetch_size, records=records)
+
+
+def export_table_csv(database, user, password, host, port, table, path):
+    """ Export every row of the specified table to a CSV file with COPY, so
+    the rows are written as the server sends them, in constant memory.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param table: String of the table whose values should be exported
+    :param path: String of the CSV file path
+    :return: Integer of the rows exported
+    """
+
+    with open(path, 'w', newline='') as f:
+        return copy_to_file(database, user, password, host, port,
+                            query='SELECT * FROM %s' % table, f=f)
+
+
 if __name__ == '__main__':
 
     from utilities.user_dir import user_dir
@@ -0,0 +1,68 @@
+import pandas as pd
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('..')
+
+from utilities.checkpoint import RunCheckpoint
+from utilities.refresh_policy import has_new_prices, last_price_date
+
+
+class CheckpointTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_resume_remaining_items(self):
+        checkpoint = RunCheckpoint(self.temp_dir)
+        stage = checkpoint.stage('yahoo_us_main_daily_prices')
+        records = [('A.Q.0', 'url_a', None), ('B.Q.0', 'url_b', None),
+                   ('C.Q.0', 'url_c', None), ('D.Q.0', 'url_d', None)]
+        stage.save_plan({'records': records})
+        stage.start('A.Q.0')
+        stage.start('B.Q.0')
+        stage.done('A.Q.0')
+        stage.start('C.Q.0')
+        stage.done('C.Q.0')
+
+        resumed = RunCheckpoint(self.temp_dir, run_id=checkpoint.run_id)
+        resumed_stage = resumed.stage('yahoo_us_main_daily_prices')
+        self.assertTrue(resumed.resumed)
+        self.assertTrue(resumed_stage.has_plan())
+        self.assertFalse(resumed_stage.is_complete())
+
+        remaining = resumed_stage.remaining(
+            resumed_stage.load_plan()['records'])
+        # The in-flight item is retried before the never started items
+        self.assertEqual([item[0] for item in remaining], ['B.Q.0', 'D.Q.0'])
+
+    def test_resumed_price_dates(self):
+        checkpoint = RunCheckpoint(self.temp_dir)
+        stage = checkpoint.stage('google_us_main_daily_prices')
+        latest_prices = pd.DataFrame(
+            {'date': pd.to_datetime(['2018-03-09'], utc=True)},
+            index=pd.Index(['A.Q.0'], name='tsid'))
+        stage.save_plan({'records': [('A.Q.0', 'url_a', None)],
+                         'latest_prices': latest_prices})
+
+        resumed = RunCheckpoint(self.temp_dir, run_id=checkpoint.run_id)
+        resumed_prices = resumed.stage(
+            'google_us_main_daily_prices').load_plan()['latest_prices']
+
+        # Replaced prices of a resumed item aren't counted as a change
+        clean_data = pd.DataFrame({'date': ['2018-03-08', '2018-03-09']})
+        self.assertFalse(has_new_prices(
+            clean_data, last_price_date(resumed_prices, 'A.Q.0')))
+
+    def test_missing_run(self):
+        with self.assertRaises(OSError):
+            RunCheckpoint(self.temp_dir, run_id='20180101_000000')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import sys
+import time
+import unittest
+
+sys.path.append('..')
+
+from download import CircuitBreaker, CircuitOpenError
+from extractor import multithread_with_breaker
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def test_opens_at_threshold(self):
+        breaker = CircuitBreaker('Test', threshold=2, cooldown=60)
+        self.assertFalse(breaker.record_failure())
+        self.assertEqual(breaker.health(), 0.5)
+        self.assertTrue(breaker.record_failure())
+
+        self.assertTrue(breaker.is_open())
+        self.assertEqual(breaker.health(), 0.0)
+        self.assertGreater(breaker.seconds_until_probe(), 59)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+
+    def test_probe(self):
+        breaker = CircuitBreaker('Test', threshold=1, cooldown=60)
+        breaker.record_failure()
+        # Skip the cooldown
+        breaker.opened_at.value = time.time() - 60
+
+        # The first request after the cooldown is the probe
+        self.assertFalse(breaker.is_open())
+        breaker.before_request()
+        self.assertEqual(breaker.state.value, CircuitBreaker.half_open)
+        self.assertTrue(breaker.is_open())
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+
+        # A failed probe opens the circuit for another cooldown
+        self.assertTrue(breaker.record_failure())
+        self.assertGreater(breaker.seconds_until_probe(), 59)
+
+        breaker.opened_at.value = time.time() - 60
+        breaker.before_request()
+        breaker.record_success()
+        self.assertFalse(breaker.is_open())
+        self.assertEqual(breaker.health(), 1.0)
+
+
+class MultithreadWithBreakerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('Test', threshold=1, cooldown=0)
+        self.breaker.record_failure()
+        self.calls = []
+
+    def test_probe_then_rerun(self):
+        runs = []
+
+        def runner(items):
+            runs.append(list(items))
+            # The breaker opened during the first run, skipping every item
+            return list(items) if len(runs) == 1 else [None] * len(items)
+
+        def probe(item):
+            self.calls.append(item)
+            return None
+
+        multithread_with_breaker(probe, [1, 2, 3], threads=1,
+                                 breaker=self.breaker, runner=runner)
+
+        # The probe succeeded, so the remaining items were run again
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(runs, [[1, 2, 3], [2, 3]])
+
+    def test_gives_up(self):
+        def skipped(item):
+            self.calls.append(item)
+            return item
+
+        multithread_with_breaker(skipped, [1, 2], threads=1,
+                                 breaker=self.breaker, max_probes=2,
+                                 runner=lambda items: list(items))
+
+        # Only the first item is probed, and it is left after two failures
+        self.assertEqual(self.calls, [1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
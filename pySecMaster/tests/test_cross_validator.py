@@ -0,0 +1,69 @@
+import pandas as pd
+import sys
+import unittest
+
+sys.path.append('..')
+
+import cross_validator
+from cross_validator import PendingChanges, ValidationListener, \
+    validation_days
+
+
+class PendingChangesTests(unittest.TestCase):
+
+    def test_merged_ranges(self):
+        changes = PendingChanges()
+        self.assertFalse(changes.ready(delay=0))
+
+        changes.add({'table': 'daily_prices', 'tsid': 'AAPL.Q.0',
+                     'vendor_id': 3, 'beg_date': '2018-03-07T00:00:00',
+                     'end_date': '2018-03-08T00:00:00'})
+        changes.add({'table': 'daily_prices', 'tsid': 'AAPL.Q.0',
+                     'vendor_id': 4, 'beg_date': '2018-03-05T00:00:00',
+                     'end_date': '2018-03-07T00:00:00'})
+        changes.add({'table': 'daily_prices', 'tsid': 'MSFT.Q.0',
+                     'vendor_id': 3, 'beg_date': '2018-03-09T00:00:00',
+                     'end_date': '2018-03-09T00:00:00'})
+
+        self.assertFalse(changes.ready(delay=60))
+        self.assertTrue(changes.ready(delay=60,
+                                      now=changes.first_change + 60))
+
+        # Both vendors' AAPL changes are validated as a single range
+        self.assertEqual(changes.pop(), {'daily_prices': {
+            'AAPL.Q.0': ('2018-03-05T00:00:00', '2018-03-08T00:00:00'),
+            'MSFT.Q.0': ('2018-03-09T00:00:00', '2018-03-09T00:00:00')}})
+        self.assertFalse(changes.ready(delay=0))
+
+    def test_validation_days(self):
+        beg_date, end_date = validation_days('2018-03-09T14:31:00',
+                                             '2018-03-09T20:59:00')
+        self.assertEqual(beg_date, pd.Timestamp('2018-03-09', tz='UTC'))
+        self.assertEqual(end_date, pd.Timestamp('2018-03-10', tz='UTC'))
+
+
+class ValidationListenerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.validations = []
+        self.cross_validate = cross_validator.CrossValidate
+        cross_validator.CrossValidate = \
+            lambda **kwargs: self.validations.append(kwargs)
+
+    def tearDown(self):
+        cross_validator.CrossValidate = self.cross_validate
+
+    def test_validate_with_threads(self):
+        listener = ValidationListener('db', 'user', 'password', 'host', 5432,
+                                      tables=['daily_prices'])
+        listener.validate({'daily_prices': {
+            'AAPL.Q.0': ('2018-03-05T00:00:00', '2018-03-08T00:00:00')}})
+
+        # The listener's thread never forks a process pool
+        self.assertEqual(self.validations[0]['backend'], 'thread')
+        self.assertEqual(self.validations[0]['tsid_list'], ['AAPL.Q.0'])
+        self.assertEqual(listener.validated, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
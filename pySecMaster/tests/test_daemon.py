@@ -0,0 +1,88 @@
+import json
+import pandas as pd
+import sys
+import threading
+import unittest
+from urllib.request import Request, urlopen
+
+sys.path.append('..')
+
+from utilities.daemon import ControlServer, Scheduler, WarmCache
+
+
+class WarmCacheTests(unittest.TestCase):
+
+    def test_last_price_updates(self):
+        cache = WarmCache()
+        loads = []
+
+        def load_last_prices():
+            loads.append(True)
+            return pd.DataFrame(
+                {'date': pd.to_datetime(['2018-03-01'], utc=True),
+                 'updated_date': pd.to_datetime(['2018-03-01'], utc=True)},
+                index=pd.Index(['AAPL.Q.0'], name='tsid'))
+
+        key = ('last_price', 'daily_prices', 3)
+        cache.get(key, load_last_prices)
+        cache.update_last_price('daily_prices', 3, 'AAPL.Q.0', '2018-03-02')
+        cache.update_last_price('daily_prices', 3, 'MSFT.Q.0', '2018-03-02')
+
+        latest_prices = cache.get(key, load_last_prices)
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(list(latest_prices['date']),
+                         list(pd.to_datetime(['2018-03-02'] * 2, utc=True)))
+
+        cache.invalidate('last_price')
+        cache.get(key, load_last_prices)
+        self.assertEqual(len(loads), 2)
+
+
+class SchedulerTests(unittest.TestCase):
+
+    def test_next_time(self):
+        scheduler = Scheduler()
+        scheduler.add('after_close', lambda: None, interval=60,
+                      run_now=False, next_time=lambda now: now + 7200)
+        self.assertGreater(scheduler.status()['after_close']['next_run_in'],
+                           7000)
+
+        scheduler.run_job('after_close')
+        self.assertGreater(scheduler.status()['after_close']['next_run_in'],
+                           7000)
+
+
+class ControlServerTests(unittest.TestCase):
+
+    def test_trigger_and_stop(self):
+        runs = []
+        scheduler = Scheduler()
+        scheduler.add('refresh', lambda: runs.append(True), interval=3600,
+                      run_now=False)
+        control = ControlServer(scheduler, WarmCache(), port=0).start()
+        thread = threading.Thread(target=scheduler.run_forever)
+        thread.start()
+        try:
+            urlopen(Request(control.url + '/run/refresh', data=b'',
+                            method='POST')).read()
+            for _ in range(50):
+                if runs:
+                    break
+                thread.join(0.1)
+            self.assertEqual(len(runs), 1)
+
+            status = json.loads(urlopen(control.url + '/status').read())
+            self.assertEqual(status['jobs']['refresh']['runs'], 1)
+            self.assertGreater(status['jobs']['refresh']['next_run_in'], 3000)
+
+            urlopen(Request(control.url + '/stop', data=b'',
+                            method='POST')).read()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        finally:
+            scheduler.stop()
+            control.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
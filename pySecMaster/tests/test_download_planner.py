@@ -0,0 +1,58 @@
+from datetime import datetime, time, timezone
+import pandas as pd
+import sys
+import unittest
+
+sys.path.append('..')
+
+from utilities.download_planner import last_session_dates, \
+    select_active_codes
+
+
+class DownloadPlannerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.sessions_df = pd.DataFrame(
+            {'utc_offset': [-5.0, 0.0], 'close': [time(16), time(16, 30)]},
+            index=pd.Index(['Q', 'LON'], name='tsid_symbol'))
+
+    def test_last_session_dates(self):
+        # Monday at 18:00 UTC; New York is still open while London closed
+        now = datetime(2018, 3, 12, 18, tzinfo=timezone.utc)
+        dates = last_session_dates(self.sessions_df, now=now)
+        self.assertEqual(dates['Q'], pd.Timestamp('2018-03-09', tz='UTC'))
+        self.assertEqual(dates['LON'], pd.Timestamp('2018-03-12', tz='UTC'))
+
+    def test_select_active_codes(self):
+        codes_df = pd.DataFrame({'tsid': ['AAPL.Q.0', 'DEAD.Q.0', 'OLD.Q.0',
+                                          'VOD.LON.0', 'NEW.Q.0']})
+        activity_df = pd.DataFrame(
+            {'is_active': [1, 0, 0, 1],
+             'end_date': pd.to_datetime(['2018-03-09', '2016-05-02',
+                                         '2016-05-02', '2018-03-09']).date},
+            index=pd.Index(['AAPL.Q.0', 'DEAD.Q.0', 'OLD.Q.0', 'VOD.LON.0'],
+                           name='tsid'))
+        latest_prices = pd.DataFrame(
+            {'date': pd.to_datetime(['2018-03-09', '2016-05-02', '2016-04-01',
+                                     '2018-03-09'], utc=True)},
+            index=pd.Index(['AAPL.Q.0', 'DEAD.Q.0', 'OLD.Q.0', 'VOD.LON.0'],
+                           name='tsid'))
+        now = datetime(2018, 3, 12, 18, tzinfo=timezone.utc)
+
+        selected, skipped = select_active_codes(
+            codes_df, activity_df, self.sessions_df, latest_prices, now=now)
+        # The delisted code with all its prices and the code whose exchange
+        #   hasn't finished a session since Friday are skipped
+        self.assertEqual(list(selected['tsid']),
+                         ['OLD.Q.0', 'VOD.LON.0', 'NEW.Q.0'])
+        self.assertEqual(skipped, {'inactive': 1, 'no_session': 1})
+
+        selected, skipped = select_active_codes(
+            codes_df, activity_df, self.sessions_df, latest_prices,
+            intraday=True, now=now)
+        self.assertEqual(list(selected['tsid']),
+                         ['AAPL.Q.0', 'OLD.Q.0', 'VOD.LON.0', 'NEW.Q.0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,9 @@ from datetime import datetime
 import os
 import pandas as pd
 import psycopg2
+import shutil
 import sys
+import tempfile
 import unittest
 
 sys.path.append('..')
@@ -33,6 +35,9 @@ class GoogleFinanceDownloadTests(unittest.TestCase):
             'fields': 'f=d,c,v,o,h,l',
         }    # order doesn't change anything
 
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
         self.exchanges_df = self.query_exchanges()
 
     def test_download_google_daily_price_data(self):
@@ -40,7 +45,7 @@ class GoogleFinanceDownloadTests(unittest.TestCase):
         self.google_fin_url['period'] += str(60) + 'd'
         tsid = 'AAPL.Q.0'
 
-        csv_wo_data = 'test_goog_daily_wo_data.csv'
+        csv_wo_data = os.path.join(self.temp_dir, 'goog_daily_wo_data.csv')
         with open(csv_wo_data, 'w') as csv_file:
             writer = csv.writer(csv_file)
             writer.writerow(['tsid', 'date_tried'])
@@ -49,14 +54,13 @@ class GoogleFinanceDownloadTests(unittest.TestCase):
             tsid=tsid, exchanges_df=self.exchanges_df, csv_out=csv_wo_data)
         print(test_df)
         self.assertGreater(len(test_df.index), 1)
-        os.remove(csv_wo_data)
 
     def test_download_google_minute_price_data(self):
         self.google_fin_url['interval'] += str(60)
         self.google_fin_url['period'] += str(20) + 'd'
         tsid = 'AAPL.Q.0'
 
-        csv_wo_data = 'test_goog_minute_wo_data.csv'
+        csv_wo_data = os.path.join(self.temp_dir, 'goog_minute_wo_data.csv')
         with open(csv_wo_data, 'w') as csv_file:
             writer = csv.writer(csv_file)
             writer.writerow(['tsid', 'date_tried'])
@@ -65,7 +69,6 @@ class GoogleFinanceDownloadTests(unittest.TestCase):
             tsid=tsid, exchanges_df=self.exchanges_df, csv_out=csv_wo_data)
         print(test_df)
         self.assertGreater(len(test_df.index), 1)
-        os.remove(csv_wo_data)
 
     def query_exchanges(self):
         """ Retrieve the exchange symbols for goog and tsid, which will be used
@@ -129,16 +132,18 @@ class YahooFinanceDownloadTests(unittest.TestCase):
             'cookie': 'crumb=',        # Cookie value
         }
 
-        self.csv_wo_data = 'test_yahoo_daily_wo_data.csv'
+        # The output files are removed even if the setup fails
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.csv_wo_data = os.path.join(self.temp_dir,
+                                        'yahoo_daily_wo_data.csv')
         with open(self.csv_wo_data, 'w') as csv_file:
             writer = csv.writer(csv_file)
             writer.writerow(['tsid', 'date_tried'])
 
         self.exchanges_df = self.query_exchanges()
 
-    def tearDown(self):
-        os.remove(self.csv_wo_data)
-
     def test_download_yahoo_daily_price_data(self):
         self.yahoo_fin_url['interval'] += '1d'
         self.yahoo_fin_url['events'] += 'history'
@@ -226,14 +231,15 @@ class QuandlDownloadTests(unittest.TestCase):
         db_url = ['https://www.quandl.com/api/v1/datasets/', '.csv']
         self.qd = QuandlDownload(quandl_token=quandl_token, db_url=db_url)
 
-        self.csv_wo_data = 'test_quandl_codes_wo_data.csv'
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.csv_wo_data = os.path.join(self.temp_dir,
+                                        'quandl_codes_wo_data.csv')
         with open(self.csv_wo_data, 'w') as csv_file:
             writer = csv.writer(csv_file)
             writer.writerow(['q_code', 'date_tried'])
 
-    def tearDown(self):
-        os.remove(self.csv_wo_data)
-
     def test_download_quandl_data(self):
         test_df = self.qd.download_quandl_data('WIKI/AAPL', self.csv_wo_data)
         print(test_df.head(5))
@@ -0,0 +1,127 @@
+import numpy as np
+import pickle
+import sys
+from threading import Event, Thread
+import unittest
+
+sys.path.append('..')
+
+from utilities.multithread import EndItem, WorkerMethod, create_executor, \
+    multithread, parse_pool_context, pipeline
+
+
+def fetch_item(item):
+    if item == 'skip':
+        return EndItem('skipped')
+    elif item == 'missing':
+        return None
+    return item * 2
+
+
+def parse_item(item, data):
+    if item == 'bad':
+        raise ValueError('Unable to parse %s' % item)
+    return len(data)
+
+
+def square_item(item):
+    if item < 0:
+        raise ValueError('Unable to square %s' % item)
+    return item * item
+
+
+async def async_square_item(item):
+    return square_item(item)
+
+
+class PriceLookup(object):
+
+    def __init__(self):
+        self.prices = np.arange(1000000, dtype=np.float64)
+
+    def lookup(self, item):
+        return self.prices[item]
+
+
+class ExecutorTests(unittest.TestCase):
+
+    def test_backends(self):
+        items = [1, 2, -3, 4, 5, -6, 7]
+        for backend in ('thread', 'process', 'asyncio'):
+            progress = []
+            executor = create_executor(
+                backend, workers=2, chunk_size=2,
+                progress=lambda completed, total: progress.append(completed))
+            results = executor.map(square_item, items)
+            self.assertEqual(results, [1, 4, None, 16, 25, None, 49])
+            self.assertEqual(sorted(failure.item for failure in
+                                    executor.failure_report()), [-6, -3])
+            self.assertEqual(progress, list(range(1, 8)))
+
+    def test_coroutine_function(self):
+        executor = create_executor('asyncio', workers=3)
+        self.assertEqual(executor.map(async_square_item, [1, 2, -3]),
+                         [1, 4, None])
+        self.assertEqual(len(executor.failures), 1)
+
+    def test_cancel(self):
+        executor = create_executor('thread', workers=1)
+        completed = []
+        for result in executor.as_completed(square_item, list(range(100))):
+            completed.append(result.index)
+            executor.cancel()
+        # Only the chunks submitted before the cancellation are run
+        self.assertLess(len(completed), 100)
+
+    def test_worker_instance(self):
+        price_lookup = PriceLookup()
+        executor = create_executor('process', workers=2, chunk_size=10,
+                                   instance=price_lookup)
+        self.assertEqual(executor.map(price_lookup.lookup, range(0, 1000, 7)),
+                         list(range(0, 1000, 7)))
+        # Each task only sends the method name instead of the instance
+        task_function = executor.task_function(price_lookup.lookup)
+        self.assertIsInstance(task_function, WorkerMethod)
+        self.assertLess(len(pickle.dumps(task_function)), 200)
+
+    def test_multithread(self):
+        self.assertEqual(multithread(square_item, [1, -2, 3], threads=2),
+                         [1, None, 9])
+
+
+class PipelineTests(unittest.TestCase):
+
+    def test_pipeline_results(self):
+        written = []
+
+        def write_item(item, parsed):
+            written.append(item)
+            return parsed
+
+        items = ['a', 'bb', 'skip', 'missing', 'bad', 'cccc'] * 5
+        results = pipeline(items, fetch=fetch_item, parse=parse_item,
+                           write=write_item, fetchers=3, parsers=2,
+                           writers=2, queue_size=1)
+
+        self.assertEqual(results,
+                         [2, 4, 'skipped', None, None, 8] * 5)
+        self.assertEqual(sorted(written), sorted(['a', 'bb', 'cccc'] * 5))
+
+    def test_pipeline_with_running_thread(self):
+        # A running thread, like the lease heartbeat, must not be forked
+        stop = Event()
+        heartbeat = Thread(target=stop.wait)
+        heartbeat.start()
+        self.addCleanup(heartbeat.join)
+        self.addCleanup(stop.set)
+
+        self.assertEqual(parse_pool_context().get_start_method(),
+                         'forkserver')
+        results = pipeline(['a', 'bad', 'cccc'], fetch=fetch_item,
+                           parse=parse_item, write=lambda item, data: data,
+                           fetchers=2, parsers=2, writers=1)
+        self.assertEqual(results, [2, None, 8])
+
+
+if __name__ == '__main__':
+    unittest.main()
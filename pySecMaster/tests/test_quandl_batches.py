@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+import sys
+import unittest
+
+sys.path.append('..')
+
+import extractor
+from download import QuandlDownload, estimate_daily_rows, \
+    plan_download_batches
+from extractor import QuandlDataExtraction
+from utilities.rate_limiter import RateLimiter
+from utilities.vendor_server import VendorServer, stand_in_url
+
+
+def days_ago(days):
+    return (datetime.today() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+class FakeRefreshHistory(object):
+
+    def __init__(self):
+        self.results = []
+
+    def record(self, tsid, changed):
+        self.results.append((tsid, changed))
+
+
+class FailingQuandlDownload(object):
+
+    def __init__(self, quandl_token, db_url):
+        pass
+
+    def download_quandl_table_data(self, datatable, tickers, beg_date):
+        raise ValueError('Malformed datatable response')
+
+
+class PlanDownloadBatchesTests(unittest.TestCase):
+
+    def test_row_cap(self):
+        items = [('A.Q.0', days_ago(10)), ('B.Q.0', days_ago(40)),
+                 ('C.Q.0', days_ago(10)), ('D.Q.0', days_ago(10))]
+        max_rows = estimate_daily_rows(days_ago(10)) * 2
+        batches = plan_download_batches(items, max_rows=max_rows)
+
+        # The oldest code returns too many rows to share its batch with
+        #   another code, and the rest are grouped two at a time
+        self.assertEqual([[item[0] for item in batch] for batch in batches],
+                         [['B.Q.0'], ['A.Q.0', 'C.Q.0'], ['D.Q.0']])
+
+    def test_max_items(self):
+        items = [('%s.Q.0' % num, days_ago(5)) for num in range(5)]
+        batches = plan_download_batches(items, max_items=2)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+
+
+class QuandlBatchTests(unittest.TestCase):
+    """ Download the Quandl datatable batches from the local stand-in server.
+    """
+
+    def setUp(self):
+        self.server = VendorServer(codes=10).start()
+        self.table_url = [stand_in_url(
+            'https://www.quandl.com/api/v3/datatables/', self.server.url),
+            '.csv']
+
+    def tearDown(self):
+        self.server.stop()
+        extractor.QuandlDownload = QuandlDownload
+
+    def batch_extraction(self):
+        """ A QuandlDataExtraction with only the attributes used by the batch
+        extractor, as creating one queries the database. """
+
+        extraction = QuandlDataExtraction.__new__(QuandlDataExtraction)
+        extraction.quandl_token = 'test_token'
+        extraction.table_url = self.table_url
+        extraction.datatable = 'WIKI/PRICES'
+        extraction.verbose = False
+        extraction.stage = None
+        extraction.refresh_history = FakeRefreshHistory()
+        extraction.rate_limiter = RateLimiter('quandl', rate=100,
+                                              period_sec=0.0, threads=1)
+        extraction.rate_limiter.min_interval = 0
+
+        extraction.replaced = {}
+        extraction.replace_prices = \
+            lambda tsid, q_code, clean_data, start: \
+            extraction.replaced.update({tsid: clean_data})
+        extraction.extractor = lambda item: \
+            extraction.replaced.update({item[0]: 'per code'})
+        return extraction
+
+    def test_truncation_split(self):
+        quandl_download = QuandlDownload('test_token', self.table_url)
+        rows = estimate_daily_rows(days_ago(60))
+
+        # Each ticker is below the row cap, but the three together are not
+        data, truncated = quandl_download.download_quandl_table_data(
+            datatable='WIKI/PRICES', tickers=['A', 'B', 'C'],
+            beg_date=days_ago(60), max_rows=rows * 2)
+        self.assertEqual(sorted(data.keys()), ['A', 'B', 'C'])
+        self.assertEqual(truncated, [])
+
+        # A single ticker at the row cap is left for the per code download
+        data, truncated = quandl_download.download_quandl_table_data(
+            datatable='WIKI/PRICES', tickers=['A', 'B'],
+            beg_date=days_ago(60), max_rows=rows // 2)
+        self.assertEqual(data, {})
+        self.assertEqual(truncated, ['A', 'B'])
+
+    def test_per_code_beg_date(self):
+        extraction = self.batch_extraction()
+        batch = [('A.Q.0', 'WIKI/A', days_ago(30)),
+                 ('B.Q.0', 'WIKI/B', days_ago(10)),
+                 ('NONE.Q.0', 'WIKI/NONE', days_ago(10))]
+
+        self.assertIsNone(extraction.batch_extractor(batch))
+
+        # The batch starts with the earliest date, but each code only keeps
+        #   the prices after its own start date
+        self.assertGreaterEqual(extraction.replaced['A.Q.0']['date'].min(),
+                                days_ago(30))
+        self.assertLess(extraction.replaced['A.Q.0']['date'].min(),
+                        days_ago(10))
+        self.assertGreaterEqual(extraction.replaced['B.Q.0']['date'].min(),
+                                days_ago(10))
+        self.assertEqual(extraction.refresh_history.results,
+                         [('NONE.Q.0', False)])
+
+    def test_failed_batch_is_returned(self):
+        extraction = self.batch_extraction()
+        extractor.QuandlDownload = FailingQuandlDownload
+        batch = [('A.Q.0', 'WIKI/A', days_ago(10))]
+
+        # The failed batch is retried or skipped, instead of being dropped
+        self.assertEqual(extraction.batch_extractor(batch), batch)
+        self.assertEqual(extraction.replaced, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
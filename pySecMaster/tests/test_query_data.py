@@ -0,0 +1,53 @@
+import pandas as pd
+import sys
+import unittest
+
+sys.path.append('..')
+
+from query_data import adjust_panel_prices, calculate_adjusted_prices, \
+    panel_filters, price_panel_layout
+
+
+class PricePanelTests(unittest.TestCase):
+
+    def setUp(self):
+        dates = pd.to_datetime(['2018-03-06', '2018-03-07', '2018-03-08',
+                                '2018-03-09'])
+        self.prices_df = pd.DataFrame({
+            'date': list(dates) * 2,
+            'tsid': ['AAPL.Q.0'] * 4 + ['MSFT.Q.0'] * 4,
+            'close': [100.0, 102.0, 51.0, 52.0, 90.0, 91.0, 89.5, 92.0],
+            'dividend': [0.0, 0.0, 0.0, 0.0, 0.0, 0.5, 0.0, 0.0],
+            'split': [1.0, 2.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0]})
+
+    def test_adjust_panel_prices(self):
+        adjusted_df = adjust_panel_prices(self.prices_df.copy())
+
+        # Matches the single tsid adjustment for every tsid in the panel
+        for tsid, tsid_df in self.prices_df.groupby('tsid'):
+            expected_df = calculate_adjusted_prices(
+                tsid_df.set_index('date'), column='close')
+            actual = adjusted_df.loc[adjusted_df['tsid'] == tsid, 'adj_close']
+            for expected_value, value in zip(expected_df['adj_close'], actual):
+                self.assertAlmostEqual(expected_value, value, places=3)
+
+    def test_price_panel_layout(self):
+        long_df = price_panel_layout(self.prices_df, ['close'])
+        self.assertEqual(long_df.index.names, ['date', 'tsid'])
+        self.assertEqual(len(long_df.index), 8)
+
+        wide_df = price_panel_layout(self.prices_df, ['close'], wide=True)
+        self.assertEqual(list(wide_df.columns), ['AAPL.Q.0', 'MSFT.Q.0'])
+        self.assertEqual(wide_df.loc['2018-03-09', 'MSFT.Q.0'], 92.0)
+
+    def test_panel_filters(self):
+        conditions, params = panel_filters(
+            source='tsid', tsids=['AAPL.Q.0'], basket='tech',
+            exchanges=['Q'])
+        self.assertEqual(len(conditions), 3)
+        self.assertEqual(params, [['AAPL.Q.0'], 'tech', 'tsid', ['Q']])
+        self.assertEqual(panel_filters(source='tsid'), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
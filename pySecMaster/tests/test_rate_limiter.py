@@ -0,0 +1,76 @@
+import pickle
+import sys
+import threading
+import unittest
+
+sys.path.append('..')
+
+from utilities import rate_limiter
+from utilities.rate_limiter import RateLimiter
+
+
+class FakeTokenTable(object):
+    """ Stands in for the rate_limit_tokens table, with a single window. """
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.granted = 0
+        self.grants = 0
+        self.lock = threading.Lock()
+
+    def grant_tokens(self, vendor, calls, period_sec, batch_size, **kwargs):
+        with self.lock:
+            self.grants += 1
+            tokens = max(min(batch_size, self.calls - self.granted), 0)
+            self.granted += tokens
+            return tokens, 60.0
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FakeTokenTable(calls=100)
+        self.grant_tokens = rate_limiter.grant_tokens
+        rate_limiter.grant_tokens = self.table.grant_tokens
+
+    def tearDown(self):
+        rate_limiter.grant_tokens = self.grant_tokens
+
+    def test_local_token_batches(self):
+        limiter = RateLimiter('quandl', rate=100, period_sec=0.0, threads=4,
+                              batch_size=10, database_options={})
+        limiter.min_interval = 0
+        threads = [threading.Thread(
+            target=lambda: [limiter.wait() for _ in range(15)])
+            for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Sixty calls only needed six grants from the database
+        self.assertEqual(self.table.grants, 6)
+        self.assertEqual(self.table.granted, 60)
+        self.assertEqual(limiter.tokens, 0)
+
+    def test_copies_drop_their_tokens(self):
+        limiter = RateLimiter('quandl', rate=100, period_sec=0.0, threads=1,
+                              batch_size=10, database_options={})
+        limiter.min_interval = 0
+        limiter.wait()
+        self.assertEqual(limiter.tokens, 9)
+
+        copied = pickle.loads(pickle.dumps(limiter))
+        self.assertEqual(copied.tokens, 0)
+        copied.wait()
+        self.assertEqual(self.table.grants, 2)
+
+    def test_without_cluster(self):
+        limiter = RateLimiter('quandl', rate=100, period_sec=0.0, threads=1)
+        self.assertFalse(limiter.cluster)
+        limiter.wait()
+        self.assertEqual(self.table.grants, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+import pandas as pd
+import sys
+import unittest
+
+sys.path.append('..')
+
+from utilities.refresh_policy import due_codes, has_new_prices, \
+    max_refresh_interval, refresh_interval
+
+
+class RefreshPolicyTests(unittest.TestCase):
+
+    def test_backoff(self):
+        day = 60 * 60 * 24
+        self.assertEqual([refresh_interval(day, streak) for streak in range(5)],
+                         [day, day, day * 2, day * 4, day * 8])
+        self.assertEqual(refresh_interval(day, 100), max_refresh_interval)
+
+    def test_due_codes(self):
+        now = datetime(2018, 3, 10, 12, tzinfo=timezone.utc)
+        codes_df = pd.DataFrame({
+            'tsid': ['AAPL.Q.0', 'DEAD.Q.0', 'NEW.Q.0', 'MSFT.Q.0'],
+            'updated_date': pd.to_datetime(
+                ['2018-03-09', '2018-01-02', None, '2018-03-09'], utc=True)})
+        refresh_df = pd.DataFrame(
+            {'unchanged_streak': [0, 4],
+             'last_checked': pd.to_datetime(['2018-03-09', '2018-03-08'],
+                                            utc=True)},
+            index=pd.Index(['AAPL.Q.0', 'DEAD.Q.0'], name='tsid'))
+
+        due = due_codes(codes_df, refresh_df, redownload_time=60 * 60 * 12,
+                        now=now)
+
+        # The dormant tsid was checked 2.5 days ago, within its backed off
+        #   interval of 4 days (8 times the 12 hour redownload time)
+        self.assertEqual(list(due['tsid']),
+                         ['AAPL.Q.0', 'NEW.Q.0', 'MSFT.Q.0'])
+
+        due = due_codes(codes_df, refresh_df, redownload_time=60 * 60 * 48,
+                        now=now)
+        self.assertEqual(list(due['tsid']), ['NEW.Q.0'])
+
+    def test_has_new_prices(self):
+        clean_data = pd.DataFrame({'date': ['2018-03-07', '2018-03-08']})
+        self.assertTrue(has_new_prices(clean_data, None))
+        self.assertTrue(has_new_prices(
+            clean_data, pd.Timestamp('2018-03-07', tz='UTC')))
+        # Replaced prices within the days_back period aren't new
+        self.assertFalse(has_new_prices(
+            clean_data, pd.Timestamp('2018-03-08', tz='UTC')))
+        self.assertFalse(has_new_prices(clean_data.iloc[:0], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import pandas as pd
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('..')
+
+from utilities.run_plan import ThroughputLog, estimate_plan, \
+    estimate_plan_rows, new_item_rows
+
+
+class RunPlanTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log = ThroughputLog(os.path.join(self.temp_dir, 'throughput.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_estimate_plan_rows(self):
+        last_dates = pd.Series([pd.Timestamp('2018-03-07', tz='UTC'),
+                                pd.Timestamp('2018-03-09', tz='UTC'), None])
+        # Three weekdays after Wednesday, one after Friday, and a new item
+        self.assertEqual(estimate_plan_rows(last_dates, today='2018-03-12'),
+                         4 + new_item_rows)
+
+    def test_estimate_plan(self):
+        self.log.record_source('google', 'us_main', 'daily_prices',
+                               items=600, seconds=1200)
+        self.log.record_source('google', 'us_main', 'daily_prices',
+                               items=300, seconds=600)
+        self.log.record_writes(rows=10000, seconds=20)
+
+        plans = [{'vendor': 'google', 'selection': 'us_main',
+                  'table': 'daily_prices', 'items': 900, 'calls': 900,
+                  'rows': 30000, 'rate': 60, 'period_sec': 60},
+                 {'vendor': 'quandl', 'selection': 'wiki',
+                  'table': 'daily_prices', 'items': 3000, 'calls': 40,
+                  'rows': 9000, 'rate': 2000, 'period_sec': 600}]
+        estimates, write_seconds, total_seconds = estimate_plan(
+            plans, self.log, db_writers=2)
+
+        # Google was slower than its rate limit, while Quandl has no runs
+        self.assertEqual(estimates[0]['basis'], 'recorded throughput')
+        self.assertEqual(estimates[0]['seconds'], 1800)
+        self.assertEqual(estimates[1]['basis'], 'rate limit')
+        self.assertEqual(estimates[1]['seconds'], 12)
+        self.assertEqual(write_seconds, 39)
+        self.assertEqual(total_seconds, 1812)
+
+        _, _, total_seconds = estimate_plan(plans, self.log, db_writers=2,
+                                            concurrent=True)
+        self.assertEqual(total_seconds, 1800)
+
+
+if __name__ == '__main__':
+    unittest.main()
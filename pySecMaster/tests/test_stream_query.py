@@ -0,0 +1,73 @@
+from decimal import Decimal
+import io
+import pandas as pd
+import sys
+import unittest
+
+sys.path.append('..')
+
+from utilities.database_queries import copy_frame, fetch_chunks
+
+
+class FakeNamedCursor(object):
+    """ Stands in for a named cursor, which only has its description after
+    the first fetch. """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = None
+        self.fetches = 0
+
+    def fetchmany(self, size):
+        self.description = (('tsid',), ('close',))
+        self.fetches += 1
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FetchChunksTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = FakeNamedCursor(
+            [('AAPL.Q.0', Decimal('170.1200'))] * 5)
+
+    def test_frame_chunks(self):
+        chunks = list(fetch_chunks(self.cursor, fetch_size=2))
+        self.assertEqual([len(chunk.index) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(list(chunks[0].columns), ['tsid', 'close'])
+        self.assertEqual(chunks[0]['close'].dtype, float)
+        self.assertEqual(self.cursor.fetches, 4)
+
+    def test_record_chunks(self):
+        chunks = list(fetch_chunks(self.cursor, fetch_size=5, records=True))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0]['close'][4], 170.12)
+
+    def test_lazy_fetches(self):
+        chunks = fetch_chunks(self.cursor, fetch_size=2)
+        next(chunks)
+        # Only the first chunk has been fetched from the server
+        self.assertEqual(self.cursor.fetches, 1)
+
+
+class CopyFrameTests(unittest.TestCase):
+
+    def test_copy_frame(self):
+        # The CSV output of COPY TO STDOUT, where NULL is an empty value
+        f = io.BytesIO(b'data_vendor_id,date,close,volume\n'
+                       b'1,2018-03-09 00:00:00-05,170.1200,36836700\n'
+                       b'2,2018-03-09 00:00:00-05,,\n')
+        df = copy_frame(f, dtypes={'close': 'float64', 'volume': 'float64'},
+                        dates=['date'])
+
+        self.assertEqual(df['close'].dtype, float)
+        self.assertEqual(df['close'][0], 170.12)
+        self.assertTrue(pd.isnull(df['close'][1]))
+        self.assertTrue(pd.isnull(df['volume'][1]))
+        self.assertEqual(df['data_vendor_id'].tolist(), [1, 2])
+        self.assertEqual(df['date'][0],
+                         pd.Timestamp('2018-03-09 05:00', tz='UTC'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append('..')
+
+from utilities.task_graph import TaskGraph
+
+
+def write_marker(directory, name, seconds=0):
+    time.sleep(seconds)
+    with open(os.path.join(directory, name), 'w') as f:
+        f.write(str(time.time()))
+
+
+def fail_step():
+    raise ValueError('The step failed')
+
+
+class TaskGraphTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.temp_dir, 'fingerprints.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def marker_time(self, name):
+        with open(os.path.join(self.temp_dir, name)) as f:
+            return float(f.read())
+
+    def build_graph(self, inputs):
+        graph = TaskGraph('test', state_file=self.state_file)
+        graph.add('tables', write_marker,
+                  kwargs={'directory': self.temp_dir, 'name': 'tables'})
+        for name in ('csidata', 'quandl_codes'):
+            graph.add(name, write_marker,
+                      kwargs={'directory': self.temp_dir, 'name': name,
+                              'seconds': 0.5},
+                      depends=['tables'])
+        graph.add('symbology', write_marker,
+                  kwargs={'directory': self.temp_dir, 'name': 'symbology'},
+                  depends=['csidata', 'quandl_codes'],
+                  fingerprint=lambda: inputs['symbology'])
+        return graph
+
+    def test_dependency_order(self):
+        statuses = self.build_graph({'symbology': 'a'}).run(poll_interval=0.05)
+        self.assertEqual(list(statuses.values()), ['done'] * 4)
+        # The independent steps run at the same time, after their dependency
+        self.assertLess(abs(self.marker_time('csidata') -
+                            self.marker_time('quandl_codes')), 0.4)
+        self.assertLess(self.marker_time('tables'),
+                        self.marker_time('csidata'))
+        self.assertLess(self.marker_time('quandl_codes'),
+                        self.marker_time('symbology'))
+
+    def test_unchanged_inputs(self):
+        inputs = {'symbology': 'a'}
+        self.build_graph(inputs).run(poll_interval=0.05)
+        statuses = self.build_graph(inputs).run(poll_interval=0.05)
+        self.assertEqual(statuses['symbology'], 'skipped')
+
+        inputs['symbology'] = 'b'
+        statuses = self.build_graph(inputs).run(poll_interval=0.05)
+        self.assertEqual(statuses['symbology'], 'done')
+
+    def test_failed_dependency(self):
+        graph = TaskGraph('test')
+        graph.add('tables', fail_step)
+        graph.add('symbology', write_marker,
+                  kwargs={'directory': self.temp_dir, 'name': 'symbology'},
+                  depends=['tables'])
+        statuses = graph.run(poll_interval=0.05)
+        self.assertEqual(list(statuses.values()), ['failed', 'blocked'])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.temp_dir, 'symbology')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import sys
+import time
+import unittest
+
+sys.path.append('..')
+
+from utilities.time_budget import TimeBudget
+
+
+class TimeBudgetTests(unittest.TestCase):
+
+    def test_without_budget(self):
+        budget = TimeBudget()
+        self.assertFalse(budget.exhausted(wait=10 ** 9))
+        self.assertIsNone(budget.summary())
+
+    def test_drain_reserve(self):
+        budget = TimeBudget()
+        budget.start(60 * 60)
+        # A tenth of an hour is kept for the drain
+        self.assertAlmostEqual(budget.remaining(), 60 * 54, delta=5)
+        self.assertFalse(budget.exhausted())
+        self.assertTrue(budget.exhausted(wait=60 * 55))
+
+        budget.start(60 * 60 * 24)
+        self.assertEqual(budget.drain_seconds, 600)
+
+    def test_exhausted(self):
+        budget = TimeBudget()
+        budget.start(1, drain_seconds=0.5)
+        self.assertFalse(budget.exhausted())
+        time.sleep(0.6)
+        self.assertTrue(budget.exhausted())
+
+        budget.skip(3)
+        self.assertTrue(budget.stopped_early())
+        self.assertIn('3 items', budget.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+from datetime import date, datetime, time, timezone
+import pandas as pd
+import sys
+import unittest
+
+sys.path.append('..')
+
+from utilities.trading_calendar import ExchangeCalendar, drop_partial_bars, \
+    session_groups
+
+
+class TradingCalendarTests(unittest.TestCase):
+
+    def setUp(self):
+        self.nyse = ExchangeCalendar(-5, time(16), 'United States',
+                                     'New York City')
+        self.lse = ExchangeCalendar(0, time(16, 30), 'United Kingdom',
+                                    'London')
+
+    def test_holidays(self):
+        self.assertFalse(self.nyse.is_session(date(2018, 7, 4)))
+        self.assertFalse(self.nyse.is_session(date(2018, 11, 22)))
+        # Good Friday is a holiday for both, but only London closes on Monday
+        self.assertFalse(self.nyse.is_session(date(2018, 3, 30)))
+        self.assertFalse(self.lse.is_session(date(2018, 3, 30)))
+        self.assertTrue(self.nyse.is_session(date(2018, 4, 2)))
+        self.assertFalse(self.lse.is_session(date(2018, 4, 2)))
+
+    def test_last_session(self):
+        # Thursday morning in New York, after the Independence Day holiday
+        now = datetime(2018, 7, 5, 12, tzinfo=timezone.utc)
+        self.assertEqual(self.nyse.last_session(now), date(2018, 7, 3))
+        self.assertEqual(self.lse.last_session(now), date(2018, 7, 4))
+
+    def test_next_close(self):
+        # The New York close is 20:00 UTC during daylight saving time
+        now = datetime(2018, 7, 3, 21, tzinfo=timezone.utc)
+        self.assertEqual(self.nyse.next_close(now),
+                         datetime(2018, 7, 5, 20, tzinfo=timezone.utc))
+        now = datetime(2018, 3, 9, 12, tzinfo=timezone.utc)
+        self.assertEqual(self.nyse.next_close(now),
+                         datetime(2018, 3, 9, 21, tzinfo=timezone.utc))
+
+        # A refresh that is due within the settle time stays on the same close
+        close = datetime(2018, 3, 9, 21, tzinfo=timezone.utc).timestamp()
+        self.assertEqual(self.nyse.next_refresh(close + 60, settle=1800),
+                         close + 1800)
+
+    def test_session_groups(self):
+        sessions_df = pd.DataFrame(
+            {'utc_offset': [-5.0, -5.0, -6.0, 0.0],
+             'close': [time(16), time(16), time(16), time(16, 30)],
+             'country': ['United States', 'United States', 'United States',
+                         'United Kingdom'],
+             'city': ['New York City', 'New York City', 'Lenexa, Kansas',
+                      'London']},
+            index=pd.Index(['Q', 'N', 'BATS', 'LON'], name='tsid_symbol'))
+        groups = session_groups(sessions_df)
+        self.assertEqual(list(groups), ['america_new_york_1600',
+                                        'europe_london_1630'])
+        self.assertEqual(groups['america_new_york_1600'][1],
+                         ['Q', 'N', 'BATS'])
+
+    def test_session_group_collision(self):
+        # Same fixed offset and close, but with different holidays
+        sessions_df = pd.DataFrame(
+            {'utc_offset': [1.0, 1.0], 'close': [time(17, 30), time(17, 30)],
+             'country': ['Atlantis', 'Lemuria'], 'city': [None, None]},
+            index=pd.Index(['A', 'B'], name='tsid_symbol'))
+        groups = session_groups(sessions_df)
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(sorted(symbol for calendar, symbols in groups.values()
+                                for symbol in symbols), ['A', 'B'])
+        self.assertTrue(list(groups)[1].endswith('_lemuria'))
+
+    def test_drop_partial_bars(self):
+        prices_df = pd.DataFrame({'date': ['2018-03-08T00:00:00',
+                                           '2018-03-09T00:00:00',
+                                           '2018-03-12T00:00:00']})
+        complete_df = drop_partial_bars(prices_df, date(2018, 3, 9))
+        self.assertEqual(list(complete_df['date']),
+                         ['2018-03-08T00:00:00', '2018-03-09T00:00:00'])
+
+
+if __name__ == '__main__':
+    unittest.main()
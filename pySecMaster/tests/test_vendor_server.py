@@ -0,0 +1,196 @@
+import csv
+import os
+import pandas as pd
+import shutil
+import sys
+import tempfile
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+sys.path.append('..')
+
+from download import QuandlDownload, build_request_plan, \
+    download_google_data, download_yahoo_data, reset_transfer_stats, \
+    transfer_stats
+from utilities.vendor_server import VendorServer, stand_in_url
+
+
+class VendorServerDownloadTests(unittest.TestCase):
+    """ Download each vendor's format from the local stand-in server, which
+    doesn't require a network connection or a database. """
+
+    def setUp(self):
+        self.server = VendorServer(codes=50).start()
+        self.temp_dir = tempfile.mkdtemp()
+
+        load_tables = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   '..', 'load_tables')
+        self.exchanges_df = pd.read_csv(
+            os.path.join(load_tables, 'exchanges.csv'), encoding='ISO-8859-1')
+
+    def vendor_exchanges(self, symbol_column):
+        """ Mimic the extractor's query_exchanges, only keeping the exchanges
+        that have a symbol for the vendor. """
+
+        exchanges_df = self.exchanges_df[
+            self.exchanges_df[symbol_column].notnull()]
+        return exchanges_df.drop_duplicates(subset='tsid_symbol')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def wo_data_csv(self, first_column):
+        csv_wo_data = os.path.join(self.temp_dir, 'wo_data.csv')
+        with open(csv_wo_data, 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow([first_column, 'date_tried'])
+        return csv_wo_data
+
+    def test_stand_in_url(self):
+        self.assertEqual(
+            stand_in_url('https://www.quandl.com/api/v1/datasets/',
+                         'http://127.0.0.1:8000'),
+            'http://127.0.0.1:8000/quandl/api/v1/datasets/')
+        self.assertEqual(
+            stand_in_url('http://www.google.com/finance/getprices?',
+                         'http://127.0.0.1:8000/'),
+            'http://127.0.0.1:8000/google/finance/getprices?')
+
+    def test_download_quandl_price_data(self):
+        db_url = [stand_in_url('https://www.quandl.com/api/v1/datasets/',
+                               self.server.url), '.csv']
+        quandl_download = QuandlDownload('test_token', db_url)
+
+        test_df = quandl_download.download_quandl_data(
+            q_code='WIKI/B', csv_out=self.wo_data_csv('q_code'),
+            beg_date='2018-01-01')
+        self.assertGreater(len(test_df.index), 1)
+        self.assertGreaterEqual(test_df['date'].min(), '2018-01-01')
+
+    def test_download_quandl_datatable_data(self):
+        db_url = [stand_in_url('https://www.quandl.com/api/v3/datatables/',
+                               self.server.url), '.csv']
+        quandl_download = QuandlDownload('test_token', db_url)
+
+        data, truncated = quandl_download.download_quandl_table_data(
+            datatable='WIKI/PRICES', tickers=['A', 'B', 'ZZZZ'],
+            beg_date='2018-01-01')
+        self.assertEqual(sorted(data.keys()), ['A', 'B'])
+        self.assertEqual(truncated, [])
+
+    def test_download_google_daily_price_data(self):
+        google_fin_url = {
+            'root': stand_in_url('http://www.google.com/finance/getprices?',
+                                 self.server.url),
+            'ticker': 'q=',
+            'exchange': 'x=',
+            'interval': 'i=' + str(60*60*24),
+            'period': 'p=' + str(60) + 'd',
+            'fields': 'f=d,c,v,o,h,l',
+        }
+
+        test_df = download_google_data(
+            db_url=google_fin_url, tsid='C.Q.0',
+            exchanges_df=self.vendor_exchanges('goog_symbol'),
+            csv_out=self.wo_data_csv('tsid'))
+        self.assertGreater(len(test_df.index), 30)
+
+    def test_download_yahoo_daily_price_data(self):
+        yahoo_fin_url = {
+            'root': stand_in_url('http://real-chart.finance.yahoo.com/'
+                                 'table.csv?', self.server.url),
+            'ticker': 's=',
+            'interval': 'g=d',
+            'start_date': 'a=00&b=1&c=1900',
+            'csv': 'ignore=.csv',
+        }
+
+        test_df = download_yahoo_data(
+            db_url=yahoo_fin_url, tsid='D.Q.0',
+            exchanges_df=self.vendor_exchanges('yahoo_symbol'),
+            csv_out=self.wo_data_csv('tsid'))
+        self.assertGreater(len(test_df.index), 1000)
+
+    def test_yahoo_request_plan(self):
+        yahoo_fin_url = {
+            'root': stand_in_url('http://real-chart.finance.yahoo.com/'
+                                 'table.csv?', self.server.url),
+            'ticker': 's=',
+            'interval': 'g=d',
+            'start_date': 'a=00&b=1&c=1900',
+            'csv': 'ignore=.csv',
+        }
+        latest_prices = pd.DataFrame(
+            {'date': pd.to_datetime(['2018-03-01'], utc=True)},
+            index=pd.Index(['D.Q.0'], name='tsid'))
+
+        plan = build_request_plan(
+            tsids=['D.Q.0', 'F.Q.0'],
+            exchanges_df=self.vendor_exchanges('yahoo_symbol'),
+            db_url=yahoo_fin_url, vendor='yahoo', latest_prices=latest_prices,
+            data_process='replace', days_back=10)
+        self.assertEqual(list(plan['keep_after']),
+                         ['2018-02-19T00:00:00', None])
+
+        test_df = download_yahoo_data(
+            db_url=yahoo_fin_url, tsid='D.Q.0', exchanges_df=None,
+            csv_out=self.wo_data_csv('tsid'), url=plan['url'][0])
+        self.assertGreater(len(test_df.index), 1000)
+
+    def test_compressed_transfer(self):
+        db_url = [stand_in_url('https://www.quandl.com/api/v1/datasets/',
+                               self.server.url), '.csv']
+        quandl_download = QuandlDownload('test_token', db_url)
+
+        reset_transfer_stats()
+        quandl_download.download_quandl_data(
+            q_code='WIKI/E', csv_out=self.wo_data_csv('q_code'))
+        self.assertGreater(transfer_stats['decoded'].value,
+                           transfer_stats['wire'].value)
+
+
+class VendorServerInjectionTests(unittest.TestCase):
+
+    def test_error_rate(self):
+        server = VendorServer(codes=5, error_rate=1.0).start()
+        try:
+            with self.assertRaises(HTTPError) as context:
+                urlopen(server.url + '/yahoo/table.csv?s=A')
+            self.assertEqual(context.exception.code, 503)
+        finally:
+            server.stop()
+
+    def test_rate_limit(self):
+        server = VendorServer(codes=5, rate_limit=(1, 60)).start()
+        try:
+            urlopen(server.url + '/yahoo/table.csv?s=A').read()
+            with self.assertRaises(HTTPError) as context:
+                urlopen(server.url + '/yahoo/table.csv?s=A')
+            self.assertEqual(context.exception.code, 429)
+
+            stats = server.stats_summary()
+            self.assertEqual(stats['vendors']['yahoo'], {'200': 1, '429': 1})
+        finally:
+            server.stop()
+
+    def test_fixture(self):
+        fixtures = tempfile.mkdtemp()
+        os.makedirs(os.path.join(fixtures, 'yahoo'))
+        with open(os.path.join(fixtures, 'yahoo', 'A.csv'), 'w') as f:
+            f.write('Date,Open,High,Low,Close,Volume,Adj Close\n'
+                    '2018-01-02,1,2,0.5,1.5,100,1.5\n')
+
+        server = VendorServer(codes=5, fixtures=fixtures,
+                              compress=False).start()
+        try:
+            body = urlopen(server.url + '/yahoo/table.csv?s=A').read()
+            self.assertIn(b'2018-01-02,1,2,0.5,1.5,100,1.5', body)
+        finally:
+            server.stop()
+            shutil.rmtree(fixtures)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+import pandas as pd
+import pickle
+import sys
+import unittest
+
+sys.path.append('..')
+
+from utilities import work_queue
+from utilities.work_queue import CompletedWork, prioritize_work, \
+    score_work_items
+
+
+class ScoreWorkItemsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime(2018, 3, 10, tzinfo=timezone.utc)
+        self.latest_prices = pd.DataFrame(
+            {'updated_date': pd.to_datetime(['2018-03-09', '2018-03-09',
+                                             '2018-03-01'], utc=True)},
+            index=pd.Index(['AAPL.Q.0', 'TINY.Q.0', 'MSFT.Q.0'], name='tsid'))
+        self.volume_df = pd.DataFrame(
+            {'dollar_volume': [5e9, 1e4, 3e9]},
+            index=pd.Index(['AAPL.Q.0', 'TINY.Q.0', 'MSFT.Q.0'], name='tsid'))
+
+    def test_priority_order(self):
+        items = score_work_items(
+            tsids=['TINY.Q.0', 'AAPL.Q.0', 'MSFT.Q.0', 'NEW.Q.0'],
+            latest_prices=self.latest_prices, volume_df=self.volume_df,
+            redownload_time=60 * 60 * 12, now=self.now)
+
+        # Fully stale and liquid first, then never downloaded, then the most
+        #   liquid of the recently updated
+        self.assertEqual(list(items['tsid']),
+                         ['MSFT.Q.0', 'NEW.Q.0', 'AAPL.Q.0', 'TINY.Q.0'])
+        self.assertEqual(items.loc[1, 'staleness'], 1.0)
+        self.assertEqual(items.loc[1, 'liquidity'], 0.0)
+
+
+class PrioritizeWorkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.queue_calls = []
+        self.functions = (work_queue.query_recent_volume,
+                          work_queue.enqueue_work, work_queue.pull_work)
+        work_queue.query_recent_volume = lambda **kwargs: pd.DataFrame(
+            {'dollar_volume': [5e9]}, index=pd.Index(['AAPL.Q.0']))
+        work_queue.enqueue_work = \
+            lambda **kwargs: self.queue_calls.append('enqueue')
+        work_queue.pull_work = \
+            lambda **kwargs: self.queue_calls.append('pull') or []
+
+    def tearDown(self):
+        (work_queue.query_recent_volume, work_queue.enqueue_work,
+         work_queue.pull_work) = self.functions
+
+    def test_dry_run(self):
+        latest_prices = pd.DataFrame(
+            {'updated_date': pd.to_datetime(['2018-03-09', '2018-03-09'],
+                                            utc=True)},
+            index=pd.Index(['AAPL.Q.0', 'TINY.Q.0'], name='tsid'))
+        tsids = prioritize_work(
+            'db', 'user', 'password', 'host', 5432, vendor_id=1,
+            table='daily_prices', tsids=['TINY.Q.0', 'AAPL.Q.0'],
+            latest_prices=latest_prices, redownload_time=60 * 60 * 12,
+            dry_run=True)
+
+        # The plan is ordered locally, without touching the work queue
+        self.assertEqual(tsids, ['AAPL.Q.0', 'TINY.Q.0'])
+        self.assertEqual(self.queue_calls, [])
+
+    def test_pull_skips_other_groups(self):
+        # A queue of the unleased rows, which keeps a group's leftover items
+        queue = []
+
+        def enqueue_work(items, **kwargs):
+            queue.extend(items['tsid'])
+
+        def pull_work(tsids=None, **kwargs):
+            return [tsid for tsid in queue if tsids is None or tsid in tsids]
+
+        work_queue.enqueue_work = enqueue_work
+        work_queue.pull_work = pull_work
+
+        latest_prices = pd.DataFrame(
+            {'updated_date': pd.to_datetime(['2018-03-09'] * 3, utc=True)},
+            index=pd.Index(['AAPL.Q.0', 'IBM.N.0', 'TINY.Q.0'], name='tsid'))
+        for group in [['AAPL.Q.0', 'TINY.Q.0'], ['IBM.N.0']]:
+            tsids = prioritize_work(
+                'db', 'user', 'password', 'host', 5432, vendor_id=1,
+                table='daily_prices', tsids=group,
+                latest_prices=latest_prices, redownload_time=60 * 60 * 12)
+
+        # The first group's rows are still queued, but only the second
+        #   group's items are pulled for its run
+        self.assertEqual(queue, ['AAPL.Q.0', 'TINY.Q.0', 'IBM.N.0'])
+        self.assertEqual(tsids, ['IBM.N.0'])
+
+
+class CompletedWorkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.removed = []
+        self.complete_work = work_queue.complete_work
+        work_queue.complete_work = \
+            lambda tsids, **kwargs: self.removed.append(list(tsids))
+
+    def tearDown(self):
+        work_queue.complete_work = self.complete_work
+
+    def test_batches(self):
+        completed = CompletedWork('db', 'user', 'password', 'host', 5432,
+                                  vendor_id=1, table='daily_prices',
+                                  flush_size=2)
+        for tsid in ['A.Q.0', 'B.Q.0', 'C.Q.0']:
+            completed.record(tsid)
+        self.assertEqual(self.removed, [['A.Q.0', 'B.Q.0']])
+
+        completed.flush()
+        completed.flush()
+        self.assertEqual(self.removed, [['A.Q.0', 'B.Q.0'], ['C.Q.0']])
+
+    def test_copies_drop_their_items(self):
+        completed = CompletedWork('db', 'user', 'password', 'host', 5432,
+                                  vendor_id=1, table='daily_prices')
+        completed.record('A.Q.0')
+
+        copied = pickle.loads(pickle.dumps(completed))
+        copied.flush()
+        self.assertEqual(self.removed, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
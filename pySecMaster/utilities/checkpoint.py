@@ -0,0 +1,162 @@
+from datetime import datetime
+import os
+import pickle
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+class RunCheckpoint(object):
+    """ The checkpoint state of a download run, saved within its own
+    directory. Each extractor in the run has a stage checkpoint, which allows
+    an interrupted run to be resumed with the same run id. """
+
+    def __init__(self, checkpoint_dir, run_id=None):
+        """
+        :param checkpoint_dir: String of the directory holding every run's
+            checkpoint directory
+        :param run_id: Optional string of the run id to resume; by default, a
+            new run id is created from the current time
+        """
+
+        self.resumed = run_id is not None
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.directory = os.path.join(checkpoint_dir, self.run_id)
+
+        if self.resumed and not os.path.isdir(self.directory):
+            raise OSError('There is no checkpoint for the %s run in %s' %
+                          (self.run_id, checkpoint_dir))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def stage(self, name):
+        """ Get the checkpoint of a single extractor within the run.
+
+        :param name: String of the stage name (i.e. google_us_main_daily_prices)
+        :return: StageCheckpoint
+        """
+
+        return StageCheckpoint(self.directory, name)
+
+
+class StageCheckpoint(object):
+    """ The checkpoint of a single extractor. The planned work is pickled once,
+    while the started and finished items are appended to a journal file as
+    they happen. Appending a line is cheap enough to do for every item, and
+    the small appends from different worker processes don't interleave. """
+
+    def __init__(self, directory, name):
+        """
+        :param directory: String of the run's checkpoint directory
+        :param name: String of the stage name
+        """
+
+        self.name = name
+        self.plan_path = os.path.join(directory, name + '_plan.pickle')
+        self.journal_path = os.path.join(directory, name + '_journal.txt')
+        self.complete_path = os.path.join(directory, name + '_complete')
+
+    def has_plan(self):
+        return os.path.isfile(self.plan_path)
+
+    def is_complete(self):
+        return os.path.isfile(self.complete_path)
+
+    def save_plan(self, plan):
+        """ Save the planned work, replacing the file atomically so that an
+        interrupted save never leaves a partial plan.
+
+        :param plan: Dictionary of the extractor's planned work
+        """
+
+        temp_path = self.plan_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.plan_path)
+
+    def load_plan(self):
+        with open(self.plan_path, 'rb') as f:
+            return pickle.load(f)
+
+    def record(self, status, key):
+        """ Append the item's status to the journal.
+
+        :param status: String of either 'start' or 'done'
+        :param key: String of the item's key (i.e. the tsid)
+        """
+
+        with open(self.journal_path, 'a') as f:
+            f.write('%s\t%s\n' % (status, key))
+
+    def start(self, key):
+        self.record('start', key)
+
+    def done(self, key):
+        self.record('done', key)
+
+    def mark_complete(self):
+        with open(self.complete_path, 'w') as f:
+            f.write(datetime.now().isoformat())
+
+    def read_journal(self):
+        """ Read the journal to find the finished and in-flight items.
+
+        :return: Tuple of the set of finished keys and the set of keys that
+            were started but not finished
+        """
+
+        started = set()
+        finished = set()
+        try:
+            with open(self.journal_path) as f:
+                for line in f:
+                    status, _, key = line.rstrip('\n').partition('\t')
+                    if status == 'start':
+                        started.add(key)
+                    elif status == 'done':
+                        finished.add(key)
+        except FileNotFoundError:
+            pass
+        return finished, started - finished
+
+    def remaining(self, items, key=lambda item: item[0]):
+        """ Remove the finished items from the planned items. The items that
+        were in flight when the run stopped are put first, followed by the
+        items that were never started, each in their planned order.
+
+        :param items: List of the planned items
+        :param key: Function that returns an item's journal key
+        :return: List of the items that still need to be run
+        """
+
+        finished, in_flight = self.read_journal()
+        retry = [item for item in items if key(item) in in_flight]
+        pending = [item for item in items
+                   if key(item) not in finished and key(item) not in in_flight]
+        print('%s checkpoint: %s planned items, %s finished, %s in flight '
+              'and %s not started' %
+              (self.name, '{:,}'.format(len(items)),
+               '{:,}'.format(len(items) - len(retry) - len(pending)),
+               '{:,}'.format(len(retry)), '{:,}'.format(len(pending))))
+        return retry + pending
@@ -0,0 +1,326 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import traceback
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+def cached(cache, key, loader):
+    """ Load the value through the warm cache when there is one, otherwise
+    query it directly.
+
+    :param cache: Optional WarmCache
+    :param key: Tuple of the cache key
+    :param loader: Function that queries the value
+    :return: The value
+    """
+
+    if cache is None:
+        return loader()
+    return cache.get(key, loader)
+
+
+class WarmCache(object):
+    """ Keeps the reference data (vendor ids and exchange symbols) and the
+    last price dates in memory between the daemon's runs. The values are
+    loaded by the first extractor that needs them. The last prices are then
+    updated by the extractors as they write new prices, so later runs don't
+    have to query them again. """
+
+    def __init__(self, reference_ttl=60 * 60 * 6):
+        """
+        :param reference_ttl: Integer of the seconds before the reference data
+            is queried again; the last prices never expire, as they are
+            updated after every write
+        """
+
+        self.reference_ttl = reference_ttl
+        self.lock = threading.RLock()
+        self.values = {}
+        self.loaded_at = {}
+
+    def get(self, key, loader):
+        """ Get the cached value, loading it if it is missing or expired.
+
+        :param key: Tuple of the cache key, where the first value is the kind
+            of data (i.e. ('last_price', 'daily_prices', 3))
+        :param loader: Function that queries the value
+        :return: The value
+        """
+
+        with self.lock:
+            age = time.time() - self.loaded_at.get(key, 0)
+            if key in self.values and (key[0] == 'last_price' or
+                                       age < self.reference_ttl):
+                return self.values[key]
+
+        value = loader()
+        with self.lock:
+            self.values[key] = value
+            self.loaded_at[key] = time.time()
+        return value
+
+    def update_last_price(self, table, vendor_id, tsid, date):
+        """ Record the newest price date that was written for the tsid, with
+        the current time as its updated date.
+
+        :param table: String of the price table
+        :param vendor_id: Integer of the data vendor id
+        :param tsid: String of the tsid
+        :param date: The newest price date (ISO string or datetime)
+        """
+
+        key = ('last_price', table, vendor_id)
+        with self.lock:
+            latest_prices = self.values.get(key)
+            if latest_prices is None:
+                return
+            latest_prices.loc[tsid, ['date', 'updated_date']] = [
+                pd.to_datetime(date, utc=True),
+                pd.Timestamp(datetime.now(timezone.utc))]
+
+    def invalidate(self, *key):
+        """ Remove the cached values, so they are queried again.
+
+        :param key: The leading parts of the keys to remove (i.e. 'last_price'
+            removes every last price); by default, everything is removed
+        """
+
+        with self.lock:
+            for cache_key in list(self.values):
+                if cache_key[:len(key)] == key:
+                    del self.values[cache_key]
+                    del self.loaded_at[cache_key]
+
+    def status(self):
+        """ :return: Dictionary of each cached value's size and age """
+
+        with self.lock:
+            return {' '.join(str(part) for part in key): {
+                'rows': len(value) if hasattr(value, '__len__') else 1,
+                'age': round(time.time() - self.loaded_at[key], 1)}
+                for key, value in self.values.items()}
+
+
+class Scheduler(object):
+    """ Runs each job every interval, or at the times given by the job's
+    next_time function, one job at a time within the calling thread. Jobs can
+    also be triggered early through the control server. """
+
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+
+    def add(self, name, function, interval, run_now=True, next_time=None):
+        """ Add a job to the schedule.
+
+        :param name: String of the job's name
+        :param function: Function that runs the job
+        :param interval: Integer of the seconds between the job's runs
+        :param run_now: Boolean of whether the job runs when the daemon starts
+        :param next_time: Optional function that is given the current epoch
+            time and returns the epoch time of the job's next run, which is
+            used instead of the interval (i.e. after an exchange's close)
+        """
+
+        if run_now:
+            next_run = time.time()
+        elif next_time:
+            next_run = next_time(time.time())
+        else:
+            next_run = time.time() + interval
+        self.jobs[name] = {
+            'function': function, 'interval': interval,
+            'next_time': next_time, 'next_run': next_run,
+            'last_run': None, 'last_seconds': None, 'last_error': None,
+            'runs': 0, 'running': False}
+
+    def trigger(self, name):
+        """ Run the job as soon as the current job finishes.
+
+        :param name: String of the job's name
+        :return: Boolean of whether the job exists
+        """
+
+        with self.lock:
+            if name not in self.jobs:
+                return False
+            self.jobs[name]['next_run'] = 0
+        self.wake.set()
+        return True
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def next_job(self):
+        """ :return: Tuple of the name of the job that is due soonest and the
+            seconds until it is due """
+
+        with self.lock:
+            name = min(self.jobs, key=lambda job: self.jobs[job]['next_run'])
+            return name, self.jobs[name]['next_run'] - time.time()
+
+    def run_job(self, name):
+        job = self.jobs[name]
+        start_time = time.time()
+        with self.lock:
+            job['running'] = True
+            # A trigger while the job is running makes it run again after
+            if job['next_time']:
+                job['next_run'] = job['next_time'](start_time)
+            else:
+                job['next_run'] = start_time + job['interval']
+        error = None
+        try:
+            job['function']()
+        except Exception as e:
+            # Keep the daemon running; the job is retried at its next run
+            traceback.print_exc()
+            error = repr(e)
+        with self.lock:
+            job['running'] = False
+            job['runs'] += 1
+            job['last_run'] = datetime.now().isoformat()
+            job['last_seconds'] = round(time.time() - start_time, 2)
+            job['last_error'] = error
+        print('The %s job %s after %0.2f seconds; its next run is in %0.0f '
+              'seconds' % (name, 'failed' if error else 'finished',
+                           job['last_seconds'],
+                           job['next_run'] - time.time()))
+
+    def run_forever(self):
+        """ Run the jobs when they are due until stop is called. """
+
+        while not self.stopped.is_set() and self.jobs:
+            name, wait = self.next_job()
+            if wait > 0:
+                self.wake.wait(wait)
+                self.wake.clear()
+                continue
+            self.run_job(name)
+
+    def status(self):
+        """ :return: Dictionary of each job's schedule and last run """
+
+        with self.lock:
+            return OrderedDict(
+                (name, {'interval': job['interval'],
+                        'next_run_in': round(max(
+                            job['next_run'] - time.time(), 0), 1),
+                        'last_run': job['last_run'],
+                        'last_seconds': job['last_seconds'],
+                        'last_error': job['last_error'],
+                        'runs': job['runs'], 'running': job['running']})
+                for name, job in self.jobs.items())
+
+
+class ControlServer(object):
+    """ The daemon's local control endpoint, served within a background
+    thread:
+
+        GET /status             the job schedule and the warm cache
+        POST /run/<job name>    run the job as soon as possible
+        POST /stop              stop the daemon after the current job
+    """
+
+    def __init__(self, scheduler, cache, host='127.0.0.1', port=8765):
+        """
+        :param scheduler: Scheduler of the daemon
+        :param cache: WarmCache of the daemon
+        :param host: String of the address to listen on; keep this local, as
+            the endpoint has no authentication
+        :param port: Integer of the port to listen on; 0 picks a free port
+        """
+
+        self.scheduler = scheduler
+        self.cache = cache
+        self.server = ThreadingHTTPServer((host, port), ControlRequestHandler)
+        self.server.daemon_threads = True
+        self.server.control_server = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%i' % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """ Handles the requests for the ControlServer. """
+
+    def do_GET(self):
+        control = self.server.control_server
+        if urlsplit(self.path).path == '/status':
+            self.send_json(200, {'jobs': control.scheduler.status(),
+                                 'cache': control.cache.status()})
+        else:
+            self.send_json(404, {'error': 'Unknown path %s' % self.path})
+
+    def do_POST(self):
+        control = self.server.control_server
+        path = urlsplit(self.path).path
+        if path.startswith('/run/'):
+            name = path[len('/run/'):]
+            if control.scheduler.trigger(name):
+                self.send_json(202, {'triggered': name})
+            else:
+                self.send_json(404, {'error': 'Unknown job %s' % name})
+        elif path == '/stop':
+            control.scheduler.stop()
+            self.send_json(202, {'stopping': True})
+        else:
+            self.send_json(404, {'error': 'Unknown path %s' % self.path})
+
+    def send_json(self, status, value):
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -1,8 +1,12 @@
 from datetime import datetime, timedelta
+import json
+from multiprocessing import BoundedSemaphore, Value
 import numpy as np
 import pandas as pd
 import psycopg2
 from sqlalchemy import create_engine
+import tempfile
+import time
 
 __author__ = 'Josh Schertz'
 __copyright__ = 'Copyright (C) 2018 Josh Schertz'
@@ -29,6 +33,51 @@ __version__ = '1.5.0'
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+# Caps the concurrent price writes across every extractor process; set with
+#   set_db_write_limit before the extractors create their pools
+db_write_limit = {'semaphore': None}
+
+# Number of rows saved by df_to_sql, and the summed seconds of the writes,
+#   shared between processes
+write_stats = {'rows': Value('Q', 0), 'seconds': Value('d', 0.0)}
+
+# Whether df_to_sql notifies the price_changes channel listeners of the tsid
+#   prices it writes; set with set_price_notifications
+price_notifications = {'enabled': False}
+price_change_channel = 'price_changes'
+
+# Bytes of COPY output that copy_query holds in memory before spooling the
+#   rest to a temporary file
+copy_spool_size = 256 * 1024 * 1024
+
+
+def set_db_write_limit(writers=None):
+    """ Cap the number of concurrent writes made by df_to_sql and
+    delete_sql_table_rows. The cap is shared with every process that is
+    created after this is called, which allows concurrent vendor extractors to
+    share the database without overrunning it.
+
+    :param writers: Integer of the concurrent writes allowed; None removes the
+        cap
+    """
+
+    if writers:
+        db_write_limit['semaphore'] = BoundedSemaphore(writers)
+    else:
+        db_write_limit['semaphore'] = None
+
+
+def set_price_notifications(enabled=True):
+    """ Have df_to_sql send a price_changes notification for every tsid and
+    vendor whose prices it writes, which the ValidationListener uses to cross
+    validate the changed dates. Processes created after this is called also
+    send the notifications.
+
+    :param enabled: Boolean of whether the notifications are sent
+    """
+
+    price_notifications['enabled'] = enabled
+
 
 def delete_sql_table_rows(database, user, password, host, port, query, table,
                           item, verbose=False):
@@ -56,6 +105,9 @@ def delete_sql_table_rows(database, user, password, host, port, query, table,
     conn = psycopg2.connect(database=database, user=user, password=password,
                             host=host, port=port)
 
+    semaphore = db_write_limit['semaphore']
+    if semaphore:
+        semaphore.acquire()
     try:
         with conn:
             cur = conn.cursor()
@@ -79,13 +131,16 @@ def delete_sql_table_rows(database, user, password, host, port, query, table,
         print(e)
         conn.close()
         outcome = 'failure'
+    finally:
+        if semaphore:
+            semaphore.release()
 
     conn.close()
     return outcome
 
 
 def df_to_sql(database, user, password, host, port, df, sql_table, exists,
-              item, verbose=False):
+              item, verbose=False, notify=True):
     """ Save a DataFrame to a specified SQL database table.
 
     :param database: String of the database name
@@ -101,6 +156,8 @@ def df_to_sql(database, user, password, host, port, df, sql_table, exists,
         'append' [new rows] and 'replace' [all existing table rows].
     :param item: String representing the item being inserted (i.e. the tsid)
     :param verbose: Boolean indicating whether debugging statements should print
+    :param notify: Boolean of whether the price changes are notified when the
+        price notifications are enabled; the consensus prices aren't
     """
 
     if verbose:
@@ -111,10 +168,23 @@ def df_to_sql(database, user, password, host, port, df, sql_table, exists,
                            (user, password, host, port, database))
     conn = engine.connect()
 
+    semaphore = db_write_limit['semaphore']
+    if semaphore:
+        semaphore.acquire()
     # Try and except block writes the new data to the SQL Database.
     try:
         # if_exists options: append new df rows, replace all table values
+        write_start = time.time()
         df.to_sql(sql_table, conn, if_exists=exists, index=False)
+        with write_stats['rows'].get_lock():
+            write_stats['rows'].value += len(df.index)
+        with write_stats['seconds'].get_lock():
+            write_stats['seconds'].value += time.time() - write_start
+        if notify and price_notifications['enabled'] and \
+                sql_table in ['daily_prices', 'minute_prices']:
+            notify_price_changes(database=database, user=user,
+                                 password=password, host=host, port=port,
+                                 df=df, table=sql_table)
         if verbose:
             print('Successfully entered the values into the %s database' %
                   database)
@@ -122,6 +192,104 @@ def df_to_sql(database, user, password, host, port, df, sql_table, exists,
         print('Error: Unknown issue when adding the DataFrame to the %s '
               'database for %s' % (database, item))
         print(e)
+    finally:
+        if semaphore:
+            semaphore.release()
+
+    conn.close()
+
+
+def fetch_chunks(cur, fetch_size, records=False):
+    """ Fetch the cursor's rows in chunks, converting each chunk on its own
+    so that only one chunk of rows is in memory at a time.
+
+    :param cur: Cursor that has executed a query
+    :param fetch_size: Integer of the rows in each chunk
+    :param records: Boolean of whether to yield numpy record arrays instead of
+        DataFrames
+    :return: Generator of the DataFrames (or record arrays) of the rows, with
+        the decimal values converted to floats
+    """
+
+    columns = None
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            return
+        if columns is None:
+            # A named cursor only has its description after the first fetch
+            columns = [column[0] for column in cur.description]
+        df = pd.DataFrame.from_records(rows, columns=columns,
+                                       coerce_float=True)
+        yield df.to_records(index=False) if records else df
+
+
+def copy_frame(f, dtypes=None, dates=None):
+    """ Decode the CSV output of a COPY TO STDOUT into a DataFrame. The C
+    parser reads the text straight into typed numpy columns, instead of
+    building a Python object (a Decimal for every price) for each value.
+
+    :param f: File object of the COPY output, with the header row
+    :param dtypes: Optional dictionary of the column dtypes
+    :param dates: Optional list of the timestamp columns to convert to UTC
+        datetimes
+    :return: DataFrame of the rows, with the NULL values as NaN
+    """
+
+    df = pd.read_csv(f, dtype=dtypes, keep_default_na=False, na_values=[''])
+    for column in dates or []:
+        df[column] = pd.to_datetime(df[column], utc=True)
+    return df
+
+
+def notify_price_changes(database, user, password, host, port, df, table):
+    """ Notify the price_changes channel listeners of the written tsid
+    prices, with one notification for each tsid and vendor carrying the range
+    of the written dates.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param df: DataFrame of the written prices, with the data_vendor_id,
+        source, source_id and date columns
+    :param table: String of the price table the prices were written to
+    """
+
+    columns = ['data_vendor_id', 'source', 'source_id', 'date']
+    if not set(columns).issubset(df.columns):
+        return
+    changes = df.loc[df['source'] == 'tsid', columns].groupby(
+        ['source_id', 'data_vendor_id'])['date'].agg(['min', 'max'])
+    if len(changes.index) == 0:
+        return
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            for (tsid, vendor_id), dates in changes.iterrows():
+                payload = json.dumps(
+                    {'table': table, 'tsid': tsid, 'vendor_id': int(vendor_id),
+                     'beg_date': pd.Timestamp(dates['min']).isoformat(),
+                     'end_date': pd.Timestamp(dates['max']).isoformat()})
+                cur.execute('SELECT pg_notify(%s, %s)',
+                            (price_change_channel, payload))
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to send the price change notifications '
+                          'within notify_price_changes')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'notify_price_changes. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in '
+                          'notify_price_changes')
 
     conn.close()
 
@@ -235,6 +403,59 @@ def query_all_tsid_prices(database, user, password, host, port, table, tsid):
     :param tsid: String of the tsid whose prices should be queried
     """
 
+    if table == 'daily_prices':
+        columns = ['data_vendor_id', 'date', 'open', 'high', 'low', 'close',
+                   'volume', 'dividend', 'split']
+    elif table == 'minute_prices':
+        columns = ['data_vendor_id', 'date', 'open', 'high', 'low', 'close',
+                   'volume']
+    else:
+        raise NotImplementedError('Table %s is not implemented within '
+                                  'query_all_tsid_prices in '
+                                  'database_queries.py' % table)
+
+    # The prices are read with COPY, which skips the Decimal object of every
+    #   price that fetchall creates; the NULL prices become NaN
+    df = copy_query(database=database, user=user, password=password,
+                    host=host, port=port,
+                    query=('SELECT %s FROM %s WHERE source_id=%%s AND '
+                           'source=%%s' % (', '.join(columns), table)),
+                    params=[tsid, 'tsid'],
+                    dtypes={column: 'float64' for column in columns[2:]},
+                    dates=['date'])
+
+    if len(df.index) == 0:
+        raise SystemError('Not able to query any prices for %s in '
+                          'query_all_tsid_prices' % tsid)
+
+    # Convert the daily timestamps to date objects
+    if table == 'daily_prices':
+        df['date'] = df['date'].dt.date
+
+    # Drop duplicate rows based on only the tsid and date columns
+    df.drop_duplicates(subset=['data_vendor_id', 'date'], inplace=True)
+
+    # Move and set the date and data_vendor_id columns to the index
+    df.set_index(['date', 'data_vendor_id'], inplace=True)
+    df.sort_index(inplace=True)
+
+    return df
+
+
+def query_code_activity(database, user, password, host, port):
+    """ Query whether each tsid is still active, and the last date that it
+    traded, from the CSI Data stock factsheet. When a tsid is linked to
+    multiple CSI numbers, the active one with the latest end date is used.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :return: DataFrame indexed by the tsid with the is_active and end_date
+        columns
+    """
+
     conn = psycopg2.connect(database=database, user=user, password=password,
                             host=host, port=port)
     df = None
@@ -242,62 +463,33 @@ def query_all_tsid_prices(database, user, password, host, port, table, tsid):
     try:
         with conn:
             cur = conn.cursor()
-            if table == 'daily_prices':
-                cur.execute("""SELECT data_vendor_id, date, open, high, low,
-                                close, volume, dividend, split
-                            FROM daily_prices
-                            WHERE source_id=%s AND source='tsid'""", (tsid,))
-                columns = ['data_vendor_id', 'date', 'open', 'high', 'low',
-                           'close', 'volume', 'dividend', 'split']
-            elif table == 'minute_prices':
-                cur.execute("""SELECT data_vendor_id, date, open, high, low,
-                                close, volume
-                            FROM minute_prices
-                            WHERE source_id=%s AND source='tsid'""", (tsid,))
-                columns = ['data_vendor_id', 'date', 'open', 'high', 'low',
-                           'close', 'volume']
-            else:
-                raise NotImplementedError('Table %s is not implemented '
-                                          'within query_all_tsid_prices in'
-                                          'database_queries.py' % table)
-
-            data = cur.fetchall()
-            if data:
-                df = pd.DataFrame(data, columns=columns)
-
-                # Convert the ISO date to a datetime object
-                if table == 'daily_prices':
-                    df['date'] = pd.to_datetime(df['date'], utc=True)
-                    df['date'] = df['date'].apply(lambda x: x.date())
-                elif table == 'minute_prices':
-                    df['date'] = pd.to_datetime(df['date'], utc=True)
-                else:
-                    raise NotImplementedError('Table %s is not implemented '
-                                              'within query_all_tsid_prices in'
-                                              'database_queries.py' % table)
-
-                # Drop duplicate rows based on only the tsid and date columns
-                df.drop_duplicates(subset=['data_vendor_id', 'date'],
-                                   inplace=True)
-
-                # Move and set the date and data_vendor_id columns to the index
-                df.set_index(['date', 'data_vendor_id'], inplace=True)
-
-                # Have to rename the indices as set_index removes the names
-                df.index.name = ['date', 'data_vendor_id']
-
-                df.sort_index(inplace=True)
-            else:
-                raise TypeError('Not able to query any prices for %s in '
-                                'query_all_tsid_prices' % tsid)
+            cur.execute("""SELECT DISTINCT ON (tsid.source_id)
+                            tsid.source_id, csi.is_active, csi.end_date
+                        FROM symbology tsid
+                        INNER JOIN symbology csi_sym
+                        ON tsid.symbol_id = csi_sym.symbol_id
+                        INNER JOIN csidata_stock_factsheet csi
+                        ON csi_sym.source_id = csi.csi_number
+                        WHERE tsid.source='tsid'
+                        AND csi_sym.source='csi_data'
+                        ORDER BY tsid.source_id, csi.is_active DESC NULLS LAST,
+                            csi.end_date DESC NULLS LAST""")
+            rows = cur.fetchall()
+            df = pd.DataFrame(rows, columns=['tsid', 'is_active', 'end_date'])
+            df.set_index(['tsid'], inplace=True)
     except psycopg2.Error as e:
         print(e)
-        raise TypeError('Error when trying to connect to the %s database '
-                        'in query_all_tsid_prices' % database)
+        raise SystemError('Failed to query the data from the '
+                          'csidata_stock_factsheet table within '
+                          'query_code_activity')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'query_code_activity. Make sure the database '
+                          'address/name are correct.' % database)
     except Exception as e:
         print(e)
         raise SystemError('Error: Unknown issue occurred in '
-                          'query_all_tsid_prices')
+                          'query_code_activity')
 
     conn.close()
     return df
@@ -750,6 +942,54 @@ def query_existing_sid(database, user, password, host, port, source):
     return sid_df
 
 
+def query_exchange_sessions(database, user, password, host, port):
+    """ Query the daily session close of each tsid exchange symbol, along
+    with the exchange's country and city that provide its holidays and time
+    zone.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :return: DataFrame indexed by the tsid_symbol with the utc_offset, close,
+        country and city columns; the exchanges without a close time are
+        excluded
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    df = None
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""SELECT DISTINCT ON (tsid_symbol)
+                            tsid_symbol, utc_offset, close, country, city
+                        FROM exchanges
+                        WHERE close IS NOT NULL AND utc_offset IS NOT NULL
+                        ORDER BY tsid_symbol, exchange_id""")
+            rows = cur.fetchall()
+            df = pd.DataFrame(rows, columns=['tsid_symbol', 'utc_offset',
+                                             'close', 'country', 'city'])
+            df.set_index(['tsid_symbol'], inplace=True)
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to query the data from the exchange table '
+                          'within query_exchange_sessions')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'query_exchange_sessions. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in '
+                          'query_exchange_sessions')
+
+    conn.close()
+    return df
+
+
 def query_exchanges(database, user, password, host, port):
     """
     :param database: String of the database name
@@ -1178,6 +1418,50 @@ def query_source_weights(database, user, password, host, port):
     return df
 
 
+def query_table_fingerprint(database, user, password, host, port, tables):
+    """ Summarize the tables' contents by their row counts and the last
+    updated dates, which change whenever the tables' values are changed.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param tables: List of the table names; each must have an updated_date
+    :return: String of each table's row count and last updated date
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    fingerprint = []
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            for table in tables:
+                cur.execute("""SELECT COUNT(*), MAX(updated_date)
+                            FROM %s""" % table)
+                count, updated_date = cur.fetchone()
+                fingerprint.append('%s:%s:%s' % (
+                    table, count,
+                    updated_date.isoformat() if updated_date else None))
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to query the %s tables within '
+                          'query_table_fingerprint' % ', '.join(tables))
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'query_table_fingerprint. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in '
+                          'query_table_fingerprint')
+
+    conn.close()
+    return '|'.join(fingerprint)
+
+
 def query_tsid_based_on_exchanges(database, user, password, host, port,
                                   exchanges_list):
     """ Query all tsids that have one of the provided exchange abbreviations
@@ -1228,6 +1512,182 @@ def query_tsid_based_on_exchanges(database, user, password, host, port,
     return df
 
 
+def stream_query(database, user, password, host, port, query, params=None,
+                 fetch_size=50000, records=False):
+    """ Run the query within a named server-side cursor, yielding its rows
+    in chunks. The result stays on the database server, which sends
+    fetch_size rows per round trip, so arbitrarily large results are read in
+    constant memory. Closing the generator early ends the query.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param query: String of the query
+    :param params: Optional list of the query parameters
+    :param fetch_size: Integer of the rows in each chunk
+    :param records: Boolean of whether to yield numpy record arrays instead of
+        DataFrames
+    :return: Generator of the DataFrames (or record arrays) of the rows
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        # Named cursors only exist within a transaction
+        with conn:
+            cur = conn.cursor(name='stream_query')
+            cur.itersize = fetch_size
+            cur.execute(query, params)
+            for chunk in fetch_chunks(cur, fetch_size, records):
+                yield chunk
+            cur.close()
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to stream the query within stream_query')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'stream_query. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in stream_query')
+    finally:
+        conn.close()
+
+
+def stream_tsid_prices(database, user, password, host, port, table, tsid,
+                       fetch_size=50000):
+    """ Stream all of the tsid's stored prices from every vendor, ordered by
+    the date. This is the streaming version of query_all_tsid_prices, for the
+    tsids whose minute prices don't fit in memory.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param table: String of the table that should be queried from
+    :param tsid: String of which tsid to query prices for
+    :param fetch_size: Integer of the rows in each chunk
+    :return: Generator of the DataFrames with the data_vendor_id, date and
+        price columns; the daily prices have date objects, while the minute
+        prices have UTC datetimes
+    """
+
+    if table == 'daily_prices':
+        columns = ['data_vendor_id', 'date', 'open', 'high', 'low', 'close',
+                   'volume', 'dividend', 'split']
+    elif table == 'minute_prices':
+        columns = ['data_vendor_id', 'date', 'open', 'high', 'low', 'close',
+                   'volume']
+    else:
+        raise NotImplementedError('Table %s is not implemented within '
+                                  'stream_tsid_prices in database_queries.py' %
+                                  table)
+
+    query = ('SELECT %s FROM %s WHERE source_id=%%s AND source=%%s '
+             'ORDER BY date, data_vendor_id' % (', '.join(columns), table))
+    for df in stream_query(database=database, user=user, password=password,
+                           host=host, port=port, query=query,
+                           params=[tsid, 'tsid'], fetch_size=fetch_size):
+        df['date'] = pd.to_datetime(df['date'], utc=True)
+        if table == 'daily_prices':
+            df['date'] = df['date'].dt.date
+        yield df
+
+
+def copy_query(database, user, password, host, port, query, params=None,
+               dtypes=None, dates=None, spool_size=copy_spool_size):
+    """ Read the query's result with COPY (query) TO STDOUT in the CSV
+    format, decoding it with copy_frame. This is much faster than fetchall
+    for bulk reads, since the rows are never turned into Python tuples.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param query: String of the query, without a trailing semicolon
+    :param params: Optional list of the query parameters
+    :param dtypes: Optional dictionary of the column dtypes
+    :param dates: Optional list of the timestamp columns to convert to UTC
+        datetimes
+    :param spool_size: Integer of the bytes of COPY output held in memory
+        before it is spooled to a temporary file
+    :return: DataFrame of the query's rows
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            query = cur.mogrify(query, params).decode()
+            with tempfile.SpooledTemporaryFile(max_size=spool_size) as f:
+                cur.copy_expert('COPY (%s) TO STDOUT WITH (FORMAT csv, HEADER)'
+                                % query, f)
+                f.seek(0)
+                df = copy_frame(f, dtypes=dtypes, dates=dates)
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to copy the query within copy_query')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'copy_query. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in copy_query')
+
+    conn.close()
+    return df
+
+
+def copy_to_file(database, user, password, host, port, query, f,
+                 params=None):
+    """ Write the query's result to the file as CSV with COPY (query) TO
+    STDOUT. The rows go from the server to the file without being decoded.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param query: String of the query, without a trailing semicolon
+    :param f: File object opened for writing
+    :param params: Optional list of the query parameters
+    :return: Integer of the rows written
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            query = cur.mogrify(query, params).decode()
+            cur.copy_expert('COPY (%s) TO STDOUT WITH (FORMAT csv, HEADER)' %
+                            query, f)
+            rows = cur.rowcount
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to copy the query within copy_to_file')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'copy_to_file. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in copy_to_file')
+
+    conn.close()
+    return rows
+
+
 def update_load_table(database, user, password, host, port, values_df, table,
                       verbose=False):
     """ Update the load table values for each item in the values_df. Assuming
@@ -0,0 +1,181 @@
+from datetime import datetime, timezone
+import pandas as pd
+
+from utilities.daemon import cached
+from utilities.database_queries import query_code_activity, \
+    query_exchange_sessions
+from utilities.trading_calendar import drop_partial_bars, exchange_calendar
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+def last_session_dates(sessions_df, now=None):
+    """ Determine the date of each exchange's latest finished session, with
+    weekends and the holidays of the exchange's country having no sessions.
+
+    :param sessions_df: DataFrame from query_exchange_sessions, indexed by the
+        tsid_symbol with the utc_offset and close columns, and optionally the
+        country and city columns
+    :param now: Optional datetime used as the current time; defaults to now
+    :return: Series indexed by the tsid_symbol with the session dates as UTC
+        Timestamps
+    """
+
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    dates = {}
+    for tsid_symbol, session in sessions_df.iterrows():
+        session_date = exchange_calendar(session).last_session(now)
+        dates[tsid_symbol] = pd.Timestamp(session_date, tz='UTC')
+
+    return pd.Series(dates, dtype=object)
+
+
+def tsid_exchanges(tsids):
+    """
+    :param tsids: Series of tsids
+    :return: Series of each tsid's exchange symbol
+    """
+
+    return tsids.str.extract(r'^[^.]*\.([^.]*)', expand=False)
+
+
+def select_active_codes(codes_df, activity_df, sessions_df, latest_prices,
+                        intraday=False, now=None):
+    """ Select the codes that could have new bars since their last stored bar.
+    A code is skipped when it is inactive and its prices already reach its
+    end date, or when its exchange hasn't finished a session since its last
+    stored bar. Codes without any prices, CSI Data activity or exchange
+    session are always selected.
+
+    :param codes_df: DataFrame with a tsid column
+    :param activity_df: DataFrame from query_code_activity, indexed by the
+        tsid with the is_active and end_date columns
+    :param sessions_df: DataFrame from query_exchange_sessions
+    :param latest_prices: DataFrame from query_last_price, indexed by the tsid
+        with a date column
+    :param intraday: Boolean of whether the prices are intraday bars, which
+        are new during a session; only the inactive codes are skipped
+    :param now: Optional datetime used as the current time; defaults to now
+    :return: Tuple of the DataFrame of the selected codes_df rows, and a
+        dictionary of the number of inactive and no_session codes skipped
+    """
+
+    tsids = codes_df['tsid']
+    last_bar = pd.to_datetime(tsids.map(latest_prices['date']),
+                              utc=True).dt.normalize()
+
+    is_active = tsids.map(activity_df['is_active'])
+    end_date = pd.to_datetime(tsids.map(activity_df['end_date']), utc=True)
+    inactive = (is_active == 0) & (last_bar >= end_date)
+
+    if intraday:
+        no_session = pd.Series(False, index=codes_df.index)
+    else:
+        session_date = pd.to_datetime(tsid_exchanges(tsids).map(
+            last_session_dates(sessions_df, now)), utc=True)
+        no_session = ~inactive & (last_bar >= session_date)
+
+    skipped = {'inactive': int(inactive.sum()),
+               'no_session': int(no_session.sum())}
+    return codes_df[~(inactive | no_session)], skipped
+
+
+class DownloadPlanner(object):
+    """ Narrows an extractor's codes to those that could have new bars, using
+    the CSI Data activity and the exchange sessions. Any extractor can use it
+    on the codes from query_codes or query_q_codes before their redownload
+    time is checked. """
+
+    def __init__(self, database, user, password, host, port, cache=None):
+        """
+        :param database: String of the database name
+        :param user: String of the username used to login to the database
+        :param password: String of the password used to login to the database
+        :param host: String of the database address (localhost, url, ip, etc.)
+        :param port: Integer of the database port number (5432)
+        :param cache: Optional WarmCache of the daemon, which keeps the
+            activity and sessions between the runs
+        """
+
+        db_args = {'database': database, 'user': user, 'password': password,
+                   'host': host, 'port': port}
+        self.activity_df = cached(
+            cache, ('code_activity',),
+            lambda: query_code_activity(**db_args))
+        self.sessions_df = cached(
+            cache, ('exchange_sessions',),
+            lambda: query_exchange_sessions(**db_args))
+        self.session_dates = last_session_dates(self.sessions_df)
+
+    def select(self, codes_df, latest_prices, table, exchanges=None,
+               exclude_exchanges=None):
+        """ Select the codes that could have new bars for the price table,
+        printing how many were skipped.
+
+        :param codes_df: DataFrame with a tsid column
+        :param latest_prices: DataFrame from query_last_price
+        :param table: String of the price table; tables other than the
+            daily_prices table are treated as intraday bars
+        :param exchanges: Optional list of the tsid exchange symbols whose
+            codes are selected, used by the daemon's session group jobs
+        :param exclude_exchanges: Optional list of the tsid exchange symbols
+            whose codes are skipped
+        :return: DataFrame of the selected codes_df rows
+        """
+
+        if exchanges is not None:
+            codes_df = codes_df[tsid_exchanges(codes_df['tsid']).isin(
+                exchanges)]
+        if exclude_exchanges:
+            codes_df = codes_df[~tsid_exchanges(codes_df['tsid']).isin(
+                exclude_exchanges)]
+
+        selected_df, skipped = select_active_codes(
+            codes_df=codes_df, activity_df=self.activity_df,
+            sessions_df=self.sessions_df, latest_prices=latest_prices,
+            intraday=table != 'daily_prices')
+        print('%s inactive codes already have all of their prices, and %s '
+              'codes have no exchange session since their last price' %
+              ('{:,}'.format(skipped['inactive']),
+               '{:,}'.format(skipped['no_session'])))
+        return selected_df
+
+    def complete_bars(self, tsid, prices_df):
+        """ Remove the tsid's daily bars dated after its exchange's latest
+        closed session, as of when the planner was created.
+
+        :param tsid: String of the tsid
+        :param prices_df: DataFrame of the daily prices with an ISO date column
+        :return: DataFrame of the prices from the closed sessions
+        """
+
+        session_date = self.session_dates.get(tsid_exchanges(
+            pd.Series([tsid]))[0])
+        if session_date is None:
+            return prices_df
+        return drop_partial_bars(prices_df, session_date.date())
@@ -1,4 +1,11 @@
-from multiprocessing import Pool
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    ThreadPoolExecutor, wait
+from itertools import islice
+from multiprocessing import cpu_count, get_context
+from queue import Empty, Queue
+from threading import Event, Thread, active_count
+import traceback
 
 __author__ = 'Josh Schertz'
 __copyright__ = 'Copyright (C) 2018 Josh Schertz'
@@ -26,7 +33,322 @@ __version__ = '1.5.0'
 '''
 
 
-def multithread(function, items, threads=4):
+# The read-only state of the current worker process, set by init_worker_state
+worker_state = {}
+
+
+def init_worker_state(state):
+    """ Save the read-only state within the worker. This is the process pool's
+    initializer, so the state is sent to each worker once when it starts,
+    instead of with every task. With the default fork start method the state
+    isn't pickled at all; the workers share the parent's memory pages until
+    they are written to.
+
+    :param state: Dictionary of the worker state
+    """
+
+    worker_state.clear()
+    worker_state.update(state)
+
+
+class WorkerMethod(object):
+    """ Runs a method of the worker state's instance. Only the method name is
+    pickled with each task, instead of the instance and all of its data. """
+
+    def __init__(self, name):
+        """
+        :param name: String of the instance's method name
+        """
+
+        self.name = name
+
+    def __call__(self, item):
+        return getattr(worker_state['instance'], self.name)(item)
+
+
+class TaskResult(object):
+    """ The outcome of running the function for a single item. """
+
+    def __init__(self, index, item, value=None, error=None, trace=None):
+        """
+        :param index: Integer of the item's position within the items
+        :param item: The item that was passed into the function
+        :param value: The function's return value
+        :param error: String of the exception raised by the function, or None
+            if the function succeeded
+        :param trace: String of the exception's traceback
+        """
+
+        self.index = index
+        self.item = item
+        self.value = value
+        self.error = error
+        self.trace = trace
+
+    def failed(self):
+        return self.error is not None
+
+
+def run_chunk(function, chunk):
+    """ Run the function for each item in the chunk, capturing any exception
+    as the item's error. This runs within the executor's workers, so the
+    errors are converted to strings that can always be returned from a
+    process.
+
+    :param function: The function to run for each item
+    :param chunk: List of (index, item) tuples
+    :return: List of TaskResults
+    """
+
+    results = []
+    for index, item in chunk:
+        try:
+            results.append(TaskResult(index, item, value=function(item)))
+        except Exception as e:
+            results.append(TaskResult(index, item, error=repr(e),
+                                      trace=traceback.format_exc()))
+    return results
+
+
+class Executor(object):
+    """ Runs a function for many items in parallel. The items are submitted
+    in chunks, with only a few chunks per worker submitted at a time, which
+    keeps the memory flat and lets a cancellation stop the run quickly. The
+    results are streamed back as they complete, and an exception raised for
+    an item is saved as a failure instead of stopping the other items.
+
+    The backends implement run_chunks; use create_executor to build one.
+    """
+
+    def __init__(self, workers=4, chunk_size=1, progress=None, instance=None):
+        """
+        :param workers: Integer of the concurrent workers
+        :param chunk_size: Integer of the items that are submitted together
+        :param progress: Optional function that is called with the completed
+            and total item counts after each item completes
+        :param instance: Optional object whose methods are run for the items
+            (i.e. an extractor). It is loaded into each worker once, and the
+            tasks for its methods only send the method name and the item.
+        """
+
+        self.workers = workers
+        self.chunk_size = max(chunk_size, 1)
+        self.progress = progress
+        self.failures = []
+        self.cancelled = Event()
+        self.state = {'instance': instance}
+
+    def cancel(self):
+        """ Stop submitting new chunks. The chunks that are already running
+        finish, and their results are still returned. """
+
+        self.cancelled.set()
+
+    def chunks(self, items):
+        """ Split the items into lists of (index, item) tuples, stopping once
+        the executor is cancelled. """
+
+        indexed_items = iter(enumerate(items))
+        while not self.cancelled.is_set():
+            chunk = list(islice(indexed_items, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def task_function(self, function):
+        """ The function that is sent with each task. Threads share the
+        instance, so the function is used as is. """
+
+        return function
+
+    def run_chunks(self, function, chunks):
+        """ Run the function for each chunk, yielding each chunk's list of
+        TaskResults as the chunk completes. """
+
+        raise NotImplementedError('The %s backend does not run any chunks' %
+                                  self.__class__.__name__)
+
+    def as_completed(self, function, items):
+        """ Run the function for each item, yielding the TaskResults in the
+        order they complete.
+
+        :param function: The function to process in parallel. The process
+            backend requires it to be picklable.
+        :param items: A list of the items passed into the function
+        :return: Generator of TaskResults
+        """
+
+        completed = 0
+        function = self.task_function(function)
+        for chunk_results in self.run_chunks(function, self.chunks(items)):
+            for result in chunk_results:
+                if result.failed():
+                    self.failures.append(result)
+                completed += 1
+                if self.progress:
+                    self.progress(completed, len(items))
+                yield result
+
+    def map(self, function, items):
+        """ Run the function for each item, returning the results in the same
+        order as the items. Failed and cancelled items have a None result.
+
+        :param function: The function to process in parallel
+        :param items: A list of the items passed into the function
+        :return: List of the function's results
+        """
+
+        results = [None] * len(items)
+        for result in self.as_completed(function, items):
+            results[result.index] = result.value
+        return results
+
+    def failure_report(self, verbose=False):
+        """ Print the items that raised an exception.
+
+        :param verbose: Boolean of whether each failure's traceback is printed
+        :return: List of the failed TaskResults
+        """
+
+        if self.failures:
+            print('%s items failed:' % '{:,}'.format(len(self.failures)))
+            for failure in self.failures:
+                print('  %s: %s' % (failure.item, failure.error))
+                if verbose:
+                    print(failure.trace)
+        return self.failures
+
+
+class FuturesExecutor(Executor):
+    """ Base for the backends built on a concurrent.futures executor. """
+
+    pool_class = None
+
+    def create_pool(self):
+        return self.pool_class(max_workers=self.workers)
+
+    def run_chunks(self, function, chunks):
+        pool = self.create_pool()
+        pending = set()
+        try:
+            for chunk in chunks:
+                pending.add(pool.submit(run_chunk, function, chunk))
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # Only reached with pending chunks when the caller stops early
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+
+class ThreadExecutor(FuturesExecutor):
+    """ Runs the items in threads; best for network and database bound
+    functions. """
+
+    pool_class = ThreadPoolExecutor
+
+
+class ProcessExecutor(FuturesExecutor):
+    """ Runs the items in processes; best for CPU bound functions. """
+
+    pool_class = ProcessPoolExecutor
+
+    def create_pool(self):
+        return self.pool_class(max_workers=self.workers,
+                               initializer=init_worker_state,
+                               initargs=(self.state,))
+
+    def task_function(self, function):
+        if (self.state['instance'] is not None and
+                getattr(function, '__self__', None) is self.state['instance']):
+            return WorkerMethod(function.__name__)
+        return function
+
+
+class AsyncioExecutor(Executor):
+    """ Runs the items as tasks on an event loop, with up to the workers'
+    count of chunks running at once. Coroutine functions are awaited, while
+    normal functions are run in the loop's default thread pool. """
+
+    def run_chunks(self, function, chunks):
+        loop = asyncio.new_event_loop()
+        pending = set()
+        try:
+            for chunk in chunks:
+                pending.add(loop.create_task(
+                    self.run_async_chunk(loop, function, chunk)))
+                if len(pending) >= self.workers:
+                    done, pending = loop.run_until_complete(
+                        asyncio.wait(pending, return_when=FIRST_COMPLETED))
+                    for task in done:
+                        yield task.result()
+            while pending:
+                done, pending = loop.run_until_complete(
+                    asyncio.wait(pending, return_when=FIRST_COMPLETED))
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(
+                    asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+
+    @staticmethod
+    async def run_async_chunk(loop, function, chunk):
+        if asyncio.iscoroutinefunction(function):
+            results = []
+            for index, item in chunk:
+                try:
+                    results.append(TaskResult(index, item,
+                                              value=await function(item)))
+                except Exception as e:
+                    results.append(TaskResult(index, item, error=repr(e),
+                                              trace=traceback.format_exc()))
+            return results
+        return await loop.run_in_executor(None, run_chunk, function, chunk)
+
+
+executor_backends = {
+    'thread': ThreadExecutor,
+    'process': ProcessExecutor,
+    'asyncio': AsyncioExecutor,
+}
+
+
+def create_executor(backend='process', workers=4, chunk_size=1,
+                    progress=None, instance=None):
+    """ Create an executor for one of the backends.
+
+    :param backend: String of the backend; either thread, process or asyncio
+    :param workers: Integer of the concurrent workers
+    :param chunk_size: Integer of the items that are submitted together
+    :param progress: Optional function that is called with the completed and
+        total item counts after each item completes
+    :param instance: Optional object whose methods are run for the items; it
+        is loaded into each worker once instead of being sent with each task
+    :return: Executor
+    """
+
+    try:
+        executor_class = executor_backends[backend]
+    except KeyError:
+        raise NotImplementedError('The %s executor backend is not '
+                                  'implemented. Use one of: %s' %
+                                  (backend, ', '.join(executor_backends)))
+    return executor_class(workers=workers, chunk_size=chunk_size,
+                          progress=progress, instance=instance)
+
+
+def multithread(function, items, threads=4, backend='process'):
     """ Takes the main function to run in parallel, inputs the variable(s)
     and returns the results.
 
@@ -35,14 +357,158 @@ def multithread(function, items, threads=4):
     each thread.
     :param threads: The number of threads to use. The default is 4, but
     the threads are not CPU core bound.
-    :return: The results of the function passed into this function.
+    :param backend: String of the executor backend; either thread, process or
+    asyncio. The default is process.
+    :return: The results of the function passed into this function. Items that
+    raised an exception have a None result, and are listed in the printed
+    failure report.
+    """
+
+    executor = create_executor(backend, workers=threads,
+                               instance=getattr(function, '__self__', None))
+    results = executor.map(function, items)
+    executor.failure_report()
+
+    return results
+
+
+class EndItem(object):
+    """ Returned by a pipeline stage to finish an item early, with the value
+    becoming the item's result. """
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+def run_stage(function, item, *args):
+    """ Run a pipeline stage function for the item, catching any error so that
+    the stage's worker keeps processing the remaining items.
+
+    :param function: The stage function
+    :param item: The item being processed
+    :param args: The other arguments for the stage function
+    :return: The stage's output, or an EndItem if the item is finished
     """
 
-    """The async variant, which submits all processes at once and
-    retrieve the results as soon as they are done."""
-    pool = Pool(threads)
-    output = [pool.apply_async(function, args=(item,)) for item in items]
-    results = [p.get() for p in output]
+    try:
+        output = function(item, *args)
+    except Exception as e:
+        print('A pipeline stage failed for %s: %s' % (item, e))
+        return EndItem()
+
+    if output is None:
+        return EndItem()
+    return output
+
+
+def parse_pool_context():
+    """ Selects how the parse processes are started. Forking copies only the
+    calling thread, so a fork while other threads are running (such as the
+    lease heartbeat or the daemon's control server) can leave a child with a
+    lock that one of those threads held. The forkserver starts the processes
+    from a clean single threaded server instead.
+
+    :return: The multiprocessing context used to create the parse pool
+    """
+
+    if active_count() > 1:
+        return get_context('forkserver')
+    return get_context('fork')
+
+
+def pipeline(items, fetch, parse, write, fetchers=4, parsers=None, writers=2,
+             queue_size=None):
+    """ Runs each item through a fetch, parse and write stage, where each stage
+    has its own workers. The fetch and write stages are threads, since they
+    spend most of their time waiting on the network or the database, while the
+    parse stage uses a process pool sized to the CPU cores. The stages are
+    connected by bounded queues, so a slow stage holds back the stage before
+    it instead of the downloaded data piling up in memory.
+
+    A stage finishes an item early by returning None (the result is None) or
+    an EndItem with the item's result.
+
+    :param items: A list of items that are passed into the fetch function
+    :param fetch: Function that takes an item and returns the downloaded data
+    :param parse: Function that takes the item and the downloaded data, and
+        returns the parsed data. It is run in the process pool, so it must be
+        picklable (a module level function or a functools.partial of one).
+    :param write: Function that takes the item and the parsed data, saves it,
+        and returns the item's result
+    :param fetchers: Integer of the fetch threads
+    :param parsers: Integer of the parse processes; defaults to the CPU cores
+    :param writers: Integer of the write threads
+    :param queue_size: Integer of the items each queue can hold between the
+        stages; defaults to twice the larger of the fetchers and parsers
+    :return: A list of the item results, in the same order as the items
+    """
+
+    parsers = parsers or cpu_count()
+    queue_size = queue_size or 2 * max(fetchers, parsers)
+
+    results = [None] * len(items)
+    item_queue = Queue()
+    fetched_queue = Queue(maxsize=queue_size)
+    parsed_queue = Queue(maxsize=queue_size)
+
+    for index, item in enumerate(items):
+        item_queue.put((index, item))
+
+    def fetch_worker():
+        while True:
+            try:
+                index, item = item_queue.get_nowait()
+            except Empty:
+                return
+            data = run_stage(fetch, item)
+            if isinstance(data, EndItem):
+                results[index] = data.value
+            else:
+                fetched_queue.put((index, item, data))
+
+    def parse_dispatcher():
+        while True:
+            fetched = fetched_queue.get()
+            if fetched is None:
+                break
+            index, item, data = fetched
+            # The parsed queue holds the pending results, which limits the
+            #   number of items that are in the process pool at once
+            parsed_queue.put((index, item,
+                              pool.apply_async(parse, args=(item, data))))
+        for _ in range(writers):
+            parsed_queue.put(None)
+
+    def write_worker():
+        while True:
+            parsed = parsed_queue.get()
+            if parsed is None:
+                return
+            index, item, pending = parsed
+            # Re-raises any error from the parse process
+            output = run_stage(lambda item_: pending.get(), item)
+            if not isinstance(output, EndItem):
+                output = run_stage(write, item, output)
+            if isinstance(output, EndItem):
+                output = output.value
+            results[index] = output
+
+    # Create the processes before the stage threads are started
+    pool = parse_pool_context().Pool(parsers)
+
+    fetch_threads = [Thread(target=fetch_worker) for _ in range(fetchers)]
+    write_threads = [Thread(target=write_worker) for _ in range(writers)]
+    dispatcher = Thread(target=parse_dispatcher)
+    for thread in fetch_threads + write_threads + [dispatcher]:
+        thread.start()
+
+    for thread in fetch_threads:
+        thread.join()
+    fetched_queue.put(None)     # All items are fetched
+    dispatcher.join()
+    for thread in write_threads:
+        thread.join()
+
     pool.close()
     pool.join()
 
@@ -0,0 +1,214 @@
+import os
+import psycopg2
+import threading
+import time
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# The database used to coordinate the vendor call limits between every host;
+#   None keeps each process to its own pacing. Set by use_cluster_rate_limits
+#   before the extractors are created.
+cluster_database = None
+
+
+def use_cluster_rate_limits(database_options):
+    """ Coordinate the vendor call limits of every extractor created after
+    this through the database, so that all of the hosts downloading from a
+    vendor share its limit.
+
+    :param database_options: Dictionary of the database, user, password,
+        host and port used for the token grants; None turns it off
+    """
+
+    global cluster_database
+    if database_options is None:
+        cluster_database = None
+    else:
+        cluster_database = {key: database_options[key] for key in
+                            ('database', 'user', 'password', 'host', 'port')}
+
+
+def grant_tokens(database, user, password, host, port, vendor, calls,
+                 period_sec, batch_size):
+    """ Take up to batch_size calls from the vendor's current limit window,
+    starting a new window once the prior one has passed. The upsert locks the
+    vendor's row, so concurrent grants from every host are serialized.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param vendor: String of the vendor name (quandl, google, yahoo)
+    :param calls: Integer of the calls allowed within each window
+    :param period_sec: Integer of the window's length in seconds
+    :param batch_size: Integer of the calls to take
+    :return: Tuple of the integer of calls granted and the float of seconds
+        until the window ends, measured by the database's clock
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    grant = None
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""INSERT INTO rate_limit_tokens AS t
+                        (vendor, window_start, granted, last_grant,
+                        updated_date)
+                        VALUES (%(vendor)s, NOW(), LEAST(%(batch)s, %(calls)s),
+                            LEAST(%(batch)s, %(calls)s), NOW())
+                        ON CONFLICT (vendor) DO UPDATE SET
+                            window_start=CASE
+                                WHEN t.window_start <=
+                                    NOW() - %(period)s * INTERVAL '1 second'
+                                THEN NOW() ELSE t.window_start END,
+                            granted=CASE
+                                WHEN t.window_start <=
+                                    NOW() - %(period)s * INTERVAL '1 second'
+                                THEN LEAST(%(batch)s, %(calls)s)
+                                ELSE GREATEST(t.granted, LEAST(
+                                    t.granted + %(batch)s, %(calls)s)) END,
+                            last_grant=CASE
+                                WHEN t.window_start <=
+                                    NOW() - %(period)s * INTERVAL '1 second'
+                                THEN LEAST(%(batch)s, %(calls)s)
+                                ELSE GREATEST(LEAST(
+                                    %(batch)s, %(calls)s - t.granted), 0) END,
+                            updated_date=NOW()
+                        RETURNING last_grant,
+                            EXTRACT(EPOCH FROM window_start +
+                                %(period)s * INTERVAL '1 second' - NOW())""",
+                        {'vendor': vendor, 'calls': calls,
+                         'period': period_sec, 'batch': batch_size})
+            granted, seconds_left = cur.fetchone()
+            grant = (granted, float(seconds_left))
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(e)
+        raise SystemError('Failed to grant the %s calls from the '
+                          'rate_limit_tokens table within grant_tokens' %
+                          vendor)
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'grant_tokens. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in grant_tokens')
+
+    conn.close()
+    return grant
+
+
+class RateLimiter(object):
+    """ Paces an extractor's calls to a vendor. Each thread sleeps for the
+    minimum interval before its call, which keeps a single process within the
+    vendor's limit.
+
+    With the cluster rate limits on, each call also needs a token from the
+    vendor's shared window in the rate_limit_tokens table, so that the
+    extractors on every host stay within the one limit. The tokens are taken
+    from the database in batches and handed out locally, with any unused
+    tokens being dropped once their window ends.
+    """
+
+    def __init__(self, vendor, rate, period_sec, threads, batch_size=None,
+                 database_options=None):
+        """
+        :param vendor: String of the vendor name (quandl, google, yahoo)
+        :param rate: Integer of the calls the vendor allows within the period
+        :param period_sec: Integer of the period's length in seconds
+        :param threads: Integer of the threads calling the vendor within this
+            process
+        :param batch_size: Optional integer of the tokens taken from the
+            database at a time; defaults to 1% of the rate
+        :param database_options: Optional dictionary of the database used for
+            the token grants; defaults to the cluster_database
+        """
+
+        self.vendor = vendor
+        self.rate = rate
+        self.period_sec = period_sec
+        self.min_interval = float((period_sec / rate) * threads)
+        self.batch_size = batch_size or max(1, rate // 100)
+        self.database_options = database_options
+        if database_options is None:
+            self.database_options = cluster_database
+
+        self.lock = threading.Lock()
+        self.reset_tokens()
+
+    def reset_tokens(self):
+        self.tokens = 0
+        self.tokens_expire = 0.0
+        # Tokens copied into a forked process would be spent twice
+        self.pid = os.getpid()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.reset_tokens()
+
+    @property
+    def cluster(self):
+        return self.database_options is not None
+
+    def wait(self):
+        """ Block until the next call to the vendor is allowed. """
+
+        # Rate limit this function with non-reactive timer
+        time.sleep(self.min_interval)
+
+        if self.cluster:
+            self.take_token()
+
+    def take_token(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset_tokens()
+            while True:
+                if self.tokens > 0 and time.time() < self.tokens_expire:
+                    self.tokens -= 1
+                    return
+                granted, seconds_left = grant_tokens(
+                    vendor=self.vendor, calls=self.rate,
+                    period_sec=self.period_sec, batch_size=self.batch_size,
+                    **self.database_options)
+                self.tokens = granted
+                self.tokens_expire = time.time() + seconds_left
+                if granted == 0:
+                    # Every host waits for the vendor's next window
+                    print('The %s calls for this window are used up across '
+                          'the cluster; waiting %0.1f seconds' %
+                          (self.vendor, seconds_left))
+                    time.sleep(max(seconds_left, 0.1))
@@ -0,0 +1,274 @@
+import argparse
+import pandas as pd
+import psycopg2
+import time
+
+from utilities.database_queries import copy_query, stream_query
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Scratch table holding the generated daily prices that the reads are timed on
+benchmark_table = 'read_benchmark'
+
+# Price columns of the benchmark table, matching the daily_prices table
+benchmark_fields = ['open', 'high', 'low', 'close', 'volume', 'dividend',
+                    'split']
+
+
+def create_benchmark_table(database, user, password, host, port, rows):
+    """ Create the unlogged benchmark table with the number of generated
+    daily price rows, spread over 5,000 tsids.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param rows: Integer of the rows to generate
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute('DROP TABLE IF EXISTS %s' % benchmark_table)
+            cur.execute("""CREATE UNLOGGED TABLE %s AS
+                SELECT 1::SMALLINT AS data_vendor_id, 'tsid'::TEXT AS source,
+                    'T' || mod(i, 5000) || '.Q.0' AS source_id,
+                    '2000-01-03'::TIMESTAMPTZ + (i / 5000) * INTERVAL '1 day'
+                        AS date,
+                    (random() * 500)::DECIMAL(11,4) AS open,
+                    (random() * 500)::DECIMAL(11,4) AS high,
+                    (random() * 500)::DECIMAL(11,4) AS low,
+                    (random() * 500)::DECIMAL(11,4) AS close,
+                    (random() * 10000000)::BIGINT AS volume,
+                    0::DECIMAL(6,3) AS dividend,
+                    1::DECIMAL(11,4) AS split
+                FROM generate_series(0, %%s - 1) AS i""" % benchmark_table,
+                        (rows,))
+            cur.execute('ANALYZE %s' % benchmark_table)
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to create the %s table within '
+                          'create_benchmark_table' % benchmark_table)
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'create_benchmark_table. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in '
+                          'create_benchmark_table')
+
+    conn.close()
+
+
+def drop_benchmark_table(database, user, password, host, port):
+    """ Remove the benchmark table.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute('DROP TABLE IF EXISTS %s' % benchmark_table)
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to drop the %s table within '
+                          'drop_benchmark_table' % benchmark_table)
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'drop_benchmark_table. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in '
+                          'drop_benchmark_table')
+
+    conn.close()
+
+
+def benchmark_query():
+    """
+    :return: String of the query every read method runs
+    """
+
+    return ('SELECT source_id AS tsid, date, %s FROM %s' %
+            (', '.join(benchmark_fields), benchmark_table))
+
+
+def read_fetchall(database, user, password, host, port):
+    """ Read the benchmark table the way the price queries did before COPY,
+    building the DataFrame from the fetchall tuples.
+
+    :return: DataFrame of the prices
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute(benchmark_query())
+            columns = [column[0] for column in cur.description]
+            df = pd.DataFrame(cur.fetchall(), columns=columns)
+            df = df.astype({field: float for field in benchmark_fields})
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to read the %s table within '
+                          'read_fetchall' % benchmark_table)
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'read_fetchall. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in read_fetchall')
+
+    conn.close()
+    return df
+
+
+def read_stream(database, user, password, host, port):
+    """ Read the benchmark table in chunks from a server-side cursor.
+
+    :return: DataFrame of the prices
+    """
+
+    df = pd.concat(stream_query(database=database, user=user,
+                                password=password, host=host, port=port,
+                                query=benchmark_query(), fetch_size=100000),
+                   ignore_index=True)
+    return df.astype({field: float for field in benchmark_fields})
+
+
+def read_copy(database, user, password, host, port):
+    """ Read the benchmark table with COPY, decoding the CSV output straight
+    into the typed columns.
+
+    :return: DataFrame of the prices
+    """
+
+    return copy_query(database=database, user=user, password=password,
+                      host=host, port=port, query=benchmark_query(),
+                      dtypes={field: 'float64' for field in benchmark_fields},
+                      dates=['date'])
+
+
+read_methods = {'fetchall': read_fetchall, 'stream': read_stream,
+                'copy': read_copy}
+
+
+def benchmark_reads(database, user, password, host, port, row_counts,
+                    methods=None, repeats=1):
+    """ Time each read method on benchmark tables of each row count. The
+    table is rebuilt for every row count and dropped at the end.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param row_counts: List of the integer table sizes to read
+    :param methods: Optional list of the read_methods keys to time; defaults
+        to all of them
+    :param repeats: Integer of the reads per method, keeping the fastest
+    :return: DataFrame of the rows, method, seconds and rows per second
+    """
+
+    db = {'database': database, 'user': user, 'password': password,
+          'host': host, 'port': port}
+    results = []
+
+    try:
+        for rows in row_counts:
+            print('Creating the %s row benchmark table' % '{:,}'.format(rows))
+            create_benchmark_table(rows=rows, **db)
+
+            for method in methods or list(read_methods):
+                seconds = None
+                for _ in range(repeats):
+                    start_time = time.time()
+                    df = read_methods[method](**db)
+                    elapsed = time.time() - start_time
+                    if len(df.index) != rows:
+                        raise SystemError('The %s read returned %i of the %i '
+                                          'rows' % (method, len(df.index),
+                                                    rows))
+                    del df
+                    seconds = elapsed if seconds is None else \
+                        min(seconds, elapsed)
+
+                results.append({'rows': rows, 'method': method,
+                                'seconds': round(seconds, 2),
+                                'rows_per_sec': int(rows / seconds)})
+                print('%s rows with %s took %0.2f seconds' %
+                      ('{:,}'.format(rows), method, seconds))
+    finally:
+        drop_benchmark_table(**db)
+
+    return pd.DataFrame(results, columns=['rows', 'method', 'seconds',
+                                          'rows_per_sec'])
+
+
+if __name__ == '__main__':
+
+    from utilities.user_dir import user_dir
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the fetchall, server-side cursor and COPY '
+                    'reads of generated daily prices')
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[1000000, 50000000],
+                        help='The benchmark table sizes to read')
+    parser.add_argument('--methods', nargs='+', choices=list(read_methods),
+                        help='The read methods to time; the fetchall read of '
+                             'a large table needs many GB of memory')
+    parser.add_argument('--repeats', type=int, default=1,
+                        help='The reads per method, keeping the fastest')
+    args = parser.parse_args()
+
+    userdir = user_dir()
+
+    results_df = benchmark_reads(
+        database=userdir['postgresql']['pysecmaster_db'],
+        user=userdir['postgresql']['pysecmaster_user'],
+        password=userdir['postgresql']['pysecmaster_password'],
+        host=userdir['postgresql']['pysecmaster_host'],
+        port=userdir['postgresql']['pysecmaster_port'],
+        row_counts=args.rows, methods=args.methods, repeats=args.repeats)
+    print(results_df.to_string(index=False))
@@ -0,0 +1,294 @@
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+import psycopg2
+import threading
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Downloads without new prices before a tsid's refresh interval backs off;
+#   allows for the holidays and other single days without prices
+backoff_grace = 1
+
+# The longest refresh interval, so that dormant tsids are still checked
+max_refresh_interval = 60 * 60 * 24 * 30
+
+
+def refresh_interval(redownload_time, unchanged_streak):
+    """ Determine how long to wait before downloading a tsid again. The
+    interval doubles with each download past the grace downloads that had no
+    new prices, up to the max_refresh_interval.
+
+    :param redownload_time: Integer of the seconds before the data can be
+        downloaded again
+    :param unchanged_streak: Integer of the consecutive downloads without new
+        prices
+    :return: Integer of the seconds before the tsid is downloaded again
+    """
+
+    backoff = min(max(unchanged_streak - backoff_grace, 0), 30)
+    return int(min(redownload_time * 2 ** backoff,
+                   max(max_refresh_interval, redownload_time)))
+
+
+def due_codes(codes_df, refresh_df, redownload_time, now=None):
+    """ Select the codes whose refresh interval has passed. The codes with a
+    refresh history are due once their interval has passed since they were
+    last downloaded; the rest are due once the redownload time has passed
+    since their prices were last updated.
+
+    :param codes_df: DataFrame with the tsid and updated_date columns, where
+        the updated_date is empty for codes that were never downloaded
+    :param refresh_df: DataFrame from query_refresh_history, indexed by the
+        tsid with the unchanged_streak and last_checked columns
+    :param redownload_time: Integer of the seconds before the data can be
+        downloaded again
+    :param now: Optional datetime used for the due check; defaults to now
+    :return: DataFrame of the codes_df rows that are due
+    """
+
+    if now is None:
+        now = datetime.now(timezone.utc)
+    now = pd.Timestamp(now)
+
+    streak = codes_df['tsid'].map(refresh_df['unchanged_streak'])
+    last_checked = pd.to_datetime(
+        codes_df['tsid'].map(refresh_df['last_checked']), utc=True)
+    interval = streak.fillna(0).map(
+        lambda value: refresh_interval(redownload_time, int(value)))
+
+    updated_date = pd.to_datetime(codes_df['updated_date'], utc=True)
+    default_due = (updated_date.isnull() |
+                   (updated_date < now - timedelta(seconds=redownload_time)))
+    history_due = last_checked < now - pd.to_timedelta(interval, unit='s')
+
+    return codes_df[last_checked.isnull() & default_due |
+                    last_checked.notnull() & history_due]
+
+
+def last_price_date(latest_prices, tsid):
+    """ :return: The tsid's newest price date from the latest prices, or None
+        if it has none (or the latest prices weren't loaded) """
+
+    if latest_prices is None or tsid not in latest_prices.index:
+        return None
+    return latest_prices.loc[tsid, 'date']
+
+
+def has_new_prices(clean_data, last_date):
+    """ Determine if the download produced prices newer than the tsid's newest
+    stored price. Replaced prices within the days_back period don't count.
+
+    :param clean_data: DataFrame of the downloaded prices with a date column
+    :param last_date: The tsid's newest price date before the download, or
+        None if it had no prices
+    :return: Boolean of whether there are new prices
+    """
+
+    if len(clean_data.index) == 0:
+        return False
+    if last_date is None or pd.isnull(last_date):
+        return True
+    return (pd.to_datetime(clean_data['date'], utc=True).max() >
+            pd.to_datetime(last_date, utc=True))
+
+
+def query_refresh_history(database, user, password, host, port, vendor_id,
+                          table):
+    """ Query the refresh history of the vendor's tsids for the price table.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param vendor_id: Integer of the data vendor id
+    :param table: String of the price table
+    :return: DataFrame indexed by the tsid with the downloads, changes,
+        unchanged_streak and last_checked columns
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    df = None
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""SELECT source_id, downloads, changes,
+                            unchanged_streak, last_checked
+                        FROM refresh_history
+                        WHERE data_vendor_id=%s AND price_table=%s
+                        AND source='tsid'""",
+                        (vendor_id, table))
+            rows = cur.fetchall()
+            df = pd.DataFrame(rows, columns=['tsid', 'downloads', 'changes',
+                                             'unchanged_streak',
+                                             'last_checked'])
+            df['last_checked'] = pd.to_datetime(df['last_checked'], utc=True)
+            df.set_index(['tsid'], inplace=True)
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to query the refresh history from the '
+                          'refresh_history table within '
+                          'query_refresh_history')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'query_refresh_history. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in '
+                          'query_refresh_history')
+
+    conn.close()
+    return df
+
+
+def record_refresh(database, user, password, host, port, vendor_id, table,
+                   results):
+    """ Add the download results to the tsids' refresh history. A download with
+    new prices resets the tsid's unchanged streak, while one without new
+    prices extends it.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param vendor_id: Integer of the data vendor id
+    :param table: String of the price table
+    :param results: List of the (tsid, changed, checked_date) tuples, where
+        changed is a boolean of whether the download had new prices
+    """
+
+    cur_date = datetime.now(timezone.utc).isoformat()
+    rows = [(vendor_id, tsid, table, int(changed), int(not changed),
+             checked_date, checked_date if changed else None, cur_date)
+            for tsid, changed, checked_date in results]
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.executemany("""INSERT INTO refresh_history AS h
+                            (data_vendor_id, source, source_id, price_table,
+                            downloads, changes, unchanged_streak, last_checked,
+                            last_changed, updated_date)
+                            VALUES (%s, 'tsid', %s, %s, 1, %s, %s, %s, %s, %s)
+                            ON CONFLICT (data_vendor_id, source, source_id,
+                                price_table)
+                            DO UPDATE SET downloads=h.downloads + 1,
+                                changes=h.changes + EXCLUDED.changes,
+                                unchanged_streak=CASE
+                                    WHEN EXCLUDED.changes > 0 THEN 0
+                                    ELSE h.unchanged_streak + 1 END,
+                                last_checked=EXCLUDED.last_checked,
+                                last_changed=COALESCE(EXCLUDED.last_changed,
+                                                      h.last_changed),
+                                updated_date=EXCLUDED.updated_date""",
+                            rows)
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(e)
+        raise SystemError('Failed to insert the download results into the '
+                          'refresh_history table within record_refresh')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'record_refresh. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in record_refresh')
+
+    conn.close()
+
+
+class RefreshHistory(object):
+    """ Collects an extractor's download results, saving them to the
+    refresh_history table in batches. """
+
+    def __init__(self, database, user, password, host, port, vendor_id,
+                 table, flush_size=100):
+        """
+        :param vendor_id: Integer of the data vendor id
+        :param table: String of the price table
+        :param flush_size: Integer of the results saved at a time; use 1 when
+            the results are recorded within worker processes, as those are
+            never flushed at the end
+        """
+
+        self.database_options = {'database': database, 'user': user,
+                                 'password': password, 'host': host,
+                                 'port': port}
+        self.vendor_id = vendor_id
+        self.table = table
+        self.flush_size = flush_size
+
+        self.lock = threading.Lock()
+        self.results = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        state['results'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def record(self, tsid, changed):
+        """ Add the tsid's download result, saving the results once there are
+        flush_size of them.
+
+        :param tsid: String of the tsid that was downloaded
+        :param changed: Boolean of whether the download had new prices
+        """
+
+        with self.lock:
+            self.results.append(
+                (tsid, changed, datetime.now(timezone.utc).isoformat()))
+            if len(self.results) < self.flush_size:
+                return
+            results, self.results = self.results, []
+        self.save(results)
+
+    def flush(self):
+        with self.lock:
+            results, self.results = self.results, []
+        if results:
+            self.save(results)
+
+    def save(self, results):
+        try:
+            record_refresh(vendor_id=self.vendor_id, table=self.table,
+                           results=results, **self.database_options)
+        except SystemError as e:
+            # The history only schedules later downloads; keep downloading
+            print('Unable to save the refresh history of %i tsids: %s' %
+                  (len(results), e))
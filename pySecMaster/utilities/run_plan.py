@@ -0,0 +1,237 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+import json
+import numpy as np
+import os
+import pandas as pd
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Rows assumed for a tsid without prior prices; about 20 years of weekdays
+new_item_rows = 5000
+
+# Recorded runs kept for each source
+max_runs = 10
+
+
+def estimate_plan_rows(last_dates, today=None):
+    """ Estimate the daily price rows that the planned items will write. The
+    items with prior prices return a row for every weekday after their last
+    price, while the items without prices return their full history.
+
+    :param last_dates: Series of each item's last price date, or None for the
+        items without prices
+    :param today: Optional string of the end date (YYYY-MM-DD); defaults to
+        today
+    :return: Integer of the estimated rows
+    """
+
+    if today is None:
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+    last_dates = pd.to_datetime(pd.Series(last_dates, dtype=object),
+                                utc=True)
+    has_prices = last_dates.notnull()
+    beg_dates = (last_dates[has_prices].dt.tz_localize(None)
+                 .values.astype('datetime64[D]'))
+    # Counts the weekdays after the last price, through today
+    rows = np.busday_count(beg_dates + 1,
+                           np.datetime64(today) + 1).clip(min=0)
+    return int(rows.sum() + (~has_prices).sum() * new_item_rows)
+
+
+class ThroughputLog(object):
+    """ The recorded throughput of the prior download runs, saved to a JSON
+    file: the items per second of each source (vendor, selection and price
+    table), and the rows per second of each database writer. """
+
+    def __init__(self, path):
+        """
+        :param path: String of the JSON file
+        """
+
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'sources': {}, 'database': []}
+
+    def save(self, state):
+        temp_file = '%s.%i.tmp' % (self.path, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(temp_file, self.path)
+
+    def record_source(self, vendor, selection, table, items, seconds):
+        """ Record a source's finished run.
+
+        :param vendor: String of the vendor (quandl, google, yahoo)
+        :param selection: String of the download selection
+        :param table: String of the price table
+        :param items: Integer of the items that were planned
+        :param seconds: Float of the seconds the run took
+        """
+
+        if not items or seconds <= 0:
+            return
+        state = self.load()
+        runs = state['sources'].setdefault(
+            '%s|%s|%s' % (vendor, selection, table), [])
+        runs.append({'items': items, 'seconds': round(seconds, 2),
+                     'date': datetime.now(timezone.utc).isoformat()})
+        del runs[:-max_runs]
+        self.save(state)
+
+    def record_writes(self, rows, seconds):
+        """ Record the rows written during a run, and the seconds that the
+        writers spent writing them.
+
+        :param rows: Integer of the rows written
+        :param seconds: Float of the summed seconds of every write
+        """
+
+        if not rows or seconds <= 0:
+            return
+        state = self.load()
+        state['database'].append({'rows': rows, 'seconds': round(seconds, 2)})
+        del state['database'][:-max_runs]
+        self.save(state)
+
+    def items_per_second(self, vendor, selection, table, state=None):
+        """ :return: Float of the source's recorded items per second, using
+            the vendor's other sources when the source has no runs, or None
+            if the vendor has no runs """
+
+        state = state or self.load()
+        runs = state['sources'].get('%s|%s|%s' % (vendor, selection, table))
+        if not runs:
+            runs = [run for key, key_runs in state['sources'].items()
+                    if key.split('|')[0] == vendor for run in key_runs]
+        if not runs:
+            return None
+        return (sum(run['items'] for run in runs) /
+                sum(run['seconds'] for run in runs))
+
+    def rows_per_second(self, state=None):
+        """ :return: Float of the recorded rows per second of one database
+            writer, or None if no writes were recorded """
+
+        runs = (state or self.load())['database']
+        if not runs:
+            return None
+        return (sum(run['rows'] for run in runs) /
+                sum(run['seconds'] for run in runs))
+
+
+def estimate_plan(plans, log, db_writers=None, concurrent=False):
+    """ Estimate how long each planned source and the whole run will take.
+    Each source takes the longer of the times from its recorded throughput
+    and from its vendor's rate limit. The database writes overlap the
+    downloads, so they only lengthen the run when they take longer than the
+    downloads.
+
+    :param plans: List of the dictionaries of each source's vendor, selection,
+        table, items, calls, rows, rate and period_sec
+    :param log: ThroughputLog of the prior runs
+    :param db_writers: Optional integer of the concurrent database writes
+    :param concurrent: Boolean of whether the vendors are downloaded at the
+        same time
+    :return: Tuple of the list of the plans with their seconds and basis, the
+        float of the database write seconds (or None) and the float of the
+        total seconds
+    """
+
+    state = log.load()
+    estimates = []
+    vendor_seconds = OrderedDict()
+    for plan in plans:
+        plan = dict(plan)
+        seconds = {'rate limit': plan['calls'] * plan['period_sec'] /
+                   plan['rate']}
+        items_per_second = log.items_per_second(
+            plan['vendor'], plan['selection'], plan['table'], state)
+        if items_per_second:
+            seconds['recorded throughput'] = plan['items'] / items_per_second
+        plan['basis'], plan['seconds'] = max(seconds.items(),
+                                             key=lambda item: item[1])
+        estimates.append(plan)
+        vendor_seconds[plan['vendor']] = (
+            vendor_seconds.get(plan['vendor'], 0) + plan['seconds'])
+
+    if concurrent:
+        download_seconds = max(vendor_seconds.values(), default=0)
+    else:
+        download_seconds = sum(vendor_seconds.values())
+
+    write_seconds = None
+    rows_per_second = log.rows_per_second(state)
+    if rows_per_second:
+        write_seconds = (sum(plan['rows'] for plan in plans) /
+                         (rows_per_second * (db_writers or 1)))
+
+    return (estimates, write_seconds,
+            max(download_seconds, write_seconds or 0))
+
+
+def format_seconds(seconds):
+    if seconds < 60 * 60:
+        return '%0.1f minutes' % (seconds / 60)
+    return '%0.1f hours' % (seconds / 60 / 60)
+
+
+def print_plan(estimates, write_seconds, total_seconds, db_writers=None,
+               concurrent=False):
+    """ Print the estimate of each planned source and of the whole run.
+
+    :param estimates: List of the plans from estimate_plan
+    :param write_seconds: Float of the database write seconds, or None
+    :param total_seconds: Float of the run's seconds
+    :param db_writers: Optional integer of the concurrent database writes
+    :param concurrent: Boolean of whether the vendors are downloaded at the
+        same time
+    """
+
+    print('\nDownload plan:')
+    for plan in estimates:
+        print('  %s %s %s: %s items in %s calls, ~%s rows; %s (%s)' %
+              (plan['vendor'], plan['selection'], plan['table'],
+               '{:,}'.format(plan['items']), '{:,}'.format(plan['calls']),
+               '{:,}'.format(plan['rows']), format_seconds(plan['seconds']),
+               plan['basis']))
+    rows = sum(plan['rows'] for plan in estimates)
+    if write_seconds is None:
+        print('  database writes: ~%s rows; no writes have been recorded' %
+              '{:,}'.format(rows))
+    else:
+        print('  database writes: ~%s rows; %s with %i writers' %
+              ('{:,}'.format(rows), format_seconds(write_seconds),
+               db_writers or 1))
+    print('The run should take about %s with the vendors downloaded %s' %
+          (format_seconds(total_seconds),
+           'concurrently' if concurrent else 'one after the other'))
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+import hashlib
+import json
+from multiprocessing import Process
+import os
+import time
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+def file_fingerprint(paths):
+    """ Hash the contents of the files, with missing files hashed by name.
+
+    :param paths: List of the file paths
+    :return: String of the hex digest
+    """
+
+    digest = hashlib.md5()
+    for path in paths:
+        digest.update(path.encode())
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            digest.update(b'missing')
+    return digest.hexdigest()
+
+
+class TaskGraph(object):
+    """ Runs steps in the order of their dependencies, with the steps whose
+    dependencies are finished running at the same time in separate processes.
+
+    A step can have a fingerprint function that summarizes its inputs. The
+    fingerprint is saved after the step succeeds, and the step is skipped
+    during later runs while its fingerprint has not changed. The fingerprint is
+    computed once the step's dependencies are finished, so it sees any inputs
+    they changed.
+    """
+
+    def __init__(self, name, state_file=None):
+        """
+        :param name: String of the graph's name (i.e. the database name), used
+            as the key of the saved fingerprints
+        :param state_file: Optional string of the JSON file that the step
+            fingerprints are saved to; without it, no steps are skipped
+        """
+
+        self.name = name
+        self.state_file = state_file
+        self.steps = OrderedDict()
+
+    def add(self, name, function, kwargs=None, depends=(), fingerprint=None):
+        """ Add a step to the graph. Its dependencies must be added first.
+
+        :param name: String of the step's name
+        :param function: The step's function; it is run in its own process
+        :param kwargs: Optional dictionary of the function's arguments
+        :param depends: List of the names of the steps that must finish first
+        :param fingerprint: Optional function that returns a string summarizing
+            the step's inputs
+        """
+
+        for dependency in depends:
+            if dependency not in self.steps:
+                raise SystemError('The %s step depends on the %s step, which '
+                                  'has not been added to the %s graph' %
+                                  (name, dependency, self.name))
+        self.steps[name] = {'function': function, 'kwargs': kwargs or {},
+                            'depends': list(depends),
+                            'fingerprint': fingerprint, 'status': 'pending',
+                            'process': None, 'start_time': None,
+                            'seconds': 0.0, 'checked': False}
+
+    def load_fingerprints(self):
+        if not self.state_file:
+            return {}
+        try:
+            with open(self.state_file) as f:
+                return json.load(f).get(self.name, {})
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_fingerprints(self, fingerprints):
+        state = {}
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+        state[self.name] = fingerprints
+
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(temp_file, self.state_file)
+
+    def step_fingerprint(self, name):
+        """ Compute the step's fingerprint. A failed fingerprint is treated as
+        a changed input, so the step runs.
+
+        :param name: String of the step's name
+        :return: String of the fingerprint, or None
+        """
+
+        fingerprint = self.steps[name]['fingerprint']
+        if fingerprint is None:
+            return None
+        try:
+            return fingerprint()
+        except Exception as e:
+            print('Unable to fingerprint the %s step, so it will run: %s' %
+                  (name, e))
+            return None
+
+    def ready_steps(self):
+        """ Find the pending steps, blocking the ones with failed dependencies.
+
+        :return: List of the names of the steps whose dependencies finished
+        """
+
+        ready = []
+        for name, step in self.steps.items():
+            if step['status'] != 'pending':
+                continue
+            statuses = [self.steps[dependency]['status']
+                        for dependency in step['depends']]
+            if any(status in ('failed', 'blocked') for status in statuses):
+                step['status'] = 'blocked'
+                print('Skipping the %s step because a step it depends on '
+                      'failed' % name)
+            elif all(status in ('done', 'skipped') for status in statuses):
+                ready.append(name)
+        return ready
+
+    def run(self, workers=4, poll_interval=0.2):
+        """ Run all of the steps, printing each step's time and a summary.
+
+        :param workers: Integer of the steps that can run at the same time
+        :param poll_interval: Float of the seconds between the status checks
+        :return: Dictionary of each step's status (done, skipped, failed or
+            blocked)
+        """
+
+        graph_start = time.time()
+        fingerprints = self.load_fingerprints()
+
+        while True:
+            running = [name for name, step in self.steps.items()
+                       if step['status'] == 'running']
+            for name in self.ready_steps():
+                step = self.steps[name]
+                if not step['checked']:
+                    step['checked'] = True
+                    value = self.step_fingerprint(name)
+                    if value is not None and fingerprints.get(name) == value:
+                        step['status'] = 'skipped'
+                        print('Skipping the %s step because its inputs have '
+                              'not changed' % name)
+                        continue
+                if len(running) >= workers:
+                    continue
+
+                print('Starting the %s step' % name)
+                step['process'] = Process(target=step['function'], name=name,
+                                          kwargs=step['kwargs'])
+                step['start_time'] = time.time()
+                step['process'].start()
+                step['status'] = 'running'
+                running.append(name)
+
+            if not running:
+                if not self.ready_steps():
+                    break
+                continue
+
+            time.sleep(poll_interval)
+            for name in running:
+                step = self.steps[name]
+                if step['process'].is_alive():
+                    continue
+                step['process'].join()
+                step['seconds'] = time.time() - step['start_time']
+                if step['process'].exitcode == 0:
+                    step['status'] = 'done'
+                    # Saved after the step, so its own changes are included
+                    value = self.step_fingerprint(name)
+                    if value is not None:
+                        fingerprints[name] = value
+                else:
+                    step['status'] = 'failed'
+                    fingerprints.pop(name, None)
+                if self.state_file:
+                    self.save_fingerprints(fingerprints)
+                print('The %s step %s after %0.2f seconds' %
+                      (name, 'finished' if step['status'] == 'done' else
+                       'failed', step['seconds']))
+
+        print('The %s graph took %0.2f seconds to complete:' %
+              (self.name, time.time() - graph_start))
+        for name, step in self.steps.items():
+            print('  %s: %s (%0.2f seconds)' %
+                  (name, step['status'], step['seconds']))
+
+        return OrderedDict((name, step['status'])
+                           for name, step in self.steps.items())
@@ -0,0 +1,115 @@
+from multiprocessing import Value
+import time
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Share of the time budget kept for draining the in-flight downloads and the
+#   buffered writes, within the bounds in seconds
+drain_share = 0.1
+drain_bounds = (60, 600)
+
+
+class TimeBudget(object):
+    """ The wall clock budget of a run. Once the time left drops to the drain
+    reserve, the extractors stop starting new items, just like when a vendor's
+    circuit breaker opens. The items that were already fetched still get
+    parsed and written, so the run stops without half-written prices. The
+    skipped items are counted across the vendor processes. """
+
+    def __init__(self):
+        self.started = time.time()
+        self.seconds = None
+        self.drain_seconds = 0
+        # Shared with the processes created after the budget is started
+        self.skipped = Value('Q', 0)
+
+    def start(self, seconds, drain_seconds=None):
+        """ Start the budget from the current time.
+
+        :param seconds: Float of the run's budget in seconds
+        :param drain_seconds: Optional float of the seconds reserved for the
+            drain; defaults to a tenth of the budget, within 1 to 10 minutes
+        """
+
+        if drain_seconds is None:
+            drain_seconds = min(max(seconds * drain_share, drain_bounds[0]),
+                                drain_bounds[1])
+        self.started = time.time()
+        self.seconds = seconds
+        self.drain_seconds = min(drain_seconds, seconds)
+
+    def remaining(self):
+        """ :return: Float of the seconds left before new items stop being
+            started, or None if there is no budget """
+
+        if self.seconds is None:
+            return None
+        return (self.started + self.seconds - self.drain_seconds -
+                time.time())
+
+    def exhausted(self, wait=0):
+        """
+        :param wait: Float of the seconds the caller would wait before
+            starting more items
+        :return: Boolean of whether new items should no longer be started
+        """
+
+        remaining = self.remaining()
+        return remaining is not None and remaining <= wait
+
+    def skip(self, items):
+        """ Count the items that weren't started because of the budget.
+
+        :param items: Integer of the skipped items
+        """
+
+        with self.skipped.get_lock():
+            self.skipped.value += items
+
+    def stopped_early(self):
+        """ :return: Boolean of whether any item was skipped """
+
+        return self.skipped.value > 0
+
+    def summary(self):
+        """ :return: String of the time the run used and the items it skipped,
+            or None if there is no budget """
+
+        if self.seconds is None:
+            return None
+        used = time.time() - self.started
+        if self.skipped.value:
+            return ('The run used %0.0f of its %0.0f second time budget. %s '
+                    'items weren\'t started before the budget ran out; they '
+                    'are first in line for the next run.' %
+                    (used, self.seconds, '{:,}'.format(self.skipped.value)))
+        return ('The run used %0.0f of its %0.0f second time budget, and '
+                'every planned item was run.' % (used, self.seconds))
+
+
+# The budget of the current run, checked by the extractors before each item;
+#   it has no limit until it is started
+run_budget = TimeBudget()
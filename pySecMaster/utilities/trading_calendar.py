@@ -0,0 +1,294 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+import pandas as pd
+from pandas.tseries.holiday import AbstractHolidayCalendar, EasterMonday, \
+    GoodFriday, Holiday, USLaborDay, USMartinLutherKingJr, USMemorialDay, \
+    USPresidentsDay, USThanksgivingDay, nearest_workday, \
+    next_monday, next_monday_or_tuesday, sunday_to_monday, weekend_to_monday
+from pandas.tseries.offsets import DateOffset
+from dateutil.relativedelta import MO
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Seconds after an exchange's close before its prices are downloaded, giving
+#   the vendors time to publish the final bars
+session_settle_time = 60 * 30
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    """ The full day closures of the New York Stock Exchange and NASDAQ. """
+
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01',
+                observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4,
+                observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday)]
+
+
+class LSEHolidayCalendar(AbstractHolidayCalendar):
+    """ The full day closures of the London Stock Exchange. """
+
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=weekend_to_monday),
+        GoodFriday,
+        EasterMonday,
+        Holiday('Early May Bank Holiday', month=5, day=1,
+                offset=DateOffset(weekday=MO(1))),
+        Holiday('Spring Bank Holiday', month=5, day=31,
+                offset=DateOffset(weekday=MO(-1))),
+        Holiday('Summer Bank Holiday', month=8, day=31,
+                offset=DateOffset(weekday=MO(-1))),
+        Holiday('Christmas', month=12, day=25, observance=next_monday),
+        Holiday('Boxing Day', month=12, day=26,
+                observance=next_monday_or_tuesday)]
+
+
+class TSXHolidayCalendar(AbstractHolidayCalendar):
+    """ The full day closures of the Toronto and Montreal exchanges. """
+
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=weekend_to_monday),
+        Holiday('Family Day', month=2, day=1, start_date='2008-01-01',
+                offset=DateOffset(weekday=MO(3))),
+        GoodFriday,
+        Holiday('Victoria Day', month=5, day=24,
+                offset=DateOffset(weekday=MO(-1))),
+        Holiday('Canada Day', month=7, day=1, observance=weekend_to_monday),
+        Holiday('Civic Holiday', month=8, day=1,
+                offset=DateOffset(weekday=MO(1))),
+        Holiday('Labour Day', month=9, day=1,
+                offset=DateOffset(weekday=MO(1))),
+        Holiday('Thanksgiving', month=10, day=1,
+                offset=DateOffset(weekday=MO(2))),
+        Holiday('Christmas', month=12, day=25, observance=next_monday),
+        Holiday('Boxing Day', month=12, day=26,
+                observance=next_monday_or_tuesday)]
+
+
+# The holiday calendars of the exchanges table countries; the exchanges of
+#   other countries only skip the weekends
+holiday_calendars = {'United States': NYSEHolidayCalendar,
+                     'United Kingdom': LSEHolidayCalendar,
+                     'Canada': TSXHolidayCalendar}
+
+# The time zones of the exchanges table cities, which follow the daylight
+#   saving time changes; other cities use their fixed utc_offset
+city_time_zones = {
+    'Amsterdam': 'Europe/Amsterdam', 'Athens': 'Europe/Athens',
+    'Barcelona': 'Europe/Madrid', 'Berlin': 'Europe/Berlin',
+    'Brussels': 'Europe/Brussels', 'Copenhagen': 'Europe/Copenhagen',
+    'Frankfurt': 'Europe/Berlin', 'Helsinki': 'Europe/Helsinki',
+    'Hong Kong': 'Asia/Hong_Kong', 'Istanbul': 'Europe/Istanbul',
+    'Jakarta': 'Asia/Jakarta', 'Johannesburg': 'Africa/Johannesburg',
+    # BATS is in Kansas, but it trades during the New York session
+    'Lenexa, Kansas': 'America/New_York', 'Lisbon': 'Europe/Lisbon',
+    'London': 'Europe/London', 'Madrid': 'Europe/Madrid',
+    'Milan': 'Europe/Rome', 'Montreal': 'America/Toronto',
+    'Moscow': 'Europe/Moscow', 'Mumbai': 'Asia/Kolkata',
+    'New York City': 'America/New_York', 'Oslo': 'Europe/Oslo',
+    'Paris': 'Europe/Paris', 'Rejkjavik': 'Atlantic/Reykjavik',
+    'Riga': 'Europe/Riga', 'Santiago': 'America/Santiago',
+    'Sao Paulo': 'America/Sao_Paulo', 'Seoul': 'Asia/Seoul',
+    'Shanghai': 'Asia/Shanghai', 'Shenzhen': 'Asia/Shanghai',
+    'Singapore': 'Asia/Singapore', 'Stockholm': 'Europe/Stockholm',
+    'Stuttgart': 'Europe/Berlin', 'Sydney': 'Australia/Sydney',
+    'Taipei': 'Asia/Taipei', 'Tallinn': 'Europe/Tallinn',
+    'Tel Aviv': 'Asia/Jerusalem', 'Tokyo': 'Asia/Tokyo',
+    'Toronto': 'America/Toronto', 'Vienna': 'Europe/Vienna',
+    'Vilnius': 'Europe/Vilnius', 'Warsaw': 'Europe/Warsaw',
+    'Wellington': 'Pacific/Auckland', 'Zurich': 'Europe/Zurich'}
+
+
+class ExchangeCalendar(object):
+    """ The trading sessions of an exchange, with a session on every weekday
+    that isn't a holiday of the exchange's country. The session closes are
+    converted to UTC within the exchange's time zone. """
+
+    def __init__(self, utc_offset, close, country=None, city=None):
+        """
+        :param utc_offset: Float of the exchange's standard hours from UTC,
+            used when the city's time zone isn't known
+        :param close: Time of the session close in the exchange's local time
+        :param country: Optional string of the exchange's country, which
+            provides the holiday calendar
+        :param city: Optional string of the exchange's city, which provides
+            the time zone
+        """
+
+        self.close = close
+        if city in city_time_zones:
+            self.time_zone = city_time_zones[city]
+        else:
+            self.time_zone = timezone(timedelta(hours=float(utc_offset)))
+        calendar = holiday_calendars.get(country)
+        self.holiday_calendar = calendar() if calendar else None
+        self.holidays = {}
+
+    def is_session(self, day):
+        """
+        :param day: Date in the exchange's local time
+        :return: Boolean of whether the exchange has a session on the date
+        """
+
+        if day.weekday() >= 5:
+            return False
+        if self.holiday_calendar is None:
+            return True
+        if day.year not in self.holidays:
+            self.holidays[day.year] = set(
+                holiday.date() for holiday in self.holiday_calendar.holidays(
+                    start=date(day.year, 1, 1), end=date(day.year, 12, 31)))
+        return day not in self.holidays[day.year]
+
+    def close_at(self, day):
+        """
+        :param day: Date in the exchange's local time
+        :return: UTC datetime of the session close on the date
+        """
+
+        close = pd.Timestamp.combine(day, self.close)
+        return close.tz_localize(self.time_zone).tz_convert(
+            'UTC').to_pydatetime()
+
+    def local_date(self, now):
+        return pd.Timestamp(now).tz_convert(self.time_zone).date()
+
+    def last_session(self, now=None):
+        """
+        :param now: Optional datetime used as the current time; defaults to now
+        :return: Date of the latest session that has closed
+        """
+
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        day = self.local_date(now)
+        if not self.is_session(day) or now < self.close_at(day):
+            day -= timedelta(days=1)
+        while not self.is_session(day):
+            day -= timedelta(days=1)
+        return day
+
+    def next_close(self, now=None):
+        """
+        :param now: Optional datetime used as the current time; defaults to now
+        :return: UTC datetime of the next session close after now
+        """
+
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        day = self.local_date(now)
+        while not self.is_session(day) or self.close_at(day) <= now:
+            day += timedelta(days=1)
+        return self.close_at(day)
+
+    def next_refresh(self, timestamp, settle=session_settle_time):
+        """ The next time the exchange's prices should be downloaded, used as
+        the next_time of a daemon job.
+
+        :param timestamp: Float of the current epoch time
+        :param settle: Integer of the seconds to wait after the close
+        :return: Float of the epoch time that is settle seconds after the
+            next session close
+        """
+
+        now = datetime.fromtimestamp(timestamp - settle, timezone.utc)
+        return self.next_close(now).timestamp() + settle
+
+
+def exchange_calendar(session):
+    """
+    :param session: Row of the query_exchange_sessions DataFrame; the country
+        and city columns are optional
+    :return: ExchangeCalendar of the session's exchange
+    """
+
+    return ExchangeCalendar(utc_offset=session['utc_offset'],
+                            close=session['close'],
+                            country=session.get('country'),
+                            city=session.get('city'))
+
+
+def session_groups(sessions_df):
+    """ Group the exchanges that close at the same time with the same
+    holidays, allowing each group to be downloaded after its close.
+
+    :param sessions_df: DataFrame from query_exchange_sessions
+    :return: OrderedDict of each group's name (the time zone and the close,
+        i.e. america_new_york_1600) with a tuple of the group's
+        ExchangeCalendar and its list of tsid exchange symbols
+    """
+
+    def group_name(*parts):
+        name = '_'.join(str(part) for part in parts)
+        return ''.join(char if char.isalnum() else '_'
+                       for char in name.lower())
+
+    groups = OrderedDict()
+    keys = {}
+    for tsid_symbol, session in sessions_df.iterrows():
+        calendar = exchange_calendar(session)
+        key = (str(calendar.time_zone), calendar.close,
+               session.get('country'))
+        if key not in keys:
+            name = group_name(calendar.time_zone,
+                              calendar.close.strftime('%H%M'))
+            if name in groups:
+                # Same time zone and close, but with different holidays
+                name = group_name(name, session.get('country'))
+            suffix = 1
+            base_name = name
+            while name in groups:
+                suffix += 1
+                name = group_name(base_name, suffix)
+            keys[key] = name
+            groups[name] = (calendar, [])
+        groups[keys[key]][1].append(tsid_symbol)
+    return groups
+
+
+def drop_partial_bars(prices_df, session_date):
+    """ Remove the daily bars dated after the exchange's last closed session,
+    which are still changing and would need to be replaced later.
+
+    :param prices_df: DataFrame of the daily prices with an ISO date column
+    :param session_date: Date of the exchange's latest closed session
+    :return: DataFrame without the partial bars
+    """
+
+    if len(prices_df.index) == 0:
+        return prices_df
+    return prices_df[
+        prices_df['date'].str[:10] <= session_date.isoformat()].copy()
@@ -0,0 +1,649 @@
+import argparse
+from datetime import datetime, timedelta
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import urlopen
+import zlib
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+''' vendor_server.py
+
+A local HTTP stand-in for the data vendors used by the extractors. Responses
+are served in each vendor's format, either from recorded fixture files or
+from deterministic synthetic prices. Latency, server errors, 429 throttling
+and a vendor side rate limit can be injected, allowing the ingest path and
+the rate limiters to be benchmarked without a network connection.
+
+The vendor url roots in pySecMaster.py are pointed at this server with the
+--vendor-server argument, which uses stand_in_url to rewrite each url.
+
+Vendor paths served (prefixed by the vendor name):
+    /quandl/api/v1/datasets/<db>/<code>.csv         Quandl dataset prices
+    /quandl/api/v2/datasets.csv                     Quandl database codes
+    /quandl/api/v3/datatables/<db>/<table>.csv      Quandl datatable prices
+    /google/finance/getprices                       Google Finance prices
+    /yahoo/table.csv                                Yahoo Finance prices
+    /csidata/factsheets.php                         CSI Data factsheet
+    /nasdaq/screening/companies-by-industry.aspx    NASDAQ sectors
+    /_stats                                         JSON request statistics
+'''
+
+# The vendor url roots used within pySecMaster.py, keyed by the stand-in path
+#   prefix for that vendor
+vendor_roots = {'quandl': 'https://www.quandl.com',
+                'google': 'http://www.google.com',
+                'yahoo': 'http://real-chart.finance.yahoo.com',
+                'csidata': 'http://www.csidata.com',
+                'nasdaq': 'http://www.nasdaq.com'}
+vendor_hosts = {urlsplit(root).netloc: vendor
+                for vendor, root in vendor_roots.items()}
+
+stand_in_exchanges = [('NYSE', 'NYSE'), ('AMEX', 'AMEX'),
+                      ('NASDAQ', 'Nasdaq Global Select')]
+
+
+def stand_in_url(url, server):
+    """ Rewrite a vendor url so it points at the stand-in server, keeping the
+    path and query of the original url.
+
+    :param url: String of the vendor url (i.e. https://www.quandl.com/api/...)
+    :param server: String of the stand-in server root (http://127.0.0.1:8000)
+    :return: String of the stand-in url
+    """
+
+    split_url = urlsplit(url)
+    try:
+        vendor = vendor_hosts[split_url.netloc]
+    except KeyError:
+        raise NotImplementedError('The %s host does not have a stand-in '
+                                  'within vendor_server.py' % split_url.netloc)
+
+    stand_in = server.rstrip('/') + '/' + vendor + split_url.path
+    if split_url.query:
+        stand_in += '?' + split_url.query
+    elif url.endswith('?'):
+        stand_in += '?'
+    return stand_in
+
+
+def synthetic_tickers(count):
+    """ Create the ticker symbols of the synthetic universe (A, B, ..., Z, AA,
+    AB, ...).
+
+    :param count: Integer of the number of tickers to create
+    :return: List of ticker strings
+    """
+
+    tickers = []
+    for num in range(count):
+        ticker = ''
+        num += 1
+        while num > 0:
+            num, remainder = divmod(num - 1, 26)
+            ticker = chr(65 + remainder) + ticker
+        tickers.append(ticker)
+    return tickers
+
+
+def synthetic_daily_bars(ticker, beg_date, end_date):
+    """ Create deterministic daily prices for every weekday between the two
+    dates. Each bar is seeded by the ticker and date, so the same ticker
+    always returns the same price for a date, no matter which date range was
+    requested.
+
+    :param ticker: String of the ticker
+    :param beg_date: Date object of the first date
+    :param end_date: Date object of the last date
+    :return: List of tuples with the date, open, high, low, close and volume,
+        sorted oldest to newest
+    """
+
+    bars = []
+    day = beg_date
+    while day <= end_date:
+        if day.weekday() < 5:
+            # Seed each bar separately so any date range is consistent
+            rand = random.Random(zlib.crc32(('%s%s' % (ticker, day)).encode()))
+            base = 20 + (zlib.crc32(ticker.encode()) % 180)
+            # Slow drift with a ticker specific phase, plus daily noise
+            drift = ((day.toordinal() + base) % 500) / 500.0
+            close = round(base * (0.75 + 0.5 * drift) *
+                          (1 + rand.uniform(-0.02, 0.02)), 2)
+            open_ = round(close * (1 + rand.uniform(-0.01, 0.01)), 2)
+            high = round(max(open_, close) * (1 + rand.uniform(0, 0.01)), 2)
+            low = round(min(open_, close) * (1 - rand.uniform(0, 0.01)), 2)
+            volume = rand.randint(100000, 5000000)
+            bars.append((day, open_, high, low, close, volume))
+        day += timedelta(days=1)
+    return bars
+
+
+class VendorServer(object):
+    """ The stand-in vendor HTTP server, which runs within a background thread
+    until stop is called. """
+
+    def __init__(self, host='127.0.0.1', port=0, fixtures=None, latency=0.0,
+                 error_rate=0.0, throttle_rate=0.0, rate_limit=None,
+                 codes=500, history_start='2000-01-03', compress=True,
+                 record=False, seed=0):
+        """
+        :param host: String of the address to listen on
+        :param port: Integer of the port to listen on; 0 picks a free port
+        :param fixtures: Optional string of the directory with recorded
+            responses. Fixtures are used before synthetic responses, and are
+            named <vendor>/<key> (i.e. yahoo/AAPL.csv; see fixture_name).
+        :param latency: Float of the seconds to wait before each response
+        :param error_rate: Float of the fraction of requests that receive a
+            503 Service Unavailable error
+        :param throttle_rate: Float of the fraction of requests that receive a
+            429 Too Many Requests error
+        :param rate_limit: Optional tuple of the number of calls allowed per
+            period (seconds) for each vendor, returning a 429 error to the
+            calls over the limit (i.e. (2000, 600) for Quandl)
+        :param codes: Integer of the number of tickers in the synthetic universe
+        :param history_start: String of the first date (YYYY-MM-DD) of the
+            synthetic price history
+        :param compress: Boolean of whether gzip responses may be sent
+        :param record: Boolean of whether requests without a fixture should be
+            downloaded from the live vendor and saved as a new fixture
+        :param seed: Integer used to seed the injected errors
+        """
+
+        self.fixtures = fixtures
+        self.record = record
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.compress = compress
+        self.history_start = datetime.strptime(history_start, '%Y-%m-%d').date()
+
+        self.tickers = synthetic_tickers(codes)
+        self.ticker_set = set(self.tickers)
+
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.call_times = {}
+        self.stats = {'requests': 0, 'bytes': 0, 'started': time.time(),
+                      'vendors': {}}
+
+        self.server = ThreadingHTTPServer((host, port), VendorRequestHandler)
+        self.server.daemon_threads = True
+        self.server.vendor_server = self
+        self.thread = None
+
+    @property
+    def url(self):
+        """ String of the server root url (i.e. http://127.0.0.1:8000) """
+
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%i' % (host, port)
+
+    def start(self):
+        """ Start serving requests within a background thread. """
+
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """ Stop serving requests and close the socket. """
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def record_request(self, vendor, status, size):
+        """ Add the request to the server statistics.
+
+        :param vendor: String of the vendor the request was for
+        :param status: Integer of the HTTP status code returned
+        :param size: Integer of the bytes sent in the response body
+        """
+
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += size
+            vendor_stats = self.stats['vendors'].setdefault(vendor, {})
+            vendor_stats[str(status)] = vendor_stats.get(str(status), 0) + 1
+
+    def stats_summary(self):
+        """ Create a copy of the request statistics, including the rate of
+        requests per second since the server started.
+
+        :return: Dictionary of the request statistics
+        """
+
+        with self.lock:
+            summary = json.loads(json.dumps(self.stats))
+        elapsed = max(time.time() - summary['started'], 1e-9)
+        summary['elapsed'] = round(elapsed, 3)
+        summary['requests_per_sec'] = round(summary['requests'] / elapsed, 3)
+        return summary
+
+    def injected_status(self, vendor):
+        """ Determine if an error should be returned instead of the response.
+
+        :param vendor: String of the vendor the request was for
+        :return: Integer of the HTTP error status code, or None
+        """
+
+        with self.lock:
+            if self.rate_limit:
+                calls, period = self.rate_limit
+                now = time.time()
+                call_times = [call for call in self.call_times.get(vendor, [])
+                              if call > now - period]
+                if len(call_times) >= calls:
+                    self.call_times[vendor] = call_times
+                    return 429
+                call_times.append(now)
+                self.call_times[vendor] = call_times
+
+            draw = self.random.random()
+            if draw < self.error_rate:
+                return 503
+            if draw < self.error_rate + self.throttle_rate:
+                return 429
+        return None
+
+    def fixture_name(self, vendor, path, query):
+        """ Determine the fixture file name for the request.
+
+        :param vendor: String of the vendor the request was for
+        :param path: String of the url path after the vendor prefix
+        :param query: Dictionary of the url query values
+        :return: String of the fixture file path relative to the fixtures
+            directory, or None if the request can't use a fixture
+        """
+
+        if vendor == 'quandl' and path.startswith('/api/v1/datasets/'):
+            code = path[len('/api/v1/datasets/'):-len('.csv')]
+            return os.path.join('quandl', code.replace('/', '_') + '.csv')
+        elif vendor == 'quandl' and path.startswith('/api/v2/datasets'):
+            return os.path.join('quandl', 'codes_%s_%s.csv' %
+                                (query.get('source_code', ''),
+                                 query.get('page', '1')))
+        elif vendor == 'google':
+            return os.path.join('google', '%s_%s.txt' %
+                                (query.get('q', ''), query.get('i', '')))
+        elif vendor == 'yahoo':
+            ticker = query.get('s', '')
+            return os.path.join('yahoo', ticker.split('.')[0] + '.csv')
+        elif vendor == 'csidata':
+            return os.path.join('csidata', query.get('type', '') + '.csv')
+        elif vendor == 'nasdaq':
+            return os.path.join('nasdaq', query.get('exchange', '') + '.csv')
+        return None
+
+    def record_fixture(self, vendor, vendor_path, raw_query, fixture_path):
+        """ Download the response from the live vendor and save it as a
+        fixture.
+
+        :param vendor: String of the vendor the request was for
+        :param vendor_path: String of the url path after the vendor prefix
+        :param raw_query: String of the url query
+        :param fixture_path: String of the file to save the response to
+        :return: Bytes of the response
+        """
+
+        live_url = vendor_roots[vendor] + vendor_path + '?' + raw_query
+        body = urlopen(live_url).read()
+
+        os.makedirs(os.path.dirname(fixture_path), exist_ok=True)
+        with open(fixture_path, 'wb') as f:
+            f.write(body)
+        print('Recorded the %s fixture' % fixture_path)
+        return body
+
+    def respond(self, path, query, raw_query=''):
+        """ Create the response for the request.
+
+        :param path: String of the url path, including the vendor prefix
+        :param query: Dictionary of the url query values
+        :param raw_query: String of the url query; used when recording
+        :return: Tuple of the vendor, HTTP status code and the body bytes
+        """
+
+        vendor = path.split('/')[1] if path.count('/') > 1 else ''
+        vendor_path = path[len(vendor) + 1:]
+
+        if vendor not in vendor_roots:
+            return vendor, 404, b''
+
+        if self.fixtures:
+            name = self.fixture_name(vendor, vendor_path, query)
+            if name:
+                fixture_path = os.path.join(self.fixtures, name)
+                if os.path.isfile(fixture_path):
+                    with open(fixture_path, 'rb') as f:
+                        return vendor, 200, f.read()
+                if self.record:
+                    return vendor, 200, self.record_fixture(
+                        vendor, vendor_path, raw_query, fixture_path)
+
+        if vendor == 'quandl':
+            if vendor_path.startswith('/api/v1/datasets/'):
+                code = vendor_path[len('/api/v1/datasets/'):-len('.csv')]
+                status, body = self.quandl_dataset(code, query)
+            elif vendor_path.startswith('/api/v2/datasets'):
+                status, body = self.quandl_codes(query)
+            elif vendor_path.startswith('/api/v3/datatables/'):
+                status, body = self.quandl_datatable(query)
+            else:
+                status, body = 404, ''
+        elif vendor == 'google':
+            status, body = self.google_prices(query)
+        elif vendor == 'yahoo':
+            status, body = self.yahoo_prices(query)
+        elif vendor == 'csidata':
+            status, body = self.csidata_factsheet(query)
+        else:
+            status, body = self.nasdaq_companies(query)
+
+        return vendor, status, body.encode('utf-8')
+
+    def history_bars(self, ticker, beg_date=None):
+        """ Get the synthetic daily prices from the beg_date through today.
+
+        :param ticker: String of the ticker
+        :param beg_date: Optional string of the first date (YYYY-MM-DD)
+        :return: List of tuples of the daily prices, oldest to newest
+        """
+
+        beg_date_obj = self.history_start
+        if beg_date:
+            beg_date_obj = max(beg_date_obj, datetime.strptime(
+                beg_date[:10], '%Y-%m-%d').date())
+        return synthetic_daily_bars(ticker, beg_date_obj,
+                                    datetime.utcnow().date())
+
+    def quandl_dataset(self, code, query):
+        """ Quandl v1 dataset CSV, newest to oldest with a header row. """
+
+        database, ticker = (code.split('/') + [''])[:2]
+        if ticker not in self.ticker_set:
+            return 400, ''
+
+        bars = self.history_bars(ticker, query.get('trim_start'))
+        if database in ['WIKI', 'EOD']:
+            lines = ['Date,Open,High,Low,Close,Volume,Ex-Dividend,Split Ratio,'
+                     'Adj. Open,Adj. High,Adj. Low,Adj. Close,Adj. Volume']
+            for day, open_, high, low, close, volume in reversed(bars):
+                lines.append('%s,%s,%s,%s,%s,%s,0.0,1.0,%s,%s,%s,%s,%s' %
+                             (day, open_, high, low, close, volume, open_,
+                              high, low, close, volume))
+        elif database == 'GOOG':
+            lines = ['Date,Open,High,Low,Close,Volume']
+            for day, open_, high, low, close, volume in reversed(bars):
+                lines.append('%s,%s,%s,%s,%s,%s' %
+                             (day, open_, high, low, close, volume))
+        elif database == 'YAHOO':
+            lines = ['Date,Open,High,Low,Close,Volume,Adjusted Close']
+            for day, open_, high, low, close, volume in reversed(bars):
+                lines.append('%s,%s,%s,%s,%s,%s,%s' %
+                             (day, open_, high, low, close, volume, close))
+        else:
+            return 404, ''
+        return 200, '\n'.join(lines) + '\n'
+
+    def quandl_codes(self, query):
+        """ Quandl v2 database codes CSV, 300 codes per page without a header
+        row. Pages after the last code return an empty CSV. """
+
+        database = query.get('source_code', 'WIKI')
+        per_page = int(query.get('per_page', 300))
+        page = int(query.get('page', 1))
+        page_tickers = self.tickers[(page - 1) * per_page:page * per_page]
+
+        updated = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        end_date = datetime.utcnow().strftime('%Y-%m-%d')
+        lines = ['%s/%s,"%s Stand-In Prices",%s,%s,daily,%s' %
+                 (database, ticker, ticker, self.history_start, end_date,
+                  updated) for ticker in page_tickers]
+        return 200, '\n'.join(lines) + '\n'
+
+    def quandl_datatable(self, query):
+        """ Quandl v3 datatable CSV for multiple tickers, limited to 10,000
+        rows the same as the Quandl API. """
+
+        tickers = [ticker for ticker in query.get('ticker', '').split(',')
+                   if ticker in self.ticker_set]
+        all_columns = ['ticker', 'date', 'open', 'high', 'low', 'close',
+                       'volume', 'ex-dividend', 'split_ratio', 'adj_open',
+                       'adj_high', 'adj_low', 'adj_close', 'adj_volume']
+        columns = query.get('qopts.columns', ','.join(all_columns)).split(',')
+
+        lines = [','.join(columns)]
+        for ticker in tickers:
+            for day, open_, high, low, close, volume in \
+                    self.history_bars(ticker, query.get('date.gte')):
+                row = dict(zip(all_columns,
+                               [ticker, day, open_, high, low, close, volume,
+                                0.0, 1.0, open_, high, low, close, volume]))
+                lines.append(','.join([str(row[col]) for col in columns]))
+                if len(lines) > 10000:
+                    return 200, '\n'.join(lines) + '\n'
+        return 200, '\n'.join(lines) + '\n'
+
+    def google_prices(self, query):
+        """ Google Finance getprices text, with the bar dates as offsets from
+        the prior full unix timestamp. Unknown tickers return only headers. """
+
+        ticker = query.get('q', '')
+        interval = int(query.get('i', 86400))
+        period_days = int(query.get('p', '20d').rstrip('d'))
+
+        lines = ['EXCHANGE%%3D%s' % query.get('x', 'NASDAQ'),
+                 'MARKET_OPEN_MINUTE=570', 'MARKET_CLOSE_MINUTE=960',
+                 'INTERVAL=%i' % interval,
+                 'COLUMNS=DATE,CLOSE,HIGH,LOW,OPEN,VOLUME', 'DATA=',
+                 'TIMEZONE_OFFSET=-300']
+        if ticker not in self.ticker_set:
+            return 200, '\n'.join(lines) + '\n'
+
+        today = datetime.utcnow().date()
+        bars = synthetic_daily_bars(ticker, today - timedelta(days=period_days),
+                                    today)
+        for day, open_, high, low, close, volume in bars:
+            # The market opens at 14:30 UTC
+            day_open = int((datetime(day.year, day.month, day.day) -
+                            datetime(1970, 1, 1)).total_seconds()) + 52200
+            if interval >= 86400:
+                lines.append('a%i,%s,%s,%s,%s,%i' %
+                             (day_open + 23400, close, high, low, open_,
+                              volume))
+                continue
+            steps = 23400 // interval
+            for step in range(1, steps + 1):
+                if step == 1:
+                    date = 'a%i' % (day_open + interval)
+                else:
+                    date = str(step)
+                lines.append('%s,%s,%s,%s,%s,%i' %
+                             (date, close, high, low, open_, volume // steps))
+        return 200, '\n'.join(lines) + '\n'
+
+    def yahoo_prices(self, query):
+        """ Yahoo Finance table.csv, newest to oldest with a header row. """
+
+        ticker = query.get('s', '').split('.')[0]
+        if ticker not in self.ticker_set:
+            return 404, ''
+
+        lines = ['Date,Open,High,Low,Close,Volume,Adj Close']
+        for day, open_, high, low, close, volume in \
+                reversed(self.history_bars(ticker)):
+            lines.append('%s,%s,%s,%s,%s,%s,%s' %
+                         (day, open_, high, low, close, volume, close))
+        return 200, '\n'.join(lines) + '\n'
+
+    def csidata_factsheet(self, query):
+        """ CSI Data stock factsheet CSV covering the synthetic universe. """
+
+        if query.get('type', 'stock') != 'stock':
+            return 200, ('CsiNumber,Symbol,Name,Exchange,IsActive,StartDate,'
+                         'EndDate,ConversionFactor,SwitchCfDate,PreSwitchCf,'
+                         'SubExchange\n')
+
+        end_date = datetime.utcnow().strftime('%Y-%m-%d')
+        lines = ['CsiNumber,Symbol,Name,Exchange,IsActive,StartDate,EndDate,'
+                 'ConversionFactor,SwitchCfDate,PreSwitchCf,SubExchange']
+        for num, ticker in enumerate(self.tickers):
+            exchange, sub_exchange = \
+                stand_in_exchanges[num % len(stand_in_exchanges)]
+            lines.append('%i,%s,%s Stand-In Inc,%s,1,%s,%s,1,,,%s' %
+                         (100000 + num, ticker, ticker, exchange,
+                          self.history_start, end_date, sub_exchange))
+        return 200, '\n'.join(lines) + '\n'
+
+    def nasdaq_companies(self, query):
+        """ NASDAQ companies by industry CSV for a single exchange. """
+
+        exchange = query.get('exchange', 'NASDAQ')
+        lines = ['"Symbol","Name","LastSale","MarketCap","IPOyear","Sector",'
+                 '"Industry","Summary Quote",']
+        for num, ticker in enumerate(self.tickers):
+            if stand_in_exchanges[num % len(stand_in_exchanges)][0] != exchange:
+                continue
+            lines.append('"%s","%s Stand-In Inc","10.00","$1B","n/a",'
+                         '"Technology","Computer Software",'
+                         '"https://www.nasdaq.com/symbol/%s",' %
+                         (ticker, ticker, ticker.lower()))
+        return 200, '\n'.join(lines) + '\n'
+
+
+class VendorRequestHandler(BaseHTTPRequestHandler):
+    """ Handles the requests for the VendorServer. """
+
+    def do_GET(self):
+        vendor_server = self.server.vendor_server
+        split_url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in
+                 parse_qs(split_url.query, keep_blank_values=True).items()}
+
+        if split_url.path == '/_stats':
+            body = json.dumps(vendor_server.stats_summary()).encode('utf-8')
+            self.send_body(200, body, 'application/json')
+            return
+
+        if vendor_server.latency:
+            time.sleep(vendor_server.latency)
+
+        vendor = split_url.path.split('/')[1] if \
+            split_url.path.count('/') > 1 else ''
+        status = vendor_server.injected_status(vendor)
+        if status:
+            vendor_server.record_request(vendor, status, 0)
+            self.send_body(status, b'')
+            return
+
+        vendor, status, body = vendor_server.respond(split_url.path, query,
+                                                     split_url.query)
+
+        encoding = None
+        if (vendor_server.compress and body and
+                'gzip' in self.headers.get('Accept-Encoding', '')):
+            body = gzip.compress(body)
+            encoding = 'gzip'
+
+        vendor_server.record_request(vendor, status, len(body))
+        self.send_body(status, body, encoding=encoding)
+
+    def send_body(self, status, body, content_type='text/csv', encoding=None):
+        """ Send the status, headers and body of the response.
+
+        :param status: Integer of the HTTP status code
+        :param body: Bytes of the response body
+        :param content_type: String of the body's content type
+        :param encoding: Optional string of the body's content encoding
+        """
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Don't print every request; use /_stats for the request totals
+        pass
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Local stand-in server for the pySecMaster data vendors. '
+                    'Run pySecMaster.py with --vendor-server pointing at the '
+                    'printed url to download from this server.')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+        help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8000,
+        help='Port to listen on.')
+    parser.add_argument('--fixtures', type=str,
+        help='Directory of recorded vendor responses that are served before '
+             'the synthetic responses.')
+    parser.add_argument('--latency', type=float, default=0.0,
+        help='Seconds to wait before each response.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+        help='Fraction of requests that receive a 503 error.')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+        help='Fraction of requests that receive a 429 error.')
+    parser.add_argument('--rate-limit', type=int, nargs=2,
+        metavar=('CALLS', 'SECONDS'),
+        help='Calls allowed per period for each vendor before 429 errors '
+             'are returned.')
+    parser.add_argument('--codes', type=int, default=500,
+        help='Number of tickers in the synthetic universe.')
+    parser.add_argument('--no-compress', action='store_true',
+        help='Never send gzip compressed responses.')
+    parser.add_argument('--record', action='store_true',
+        help='Download requests without a fixture from the live vendor, '
+             'saving them within the fixtures directory.')
+    args = parser.parse_args()
+
+    stand_in = VendorServer(
+        host=args.host, port=args.port, fixtures=args.fixtures,
+        latency=args.latency, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        rate_limit=tuple(args.rate_limit) if args.rate_limit else None,
+        codes=args.codes, compress=not args.no_compress,
+        record=args.record and bool(args.fixtures))
+    print('Vendor stand-in server listening on %s' % stand_in.url)
+    try:
+        stand_in.server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(stand_in.stats_summary(), indent=2))
+        stand_in.server.server_close()
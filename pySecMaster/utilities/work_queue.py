@@ -0,0 +1,577 @@
+from datetime import datetime, timezone
+import numpy as np
+import os
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+import socket
+import threading
+
+__author__ = 'Josh Schertz'
+__copyright__ = 'Copyright (C) 2018 Josh Schertz'
+__description__ = 'An automated system to store and maintain financial data.'
+__email__ = 'josh[AT]joshschertz[DOT]com'
+__license__ = 'GNU AGPLv3'
+__maintainer__ = 'Josh Schertz'
+__status__ = 'Development'
+__url__ = 'https://joshschertz.com/'
+__version__ = '1.5.0'
+
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# How much each score contributes to the work item priority
+priority_weights = {'staleness': 0.7, 'liquidity': 0.3}
+
+# Number of redownload periods after which an item is considered fully stale
+max_stale_periods = 10
+
+
+def score_work_items(tsids, latest_prices, volume_df, redownload_time,
+                     now=None):
+    """ Score the work items for a vendor, so that the stalest and most liquid
+    tsids are downloaded first. The staleness is the time since the tsid was
+    last updated, relative to the redownload time, with tsids that were never
+    downloaded being the stalest. The liquidity is the tsid's percentile rank
+    of the recent average dollar volume. Each vendor and price table has its
+    own items, so only the tsids' scores decide the order within the queue.
+
+    :param tsids: List of the tsids to score
+    :param latest_prices: DataFrame from query_last_price, indexed by the tsid
+        and with an updated_date column
+    :param volume_df: DataFrame from query_recent_volume, indexed by the tsid
+        and with a dollar_volume column
+    :param redownload_time: Integer of the seconds before the data can be
+        downloaded again
+    :param now: Optional datetime used for the staleness; defaults to now
+    :return: DataFrame with the tsid, priority, staleness and liquidity
+        columns, sorted by the priority in descending order
+    """
+
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    items = pd.DataFrame({'tsid': pd.Series(list(tsids), dtype=object)})
+
+    updated_date = pd.to_datetime(
+        items['tsid'].map(latest_prices['updated_date']), utc=True)
+    age = (pd.Timestamp(now) - updated_date).dt.total_seconds()
+    stale_periods = (age / max(redownload_time, 1)).clip(
+        lower=0, upper=max_stale_periods)
+    # Items that were never downloaded are the stalest
+    items['staleness'] = (stale_periods / max_stale_periods).fillna(1.0)
+
+    dollar_volume = items['tsid'].map(volume_df['dollar_volume'])
+    items['liquidity'] = dollar_volume.rank(pct=True).fillna(0.0)
+
+    score = (priority_weights['staleness'] * items['staleness'] +
+             priority_weights['liquidity'] * items['liquidity'])
+    items['priority'] = np.round(score, 6)
+
+    items.sort_values('priority', ascending=False, kind='mergesort',
+                      inplace=True)
+    items.reset_index(drop=True, inplace=True)
+    return items[['tsid', 'priority', 'staleness', 'liquidity']]
+
+
+def query_recent_volume(database, user, password, host, port, days=30):
+    """ Query the average daily dollar volume for each tsid over the recent
+    period, using the prices from every vendor.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param days: Integer of the prior days whose prices are used
+    :return: DataFrame indexed by the tsid with the dollar_volume column
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    df = None
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""SELECT source_id, AVG(close * volume)
+                        FROM daily_prices
+                        WHERE source='tsid'
+                        AND date > NOW() - %s * INTERVAL '1 day'
+                        AND close > 0 AND volume > 0
+                        GROUP BY source_id""",
+                        (days,))
+            rows = cur.fetchall()
+            df = pd.DataFrame(rows, columns=['tsid', 'dollar_volume'])
+            df['dollar_volume'] = df['dollar_volume'].astype(float)
+            df.set_index(['tsid'], inplace=True)
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to query the recent volume from the '
+                          'daily_prices table within query_recent_volume')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'query_recent_volume. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in '
+                          'query_recent_volume')
+
+    conn.close()
+    return df
+
+
+def enqueue_work(database, user, password, host, port, vendor_id, table,
+                 items):
+    """ Replace the vendor's work items for the newly scored tsids. The
+    unfinished items of these tsids from a prior run are replaced, resetting
+    their attempts, while the other tsids' items are kept, since each session
+    group enqueues its own tsids for the same vendor and price table. Items
+    that a worker currently holds the lease for are re-scored but never
+    replaced.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param vendor_id: Integer of the data vendor id
+    :param table: String of the price table the items are downloaded into
+    :param items: DataFrame from score_work_items
+    """
+
+    cur_date = datetime.now(timezone.utc).isoformat()
+    rows = [(vendor_id, 'tsid', item.tsid, table, float(item.priority),
+             float(item.staleness), float(item.liquidity), cur_date,
+             cur_date)
+            for item in items.itertuples()]
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""DELETE FROM work_queue
+                        WHERE data_vendor_id=%s AND price_table=%s
+                        AND source='tsid' AND source_id=ANY(%s)
+                        AND (lease_expires IS NULL OR lease_expires < NOW())""",
+                        (vendor_id, table, list(items['tsid'])))
+            # Insert the items in pages of multi-row statements, instead of
+            #   one statement per item
+            execute_values(cur, """INSERT INTO work_queue
+                           (data_vendor_id, source, source_id, price_table,
+                           priority, staleness, liquidity, created_date,
+                           updated_date)
+                           VALUES %s
+                           ON CONFLICT (data_vendor_id, source, source_id,
+                               price_table)
+                           DO UPDATE SET priority=EXCLUDED.priority,
+                               staleness=EXCLUDED.staleness,
+                               liquidity=EXCLUDED.liquidity,
+                               updated_date=EXCLUDED.updated_date""",
+                           rows, page_size=1000)
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(e)
+        raise SystemError('Failed to insert the work items into the '
+                          'work_queue table within enqueue_work')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'enqueue_work. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in enqueue_work')
+
+    conn.close()
+
+
+def pull_work(database, user, password, host, port, vendor_id, table,
+              tsids=None, limit=None):
+    """ Pull the vendor's work items for the price table, with the highest
+    priority items first. Items that a worker currently holds the lease for
+    are left to that worker.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param vendor_id: Integer of the data vendor id
+    :param table: String of the price table the items are downloaded into
+    :param tsids: Optional list of the tsids to pull; the rows left in the
+        queue by other session groups or earlier runs are skipped
+    :param limit: Optional integer of the maximum items to pull
+    :return: List of the tsids in priority order
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    pulled = []
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""SELECT source_id
+                        FROM work_queue
+                        WHERE data_vendor_id=%s AND price_table=%s
+                        AND source='tsid'
+                        AND (%s::text[] IS NULL OR source_id=ANY(%s))
+                        AND (lease_expires IS NULL OR lease_expires < NOW())
+                        ORDER BY priority DESC, source_id
+                        LIMIT %s""",
+                        (vendor_id, table, tsids, tsids, limit))
+            pulled = [row[0] for row in cur.fetchall()]
+    except psycopg2.Error as e:
+        print(e)
+        raise SystemError('Failed to query the work items from the '
+                          'work_queue table within pull_work')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'pull_work. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in pull_work')
+
+    conn.close()
+    return pulled
+
+
+def complete_work(database, user, password, host, port, vendor_id, table,
+                  tsids):
+    """ Remove the finished work items from the work queue.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param vendor_id: Integer of the data vendor id
+    :param table: String of the price table the items were downloaded into
+    :param tsids: List of the tsids that were finished
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""DELETE FROM work_queue
+                        WHERE data_vendor_id=%s AND price_table=%s
+                        AND source='tsid' AND source_id=ANY(%s)""",
+                        (vendor_id, table, list(tsids)))
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(e)
+        print('Error: Not able to remove %i tsids from the work_queue table' %
+              len(tsids))
+    except conn.OperationalError:
+        print('Unable to connect to the %s database in complete_work. Make '
+              'sure the database address/name are correct.' % database)
+
+    conn.close()
+
+
+class CompletedWork(object):
+    """ Collects an extractor's finished work items, removing them from the
+    work queue in batches instead of with a connection per item. """
+
+    def __init__(self, database, user, password, host, port, vendor_id,
+                 table, flush_size=100):
+        """
+        :param vendor_id: Integer of the data vendor id
+        :param table: String of the price table
+        :param flush_size: Integer of the items removed at a time
+        """
+
+        self.database_options = {'database': database, 'user': user,
+                                 'password': password, 'host': host,
+                                 'port': port}
+        self.vendor_id = vendor_id
+        self.table = table
+        self.flush_size = flush_size
+
+        self.lock = threading.Lock()
+        self.tsids = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        state['tsids'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def record(self, tsid):
+        """ Add the finished tsid, removing the items from the work queue
+        once there are flush_size of them.
+
+        :param tsid: String of the tsid that was finished
+        """
+
+        with self.lock:
+            self.tsids.append(tsid)
+            if len(self.tsids) < self.flush_size:
+                return
+            tsids, self.tsids = self.tsids, []
+        self.save(tsids)
+
+    def flush(self):
+        with self.lock:
+            tsids, self.tsids = self.tsids, []
+        if tsids:
+            self.save(tsids)
+
+    def save(self, tsids):
+        complete_work(vendor_id=self.vendor_id, table=self.table,
+                      tsids=tsids, **self.database_options)
+
+
+def prioritize_work(database, user, password, host, port, vendor_id, table,
+                    tsids, latest_prices, redownload_time, dry_run=False):
+    """ Score the vendor's tsids, save them to the work queue and pull them
+    back in priority order. Pulling the items from the queue means that the
+    most valuable updates are done first if the run is cut short, while the
+    unfinished items remain in the queue. A dry run only orders the tsids by
+    their scores, leaving the work queue untouched.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param vendor_id: Integer of the data vendor id
+    :param table: String of the price table the items are downloaded into
+    :param tsids: List of the tsids that need to be downloaded
+    :param latest_prices: DataFrame from query_last_price
+    :param redownload_time: Integer of the seconds before the data can be
+        downloaded again
+    :param dry_run: Boolean of whether only the tsid order is needed (i.e. a
+        run plan), which must not change the work queue
+    :return: List of the tsids in priority order
+    """
+
+    volume_df = query_recent_volume(database=database, user=user,
+                                    password=password, host=host, port=port)
+    items = score_work_items(tsids=tsids, latest_prices=latest_prices,
+                             volume_df=volume_df,
+                             redownload_time=redownload_time)
+    if dry_run:
+        return list(items['tsid'])
+    enqueue_work(database=database, user=user, password=password, host=host,
+                 port=port, vendor_id=vendor_id, table=table, items=items)
+    # Only pull this run's items, leaving the rows of other session groups
+    return pull_work(database=database, user=user, password=password,
+                     host=host, port=port, vendor_id=vendor_id, table=table,
+                     tsids=list(items['tsid']))
+
+
+def default_worker_id():
+    """ :return: String identifying this worker process across the nodes """
+
+    return '%s-%i' % (socket.gethostname(), os.getpid())
+
+
+def claim_work(database, user, password, host, port, vendor_id, table,
+               worker_id, limit=50, lease_seconds=300, max_attempts=3):
+    """ Claim a batch of the vendor's highest priority work items for this
+    worker. Items that are leased by another worker are skipped, unless their
+    lease expired because that worker stopped sending heartbeats. The rows
+    are locked with SKIP LOCKED, so workers claiming at the same time never
+    wait on or claim each other's items.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param vendor_id: Integer of the data vendor id
+    :param table: String of the price table the items are downloaded into
+    :param worker_id: String of the worker claiming the items
+    :param limit: Integer of the maximum items to claim
+    :param lease_seconds: Integer of the seconds the lease lasts without a
+        heartbeat
+    :param max_attempts: Integer of the claims allowed per item, so an item
+        that keeps failing is left for the next coordinator run
+    :return: List of the claimed tsids in priority order
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    tsids = []
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""WITH claimable AS (
+                            SELECT data_vendor_id, source, source_id,
+                                price_table
+                            FROM work_queue
+                            WHERE data_vendor_id=%s AND price_table=%s
+                            AND source='tsid'
+                            AND (lease_expires IS NULL
+                                OR lease_expires < NOW())
+                            AND COALESCE(attempts, 0) < %s
+                            ORDER BY priority DESC, source_id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED)
+                        UPDATE work_queue AS wq
+                        SET lease_owner=%s,
+                            lease_expires=NOW() + %s * INTERVAL '1 second',
+                            attempts=COALESCE(wq.attempts, 0) + 1,
+                            updated_date=NOW()
+                        FROM claimable
+                        WHERE wq.data_vendor_id=claimable.data_vendor_id
+                        AND wq.source=claimable.source
+                        AND wq.source_id=claimable.source_id
+                        AND wq.price_table=claimable.price_table
+                        RETURNING wq.source_id, wq.priority""",
+                        (vendor_id, table, max_attempts, limit, worker_id,
+                         lease_seconds))
+            rows = sorted(cur.fetchall(), key=lambda row: (-row[1], row[0]))
+            tsids = [row[0] for row in rows]
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(e)
+        raise SystemError('Failed to claim the work items from the '
+                          'work_queue table within claim_work')
+    except conn.OperationalError:
+        raise SystemError('Unable to connect to the %s database in '
+                          'claim_work. Make sure the database '
+                          'address/name are correct.' % database)
+    except Exception as e:
+        print(e)
+        raise SystemError('Error: Unknown issue occurred in claim_work')
+
+    conn.close()
+    return tsids
+
+
+def renew_leases(database, user, password, host, port, worker_id,
+                 lease_seconds=300):
+    """ Extend the leases of every item the worker holds (the heartbeat).
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param worker_id: String of the worker holding the leases
+    :param lease_seconds: Integer of the seconds the leases are extended by
+    :return: Integer of the leases renewed
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+    renewed = 0
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""UPDATE work_queue
+                        SET lease_expires=NOW() + %s * INTERVAL '1 second'
+                        WHERE lease_owner=%s""",
+                        (lease_seconds, worker_id))
+            renewed = cur.rowcount
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(e)
+        print('Error: Not able to renew the work_queue leases of %s' %
+              worker_id)
+    except conn.OperationalError:
+        print('Unable to connect to the %s database in renew_leases. Make '
+              'sure the database address/name are correct.' % database)
+
+    conn.close()
+    return renewed
+
+
+def release_work(database, user, password, host, port, worker_id):
+    """ Release the worker's unfinished items, so other workers can claim
+    them right away instead of waiting for the leases to expire.
+
+    :param database: String of the database name
+    :param user: String of the username used to login to the database
+    :param password: String of the password used to login to the database
+    :param host: String of the database address (localhost, url, ip, etc.)
+    :param port: Integer of the database port number (5432)
+    :param worker_id: String of the worker holding the leases
+    """
+
+    conn = psycopg2.connect(database=database, user=user, password=password,
+                            host=host, port=port)
+
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("""UPDATE work_queue
+                        SET lease_owner=NULL, lease_expires=NULL
+                        WHERE lease_owner=%s""",
+                        (worker_id,))
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(e)
+        print('Error: Not able to release the work_queue leases of %s' %
+              worker_id)
+    except conn.OperationalError:
+        print('Unable to connect to the %s database in release_work. Make '
+              'sure the database address/name are correct.' % database)
+
+    conn.close()
+
+
+class LeaseHeartbeat(object):
+    """ Renews the worker's leases from a background thread, three times per
+    lease period, while the worker downloads its claimed items. If the worker
+    dies, the heartbeats stop and its leases expire, so another worker can
+    claim the items. """
+
+    def __init__(self, database, user, password, host, port, worker_id,
+                 lease_seconds=300):
+        """
+        :param database: String of the database name
+        :param user: String of the username used to login to the database
+        :param password: String of the password used to login to the database
+        :param host: String of the database address (localhost, url, ip, etc.)
+        :param port: Integer of the database port number (5432)
+        :param worker_id: String of the worker holding the leases
+        :param lease_seconds: Integer of the seconds each lease lasts
+        """
+
+        self.db_args = {'database': database, 'user': user,
+                        'password': password, 'host': host, 'port': port}
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            renew_leases(worker_id=self.worker_id,
+                         lease_seconds=self.lease_seconds, **self.db_args)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()